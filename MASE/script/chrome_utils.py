@@ -1,10 +1,22 @@
 
 import os, sys, tempfile, shutil, subprocess, time
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
+
+# Con il pool di browser (pool_browser.py) in ascolto, new_chrome_or_exit noleggia un Chrome caldo
+# invece di avviarne uno nuovo, e kill_zombie non fa nulla (chiuderebbe i browser del pool).
+# pool_browser e metriche sono moduli che leggono config: importabili solo dopo `import bootstrap`
+# (lo fanno i chiamanti), per questo gli import sono dentro le funzioni.
+
+def _pool_in_uso():
+    try:
+        from pool_browser import pool_in_uso
+    except ImportError:
+        return False
+    return pool_in_uso()
 
 def kill_zombie():
+    if _pool_in_uso():
+        print("Pool browser attivo: salto kill_zombie.")
+        return
     try:
         subprocess.run(["taskkill", "/F", "/IM", "chromedriver.exe"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
     except Exception:
@@ -14,9 +26,59 @@ def kill_zombie():
     except Exception:
         pass
 
+def _registra_avvio(secondi, origine):
+    try:
+        from metriche import REGISTRO
+    except ImportError:
+        return
+    REGISTRO.istogramma("browser_avvio_secondi", "Tempo di avvio di Chrome (webdriver)", ["origine"]).osserva(
+        secondi, origine=origine)
+
+def _chrome_dal_pool():
+    """(driver, SessioneNoleggiata) agganciato a un Chrome del pool, oppure None."""
+    try:
+        from pool_browser import noleggia
+    except ImportError:
+        return None
+    cliente = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+    sessione = noleggia(f"{cliente}:{os.getpid()}")
+    if sessione is None:
+        return None
+
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    opts = Options()
+    opts.add_experimental_option("debuggerAddress", sessione.debugger)
+    try:
+        inizio = time.monotonic()
+        driver = webdriver.Chrome(service=Service(), options=opts)
+        driver.set_page_load_timeout(60)
+        _registra_avvio(time.monotonic() - inizio, "pool")
+    except Exception as e:
+        print(f"Pool browser: aggancio allo slot {sessione.slot} non riuscito ({e}), avvio un Chrome a freddo.")
+        sessione.restituisci(sano=False)
+        return None
+    sessione.conta_pagine(driver)
+    print(f"Browser dal pool: slot {sessione.slot} ({sessione.debugger}).")
+    return driver, sessione
+
 def new_chrome_or_exit(headless: bool = True):
-    user_dir = os.path.join(tempfile.gettempdir(), f"mase_chrome_{os.getpid()}_{int(time.time())}")
-    os.makedirs(user_dir, exist_ok=True)
+    """
+    Ritorna (driver, user_dir). Con il pool in uso user_dir è la SessioneNoleggiata da passare
+    a cleanup_profile, che restituisce il browser invece di chiuderlo.
+    """
+    dal_pool = _chrome_dal_pool()
+    if dal_pool is not None:
+        return dal_pool
+
+    # import ritardato: chi importa chrome_utils senza aprire il browser non paga Selenium
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    # cartella unica per chiamata: più lettori dello stesso processo (screp) avviano Chrome nello stesso secondo
+    user_dir = tempfile.mkdtemp(prefix="mase_chrome_")
 
     opts = Options()
     if headless:
@@ -30,8 +92,10 @@ def new_chrome_or_exit(headless: bool = True):
     opts.add_argument("--disable-extensions")
 
     try:
+        inizio = time.monotonic()
         driver = webdriver.Chrome(service=Service(), options=opts)
         driver.set_page_load_timeout(60)
+        _registra_avvio(time.monotonic() - inizio, "nuovo")
         return driver, user_dir
     except Exception as e:
         print(f"ERRORE: Impossibile avviare Chrome. Dettagli: {e}")
@@ -41,7 +105,15 @@ def new_chrome_or_exit(headless: bool = True):
             pass
         sys.exit(12)
 
-def cleanup_profile(driver, user_dir: str):
+def cleanup_profile(driver, user_dir):
+    if not isinstance(user_dir, str):
+        # browser del pool: fermo solo il mio chromedriver (Chrome resta acceso) e restituisco lo slot
+        try:
+            driver.service.stop()
+        except Exception:
+            pass
+        user_dir.restituisci()
+        return
     try:
         driver.quit()
     except Exception:
@@ -25,22 +25,20 @@ import re
 import os
 import shutil
 from datetime import datetime
-from bs4 import BeautifulSoup
-import random
+# Selenium viene importato solo quando serve il browser (vedi estrai_dati_viaggio / main):
+# se nessuna nave è partita il run non paga l'import.
 from chrome_utils import kill_zombie, new_chrome_or_exit, cleanup_profile
-from selenium import webdriver
-from chrome_utils import kill_zombie, new_chrome_or_exit, cleanup_profile
-from selenium.webdriver.chrome.options import Options
-from chrome_utils import kill_zombie, new_chrome_or_exit, cleanup_profile
-from selenium.webdriver.common.by import By
-from chrome_utils import kill_zombie, new_chrome_or_exit, cleanup_profile
-from selenium.webdriver.support.ui import WebDriverWait
-from chrome_utils import kill_zombie, new_chrome_or_exit, cleanup_profile
-from selenium.webdriver.support import expected_conditions as EC
 import bootstrap
 
 # === PATH da config ===
-from config import MASE_TEMP, MASE_OUTPUT_NAVI, MASE_CHROME_PROFILE
+from config import MASE_TEMP, MASE_OUTPUT_NAVI, MASE_CHROME_PROFILE, HTTP_CACHE_ATTIVA
+from http_cache import HttpCache
+from estrattore_html import estrai_dati_viaggio_html
+from rate_limiter import RateLimiterAIMD
+from metriche import REGISTRO
+from storico_run import salva_riepilogo
+
+FETCH_MMSI = REGISTRO.istogramma("fetch_mmsi_secondi", "Latenza di estrazione per MMSI", ["funzione"])
 
 # --- CONFIGURAZIONE ---
 PATH_FILE_TEMP = str(MASE_TEMP)
@@ -73,41 +71,39 @@ def separa_data_ora_e_formatta(datetime_str):
     except:
         return datetime_str, 'N/D'
 
-def estrai_dati_viaggio(driver, wait, mmsi):
+@FETCH_MMSI.misura(funzione="estrai_dati_viaggio")
+def estrai_dati_viaggio(driver, wait, mmsi, cache=None, limiter=None):
     """Estrae i dati sia del viaggio attuale che di quello precedente."""
     print(f"  -> Tracciando MMSI partito: {mmsi}")
     url = f"{BASE_URL}/vessels/vessel-mmsi-{mmsi}-imo-0"
-    dati_viaggi = {}
     try:
-        driver.get(url)
-        wait.until(EC.presence_of_element_located((By.ID, "vpage-current-trip")))
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        
-        # ESTRAZIONE VIAGGIO ATTUALE
-        sezione_viaggio_attuale = soup.find('div', id='vpage-current-trip')
-        if sezione_viaggio_attuale:
-            blocchi = sezione_viaggio_attuale.find_all('div', class_='myst-arrival-cont')
-            if len(blocchi) >= 2:
-                dati_viaggi['Porto Partenza Scraped'] = blocchi[0].find('h3').get_text(strip=True)
-                partenza_raw = blocchi[0].find_all('span', class_='line')
-                dati_viaggi['Data Partenza Completa'] = f"{partenza_raw[0].text.strip()} {partenza_raw[1].text.strip()}"
-                
-                dati_viaggi['Porto Arrivo'] = blocchi[1].find('h3').get_text(strip=True)
-                arrivo_raw = blocchi[1].find_all('span', class_='line')
-                dati_viaggi['Data Arrivo Completa'] = f"{arrivo_raw[0].text.strip()} {arrivo_raw[1].text.strip()}"
-        
-        # ESTRAZIONE VIAGGIO PRECEDENTE (OLD)
-        sezione_storico = soup.find('div', id='ft-lasttrips')
-        if sezione_storico and sezione_storico.find('tbody'):
-            prima_riga = sezione_storico.find('tbody').find('tr')
-            if prima_riga and prima_riga.find('td'):
-                celle = prima_riga.find_all('td')
-                if len(celle) >= 5:
-                    dati_viaggi['Origin'] = celle[1].get_text(strip=True)
-                    dati_viaggi['Departure'] = celle[2].get_text(strip=True)
-                    dati_viaggi['Destination'] = celle[3].get_text(strip=True)
-                    dati_viaggi['Arrival'] = celle[4].get_text(strip=True)
-                    print(f"     -> Viaggio precedente trovato: da {dati_viaggi['Origin']} a {dati_viaggi['Destination']}")
+        # pagina già scaricata di recente (da A o da un giro precedente): niente browser
+        html = cache.leggi_fresco(url) if cache is not None else None
+        if html and 'vpage-current-trip' in html:
+            print("     -> Pagina servita dalla cache locale.")
+        else:
+            if limiter is not None:
+                limiter.attendi()
+            from selenium.webdriver.common.by import By
+            from selenium.webdriver.support import expected_conditions as EC
+            try:
+                driver.get(url)
+                wait.until(EC.presence_of_element_located((By.ID, "vpage-current-trip")))
+            except Exception:
+                if limiter is not None:
+                    limiter.esito(errore=True)
+                raise
+            if limiter is not None:
+                limiter.esito()
+            html = driver.page_source
+            if cache is not None:
+                try:
+                    cache.salva(url, html)
+                except OSError as e:
+                    print(f"     -> ATTENZIONE: cache non aggiornata per MMSI {mmsi}. {e}")
+        dati_viaggi = estrai_dati_viaggio_html(html)
+        if 'Origin' in dati_viaggi:
+            print(f"     -> Viaggio precedente trovato: da {dati_viaggi['Origin']} a {dati_viaggi['Destination']}")
         
         return dati_viaggi
 
@@ -140,11 +136,13 @@ def main():
 
         if not navi_partite:
             print("Nessuna nave è partita.")
+            salva_riepilogo("elaboratore", righe_in=0, righe_out=0, richieste=0)
         else:
             print(f"Trovate {len(navi_partite)} navi partite. Avvio browser per tracciamento...")
 
             # Avvio Chrome SOLO se serve davvero
             try:
+                from selenium.webdriver.support.ui import WebDriverWait
                 kill_zombie()
                 driver, __prof = new_chrome_or_exit(headless=True)
                 wait = WebDriverWait(driver, 15)
@@ -152,12 +150,21 @@ def main():
                 print(f"ERRORE: Impossibile avviare Chrome per il tracciamento. {e}")
                 return
 
+            cache = None
+            if HTTP_CACHE_ATTIVA:
+                try:
+                    cache = HttpCache()
+                except OSError as e:
+                    print(f"ATTENZIONE: cache HTTP non disponibile, procedo senza. {e}")
+
+            limiter = RateLimiterAIMD("elaboratore", log=safe_print)
+
             dati_completi = []
             retry_entries = [] 
             for mmsi in navi_partite:
                 porto_di_riferimento = mappa_porti_precedenti.get(mmsi, "SCONOSCIUTO")
                 try:
-                    dati_viaggio = estrai_dati_viaggio(driver, wait, mmsi)
+                    dati_viaggio = estrai_dati_viaggio(driver, wait, mmsi, cache=cache, limiter=limiter)
 
                     # Se ho QUALSIASI dato utile, salvo (anche solo "viaggio precedente")
                     if dati_viaggio and (
@@ -178,10 +185,15 @@ def main():
                     print(f"     -> ATTENZIONE: Errore durante il tracciamento di MMSI {mmsi}. {e}")
                     retry_entries.append((mmsi, porto_di_riferimento))
 
-                finally:
-                    time.sleep(1)
-
             cleanup_profile(driver, __prof)
+            limiter.salva()
+            safe_print(limiter.riepilogo())
+            if cache is not None:
+                print(cache.riepilogo())
+            REGISTRO.scrivi("elaboratore")
+            # conteggi per lo storico dei run (gestore2 li somma nel riepilogo di B)
+            salva_riepilogo("elaboratore", righe_in=len(navi_partite), righe_out=len(dati_completi),
+                            richieste=limiter.contatori["richieste"])
 
             # --- NEW: RE-QUEUE con incremento RETRY_COUNT in mmsi_attuali.csv ---
             try:
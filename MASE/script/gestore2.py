@@ -5,7 +5,9 @@ import os
 import argparse
 import logging
 from logging.handlers import RotatingFileHandler
-from config import LOG_DIR
+from config import LOG_DIR, MASE_INATTIVITA_SEC
+from stream_runner import esegui_streaming
+from storico_run import leggi_riepilogo, salva_riepilogo
 
 # --- CONFIGURAZIONE ---
 PYTHON_EXE = sys.executable
@@ -69,26 +71,38 @@ def release_lock():
 
 
 def _run_and_stream(cmd, cwd, prefix):
-    # forza Python unbuffered nei figli
-    env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+    # forza Python unbuffered nei figli (stream_runner imposta anche PYTHONUNBUFFERED)
     cmd = [cmd[0], "-u"] + cmd[1:]  # aggiunge -u a PYTHON_EXE
 
     logger_b.info(f"[{prefix}] Avvio comando: {cmd}")
-    with subprocess.Popen(cmd, cwd=cwd, text=True, encoding="utf-8", errors="replace",
-                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                          env=env, bufsize=1) as p:
-        for line in p.stdout:
-            logger_b.info(f"[{prefix}] {line.rstrip()}")
-        rc = p.wait()
+    res = esegui_streaming(cmd, cwd, logger_b, prefisso=prefix, unisci_stderr=True,
+                           inattivita_sec=MASE_INATTIVITA_SEC)
+    rc = res.returncode
     if rc != 0:
         logger_b.error(f"[{prefix}] Terminato con codice {rc}")
         raise subprocess.CalledProcessError(rc, cmd)
 
 
+def salva_riepilogo_b(avvio):
+    """
+    Riepilogo di B per lo storico dei run: richieste di screp + elaboratore,
+    righe_in = MMSI trovati da screp, righe_out = viaggi tracciati da elaboratore.
+    """
+    screp = leggi_riepilogo("screp", dal=avvio) or {}
+    elaboratore = leggi_riepilogo("elaboratore", dal=avvio) or {}
+    richieste = [r["richieste"] for r in (screp, elaboratore) if r.get("richieste") is not None]
+    salva_riepilogo("B", righe_in=screp.get("righe_out"), righe_out=elaboratore.get("righe_out"),
+                    richieste=sum(richieste) if richieste else None)
+
+
 def run_one_cycle():
-    _run_and_stream([PYTHON_EXE, PATH_SCRIPT_1], PATH_CARTELLA_SCRIPT, "screp")
-    time.sleep(10)
-    _run_and_stream([PYTHON_EXE, PATH_SCRIPT_2], PATH_CARTELLA_SCRIPT, "elaboratore")
+    avvio = time.time()
+    try:
+        _run_and_stream([PYTHON_EXE, PATH_SCRIPT_1], PATH_CARTELLA_SCRIPT, "screp")
+        time.sleep(10)
+        _run_and_stream([PYTHON_EXE, PATH_SCRIPT_2], PATH_CARTELLA_SCRIPT, "elaboratore")
+    finally:
+        salva_riepilogo_b(avvio)
 
 
 def main():
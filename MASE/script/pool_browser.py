@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+# NOME FILE: pool_browser.py
+"""
+Pool di browser residenti per screp ed elaboratore (BROWSER_POOL_* in config).
+
+Servizio (processo a parte, lasciato sempre acceso):
+    python pool_browser.py [--dimensione N]
+
+Tiene N Chrome caldi, ognuno con un profilo persistente (MASE_CHROME_PROFILE/pool_<n>: cache e
+cookie sopravvivono tra i run) e la porta DevTools aperta su 127.0.0.1. Gli script non avviano
+più Chrome: chrome_utils.new_chrome_or_exit noleggia uno slot e ci si aggancia con
+debuggerAddress (parte solo chromedriver, che è rapido).
+
+API locale (JSON su http://127.0.0.1:BROWSER_POOL_PORTA):
+  POST /noleggia     {"cliente", "attesa"}     -> {"id", "slot", "debugger"} | 503 se nessuno slot libero
+  POST /rinnova      {"id"}                    -> {"ok"} | 404 se il noleggio non c'è più
+  POST /restituisci  {"id", "pagine", "sano"}  -> {"ok"}
+  GET  /stato                                  -> slot, noleggi, pagine, memoria
+
+Manutenzione (thread interno, ogni BROWSER_POOL_CONTROLLO_SEC):
+  - health check degli slot liberi (script JS nel browser + /json/version di DevTools)
+  - riciclo dopo BROWSER_POOL_MAX_PAGINE pagine o oltre BROWSER_POOL_MAX_RSS_MB (serve psutil)
+  - il cliente rinnova il noleggio ogni BROWSER_POOL_RINNOVO_SEC da un thread daemon: un noleggio
+    senza rinnovi da BROWSER_POOL_SCADENZA_SEC (cliente morto) viene ripreso e lo slot riavviato,
+    mentre un run lungo ma vivo tiene lo slot quanto serve
+Riavvii e health check avvengono fuori dal lock, con lo slot segnato "in manutenzione": gli altri
+noleggi, le restituzioni e /stato non aspettano l'avvio di Chrome.
+
+Se il servizio non è in ascolto gli script tornano al Chrome a freddo di sempre.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from logging.handlers import RotatingFileHandler
+
+import bootstrap
+from config import (
+    MASE_LOG, MASE_CHROME_PROFILE, BROWSER_POOL_ATTIVO, BROWSER_POOL_PORTA, BROWSER_POOL_PORTA_DEBUG,
+    BROWSER_POOL_DIMENSIONE, BROWSER_POOL_HEADLESS, BROWSER_POOL_MAX_PAGINE, BROWSER_POOL_MAX_RSS_MB,
+    BROWSER_POOL_RINNOVO_SEC, BROWSER_POOL_SCADENZA_SEC, BROWSER_POOL_ATTESA_SEC, BROWSER_POOL_CONTROLLO_SEC,
+)
+
+URL_POOL = f"http://127.0.0.1:{BROWSER_POOL_PORTA}"
+
+logger = logging.getLogger("pool_browser")
+
+
+# =========================
+# Lato cliente (usato da chrome_utils)
+# =========================
+def _chiama(percorso, dati=None, timeout=5):
+    corpo = json.dumps(dati).encode("utf-8") if dati is not None else None
+    richiesta = urllib.request.Request(URL_POOL + percorso, data=corpo, method="POST" if corpo else "GET",
+                                       headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(richiesta, timeout=timeout) as risposta:
+        return json.loads(risposta.read().decode("utf-8"))
+
+
+_attivo = None
+
+def pool_in_uso():
+    """True se il pool è abilitato e il servizio risponde (verificato una volta per processo)."""
+    global _attivo
+    if _attivo is None:
+        _attivo = False
+        if BROWSER_POOL_ATTIVO:
+            try:
+                _attivo = bool(_chiama("/stato", timeout=2).get("slot"))
+            except (OSError, ValueError):
+                pass
+    return _attivo
+
+
+class SessioneNoleggiata:
+    """
+    Slot noleggiato: indirizzo DevTools a cui agganciarsi e conteggio delle pagine caricate.
+    Un thread daemon rinnova il noleggio finché il processo è vivo e la sessione non è restituita.
+    """
+
+    def __init__(self, id_noleggio, slot, debugger):
+        self.id = id_noleggio
+        self.slot = slot
+        self.debugger = debugger
+        self.pagine = 0
+        self._restituita = threading.Event()
+        threading.Thread(target=self._rinnova, name="pool-rinnovo", daemon=True).start()
+
+    def _rinnova(self):
+        while not self._restituita.wait(BROWSER_POOL_RINNOVO_SEC):
+            try:
+                _chiama("/rinnova", {"id": self.id})
+            except urllib.error.HTTPError:
+                print(f"ATTENZIONE: noleggio dello slot {self.slot} non più valido per il pool.")
+                return
+            except (OSError, ValueError):
+                pass  # pool momentaneamente irraggiungibile: si riprova al giro dopo
+
+    def conta_pagine(self, driver):
+        """Avvolge driver.get per contare le pagine (il pool ricicla lo slot dopo BROWSER_POOL_MAX_PAGINE)."""
+        originale = driver.get
+
+        def get(url):
+            self.pagine += 1
+            return originale(url)
+
+        driver.get = get
+
+    def restituisci(self, sano=True):
+        self._restituita.set()
+        try:
+            # timeout ampio: se lo slot va riciclato il pool riavvia Chrome prima di rispondere
+            _chiama("/restituisci", {"id": self.id, "pagine": self.pagine, "sano": sano}, timeout=120)
+        except (OSError, ValueError) as e:
+            print(f"ATTENZIONE: restituzione del browser al pool non riuscita ({e}); lo riprenderà alla scadenza.")
+
+
+def noleggia(cliente, attesa=BROWSER_POOL_ATTESA_SEC):
+    """SessioneNoleggiata, oppure None se il pool non è in uso o non ha slot liberi entro `attesa` secondi."""
+    if not pool_in_uso():
+        return None
+    try:
+        dati = _chiama("/noleggia", {"cliente": cliente, "attesa": attesa}, timeout=attesa + 5)
+    except urllib.error.HTTPError as e:
+        print(f"Pool browser: nessuno slot libero ({e.code}), avvio un Chrome a freddo.")
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Pool browser non raggiungibile ({e}), avvio un Chrome a freddo.")
+        return None
+    return SessioneNoleggiata(dati["id"], dati["slot"], dati["debugger"])
+
+
+# =========================
+# Lato servizio
+# =========================
+def rss_albero_mb(pid):
+    """Memoria residente di `pid` e dei suoi discendenti in MB (None senza psutil)."""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        processo = psutil.Process(pid)
+        return sum(p.memory_info().rss for p in [processo] + processo.children(recursive=True)) / (1024 * 1024)
+    except psutil.Error:
+        return None
+
+
+class Slot:
+    def __init__(self, indice, headless):
+        self.indice = indice
+        self.porta_debug = BROWSER_POOL_PORTA_DEBUG + indice
+        self.profilo = os.path.join(str(MASE_CHROME_PROFILE), f"pool_{indice}")
+        self.headless = headless
+        self.driver = None
+        self.pagine = 0
+        self.avvii = 0
+        self.noleggio = None  # (id, cliente, istante)
+        self.rinnovato = None  # ultimo rinnovo del noleggio (monotonic)
+        self.in_manutenzione = False  # riavvio/health check in corso fuori dal lock: non noleggiabile
+
+    @property
+    def debugger(self):
+        return f"127.0.0.1:{self.porta_debug}"
+
+    def avvia(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+
+        os.makedirs(self.profilo, exist_ok=True)
+        opts = Options()
+        if self.headless:
+            opts.add_argument("--headless=new")
+        opts.add_argument("--disable-gpu")
+        opts.add_argument("--window-size=1920,1080")
+        opts.add_argument("--no-first-run")
+        opts.add_argument("--no-default-browser-check")
+        opts.add_argument("--user-data-dir=" + self.profilo)
+        opts.add_argument("--disable-dev-shm-usage")
+        opts.add_argument("--disable-extensions")
+        opts.add_argument(f"--remote-debugging-port={self.porta_debug}")
+        opts.add_argument("--remote-debugging-address=127.0.0.1")
+        inizio = time.monotonic()
+        self.driver = webdriver.Chrome(service=Service(), options=opts)
+        self.driver.set_page_load_timeout(60)
+        self.pagine = 0
+        self.avvii += 1
+        logger.info(f"Slot {self.indice}: Chrome avviato in {time.monotonic() - inizio:.1f}s (porta {self.porta_debug}).")
+
+    def chiudi(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+    def riavvia(self, motivo):
+        logger.info(f"Slot {self.indice}: riciclo ({motivo}).")
+        self.chiudi()
+        try:
+            self.avvia()
+        except Exception as e:
+            logger.error(f"Slot {self.indice}: riavvio non riuscito: {e}")
+
+    def sano(self):
+        if self.driver is None:
+            return False
+        try:
+            if self.driver.execute_script("return 1") != 1:
+                return False
+            with urllib.request.urlopen(f"http://{self.debugger}/json/version", timeout=3):
+                return True
+        except Exception:
+            return False
+
+    def rss_mb(self):
+        try:
+            return rss_albero_mb(self.driver.service.process.pid)
+        except AttributeError:
+            return None
+
+    def da_riciclare(self):
+        if self.pagine >= BROWSER_POOL_MAX_PAGINE:
+            return f"{self.pagine} pagine caricate"
+        rss = self.rss_mb()
+        if rss is not None and BROWSER_POOL_MAX_RSS_MB and rss > BROWSER_POOL_MAX_RSS_MB:
+            return f"memoria {rss:.0f} MB > {BROWSER_POOL_MAX_RSS_MB} MB"
+        if not self.sano():
+            return "health check fallito"
+        return None
+
+    def ripulisci(self):
+        """Dopo un noleggio: una sola scheda su about:blank (cache, cookie e profilo restano)."""
+        try:
+            finestre = self.driver.window_handles
+            for handle in finestre[1:]:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            self.driver.switch_to.window(finestre[0])
+            self.driver.get("about:blank")
+        except Exception as e:
+            logger.warning(f"Slot {self.indice}: pulizia dopo il noleggio non riuscita ({e}).")
+
+    def stato(self):
+        cliente = self.noleggio[1] if self.noleggio else None
+        return {"slot": self.indice, "debugger": self.debugger, "noleggiato_da": cliente,
+                "in_manutenzione": self.in_manutenzione, "pagine": self.pagine, "avvii": self.avvii}
+
+
+class PoolBrowser:
+    def __init__(self, dimensione=BROWSER_POOL_DIMENSIONE, headless=BROWSER_POOL_HEADLESS):
+        self.slot = [Slot(i, headless) for i in range(max(1, dimensione))]
+        self._cond = threading.Condition()
+        self._fermo = threading.Event()
+
+    def avvia(self):
+        for slot in self.slot:
+            try:
+                slot.avvia()
+            except Exception as e:
+                logger.error(f"Slot {slot.indice}: avvio non riuscito: {e}")
+        threading.Thread(target=self._manutenzione, name="pool-manutenzione", daemon=True).start()
+
+    def noleggia(self, cliente, attesa):
+        scadenza = time.monotonic() + max(0, attesa)
+        with self._cond:
+            while True:
+                for slot in self.slot:
+                    if slot.noleggio is None and not slot.in_manutenzione and slot.driver is not None:
+                        slot.noleggio = (uuid.uuid4().hex, cliente, time.monotonic())
+                        slot.rinnovato = slot.noleggio[2]
+                        logger.info(f"Slot {slot.indice} noleggiato a {cliente}.")
+                        return {"id": slot.noleggio[0], "slot": slot.indice, "debugger": slot.debugger}
+                resto = scadenza - time.monotonic()
+                if resto <= 0:
+                    return None
+                self._cond.wait(resto)
+
+    def _cerca(self, id_noleggio):
+        return next((s for s in self.slot if s.noleggio and s.noleggio[0] == id_noleggio), None)
+
+    def rinnova(self, id_noleggio):
+        with self._cond:
+            slot = self._cerca(id_noleggio)
+            if slot is None:
+                return False
+            slot.rinnovato = time.monotonic()
+            return True
+
+    def _fuori_lock(self, lavori):
+        """Esegue i lavori (slot, funzione) senza il lock, poi rimette gli slot noleggiabili e sveglia chi attende."""
+        for slot, lavoro in lavori:
+            try:
+                lavoro(slot)
+            except Exception as e:
+                logger.error(f"Slot {slot.indice}: manutenzione non riuscita: {e}")
+        with self._cond:
+            for slot, _ in lavori:
+                slot.in_manutenzione = False
+            self._cond.notify_all()
+
+    def restituisci(self, id_noleggio, pagine, sano):
+        with self._cond:
+            slot = self._cerca(id_noleggio)
+            if slot is None:
+                return False
+            durata = time.monotonic() - slot.noleggio[2]
+            slot.pagine += int(pagine or 0)
+            logger.info(f"Slot {slot.indice} restituito da {slot.noleggio[1]} dopo {durata:.0f}s ({pagine} pagine).")
+            slot.noleggio = None
+            slot.in_manutenzione = True
+
+        def dopo_il_noleggio(slot):
+            motivo = "segnalato non sano dal cliente" if not sano else slot.da_riciclare()
+            if motivo:
+                slot.riavvia(motivo)
+            else:
+                slot.ripulisci()
+
+        self._fuori_lock([(slot, dopo_il_noleggio)])
+        return True
+
+    def _controlla_libero(self, slot):
+        if slot.driver is None:
+            slot.riavvia("non attivo")
+            return
+        motivo = slot.da_riciclare()
+        if motivo:
+            slot.riavvia(motivo)
+
+    def _manutenzione(self):
+        while not self._fermo.wait(BROWSER_POOL_CONTROLLO_SEC):
+            lavori = []
+            with self._cond:
+                for slot in self.slot:
+                    if slot.in_manutenzione:
+                        continue
+                    if slot.noleggio is not None:
+                        silenzio = time.monotonic() - slot.rinnovato
+                        if silenzio <= BROWSER_POOL_SCADENZA_SEC:
+                            continue
+                        logger.warning(f"Slot {slot.indice}: noleggio di {slot.noleggio[1]} senza rinnovi "
+                                       f"da {silenzio:.0f}s, lo riprendo.")
+                        slot.noleggio = None
+                        lavori.append((slot, lambda s: s.riavvia("noleggio scaduto")))
+                    else:
+                        lavori.append((slot, self._controlla_libero))
+                    slot.in_manutenzione = True
+            if lavori:
+                self._fuori_lock(lavori)
+
+    def stato(self):
+        with self._cond:
+            stati = [s.stato() for s in self.slot]
+        for slot, stato in zip(self.slot, stati):
+            stato["rss_mb"] = slot.rss_mb()  # psutil fuori dal lock
+        return {"slot": stati}
+
+    def chiudi(self):
+        self._fermo.set()
+        with self._cond:
+            for slot in self.slot:
+                slot.chiudi()
+
+
+def _gestore(pool):
+    from http.server import BaseHTTPRequestHandler
+
+    class Gestore(BaseHTTPRequestHandler):
+        def _rispondi(self, codice, dati):
+            corpo = json.dumps(dati).encode("utf-8")
+            self.send_response(codice)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def do_GET(self):
+            if self.path == "/stato":
+                self._rispondi(200, pool.stato())
+            else:
+                self._rispondi(404, {"errore": "percorso sconosciuto"})
+
+        def do_POST(self):
+            try:
+                lunghezza = int(self.headers.get("Content-Length") or 0)
+                dati = json.loads(self.rfile.read(lunghezza) or b"{}")
+            except ValueError:
+                self._rispondi(400, {"errore": "JSON non valido"})
+                return
+            if self.path == "/noleggia":
+                esito = pool.noleggia(str(dati.get("cliente", "?")), float(dati.get("attesa", 0)))
+                self._rispondi(200, esito) if esito else self._rispondi(503, {"errore": "nessuno slot libero"})
+            elif self.path == "/rinnova":
+                ok = pool.rinnova(dati.get("id"))
+                self._rispondi(200 if ok else 404, {"ok": ok})
+            elif self.path == "/restituisci":
+                ok = pool.restituisci(dati.get("id"), dati.get("pagine"), dati.get("sano", True))
+                self._rispondi(200 if ok else 404, {"ok": ok})
+            else:
+                self._rispondi(404, {"errore": "percorso sconosciuto"})
+
+        def log_message(self, *args):
+            pass
+
+    return Gestore
+
+
+def setup_logging():
+    os.makedirs(MASE_LOG, exist_ok=True)
+    logger.setLevel(logging.INFO)
+    if not logger.handlers:
+        fmt = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+        fh = RotatingFileHandler(os.path.join(MASE_LOG, "pool_browser.log"),
+                                 maxBytes=2_000_000, backupCount=3, encoding="utf-8")
+        fh.setFormatter(fmt)
+        sh = logging.StreamHandler(sys.stdout)
+        sh.setFormatter(fmt)
+        logger.addHandler(fh)
+        logger.addHandler(sh)
+
+
+def main():
+    from http.server import ThreadingHTTPServer
+
+    parser = argparse.ArgumentParser(description="Pool di browser residenti per MASE.")
+    parser.add_argument("--dimensione", type=int, default=BROWSER_POOL_DIMENSIONE, help="Chrome tenuti caldi")
+    parser.add_argument("--headless", action="store_true", default=BROWSER_POOL_HEADLESS)
+    args = parser.parse_args()
+
+    setup_logging()
+    pool = PoolBrowser(args.dimensione, args.headless)
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", BROWSER_POOL_PORTA), _gestore(pool))
+    except OSError as e:
+        logger.error(f"Porta {BROWSER_POOL_PORTA} non disponibile (pool già avviato?): {e}")
+        return 1
+    logger.info(f"=== Pool browser: {len(pool.slot)} slot, API su {URL_POOL} ===")
+    pool.avvia()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Interrotto dall'utente. Chiudo i browser.")
+    finally:
+        server.server_close()
+        pool.chiudi()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,28 +18,37 @@ def safe_print(msg: str):
 
 # -*- coding: utf-8 -*-
 # NOME FILE: screp.py
+#
+# Estrazione degli MMSI presenti nei porti (pagine /inport di myshiptracking) -> mmsi_attuali.csv.
+# Due percorsi per leggere le pagine (SCREP_MODALITA in config, --modalita da riga di comando):
+#   - "http":    GET con una requests.Session (connessioni riusate) e parsing diretto di myst-table;
+#                il browser viene avviato solo se la risposta non contiene la tabella (challenge JS,
+#                errore HTTP, errore di rete). Dopo SCREP_HTTP_MAX_MANCATE mancate di fila il run
+#                prosegue solo col browser.
+#   - "browser": solo Selenium, come in origine.
+# A fine run il log riporta quante pagine sono passate da ciascun percorso.
+# I porti sono scansionati in parallelo da SCREP_WORKERS lettori (vedi main).
 
+import argparse
 import pandas as pd
-import time
-import random
 import re
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+# Selenium e BeautifulSoup vengono importati solo nelle funzioni che li usano (avvio più rapido)
 from chrome_utils import kill_zombie, new_chrome_or_exit, cleanup_profile
-from selenium import webdriver
-from chrome_utils import kill_zombie, new_chrome_or_exit, cleanup_profile
-from selenium.webdriver.chrome.options import Options
-from chrome_utils import kill_zombie, new_chrome_or_exit, cleanup_profile
-from selenium.webdriver.common.by import By
-from chrome_utils import kill_zombie, new_chrome_or_exit, cleanup_profile
-from selenium.webdriver.support.ui import WebDriverWait
-from chrome_utils import kill_zombie, new_chrome_or_exit, cleanup_profile
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
 import bootstrap
+from rate_limiter import RateLimiterAIMD, get_con_ritmo
+from metriche import REGISTRO
+from storico_run import salva_riepilogo
+
+PAGINE_PORTO = REGISTRO.gauge("screp_pagine_porto", "Pagine lette per porto nell'ultimo run", ["porto"])
+NAVI_PORTO = REGISTRO.gauge("screp_navi_porto", "MMSI nuovi trovati per porto nell'ultimo run", ["porto"])
+PAGINE_PERCORSO = REGISTRO.contatore("screp_pagine_totale", "Pagine lette per percorso (http/browser)", ["percorso"])
 
 # === PATH da config ===
-from config import MASE_INPUT_SCREP_PORTI, MASE_TEMP, MASE_CHROME_PROFILE
+from config import MASE_INPUT_SCREP_PORTI, MASE_TEMP, SCREP_MODALITA, SCREP_HTTP_MAX_MANCATE, SCREP_WORKERS
 
 # --- CONFIGURAZIONE ---
 FILE_INPUT_PORTI = str(MASE_INPUT_SCREP_PORTI / "porti_screp.xlsx")
@@ -47,113 +56,257 @@ PATH_FILE_TEMP   = str(MASE_TEMP)
 FILE_OUTPUT_MMSI = os.path.join(PATH_FILE_TEMP, 'mmsi_attuali.csv')
 BASE_URL = 'https://www.myshiptracking.com'
 MAX_PAGES = 10 
-def main():
-    print("--- Avvio Script 1: Estrazione MMSI ---")
-    options = Options()
-    try:
-        # profilo locale nel progetto (al posto di C:\Users\security\...)
-        options.add_argument(f"user-data-dir={MASE_CHROME_PROFILE}")
-        kill_zombie()
-        driver, __prof = new_chrome_or_exit(headless=False)
-        driver.maximize_window()
-    except Exception as e:
-        print(f"ERRORE: Impossibile avviare Chrome. Dettagli: {e}")
-        return
-        
-    wait = WebDriverWait(driver, 15)
+MODALITA = ("http", "browser")
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
 
+def carica_tabella(driver, wait, url, limiter):
+    """Carica `url` al ritmo deciso dal limiter e attende la tabella myst-table."""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    limiter.attendi()
     try:
-        df = pd.read_excel(FILE_INPUT_PORTI)
-        df_validi = df.dropna(subset=['ID Porto'])
-    except Exception as e:
-        print(f"ERRORE: Impossibile leggere il file dei porti: {e}")
-        cleanup_profile(driver, __prof)
-        return
+        driver.get(url)
+        tabella_element = wait.until(EC.presence_of_element_located((By.CLASS_NAME, "myst-table")))
+    except Exception:
+        limiter.esito(errore=True)
+        raise
+    limiter.esito()
+    return tabella_element
 
-    risultati_navi = []
-    mmsi_gia_trovati = set()
+def tabella_da_html(html):
+    """Elemento myst-table (BeautifulSoup) della pagina, o None se la pagina non la contiene."""
+    from bs4 import BeautifulSoup, SoupStrainer
+    soup = BeautifulSoup(html, 'lxml', parse_only=SoupStrainer(class_="myst-table"))
+    return soup.find(class_="myst-table")
 
-    for index, riga in df_validi.iterrows():
-        nome_porto = riga['Nome Porto']
-        port_id = int(riga['ID Porto'])
-        print(f"\n--- Analizzando: {nome_porto} (ID: {port_id}) ---")
+class LettorePagine:
+    """
+    Restituisce (tabella myst-table, html della pagina) per ogni URL, via HTTP o via browser.
+    Il browser è avviato solo al primo bisogno e chiuso con chiudi().
+    """
 
-        # ---- PAGINAZIONE PER PORTO ----
-        navi_trovate_nel_porto = 0
-        page = 1
-        total_pages = None  # verrà calcolato solo se leggiamo "Showing ... of N Results"
+    # avvii serializzati: noleggio dal pool o Chrome a freddo, uno alla volta tra i thread di main
+    _lock_avvio = threading.Lock()
 
+    def __init__(self, modalita, limiter):
+        if modalita not in MODALITA:
+            raise ValueError(f"Modalità sconosciuta: {modalita} (attese: {', '.join(MODALITA)})")
+        self.modalita = modalita
+        self.limiter = limiter
+        self.conteggi = {"http": 0, "browser": 0}
+        self.mancate_di_fila = 0
+        self.sessione = None
+        self.driver = None
+        self._profilo = None
+        self._wait = None
+
+    def _http(self, url):
+        import requests
+        if self.sessione is None:
+            self.sessione = requests.Session()
+            self.sessione.headers.update(HEADERS)
         try:
-            # Carico pagina 1, provo a leggere il totale "Showing 1 - 50 of N Results"
-            url_porto = f"{BASE_URL}/inport?sort=TIME&page={page}&pid={port_id}"
-            driver.get(url_porto)
-            time.sleep(random.uniform(0.05, 0.15))
-            tabella_element = wait.until(EC.presence_of_element_located((By.CLASS_NAME, "myst-table")))
+            response = get_con_ritmo(self.sessione, url, self.limiter, timeout=20)
+        except requests.exceptions.RequestException as e:
+            return None, f"errore di rete ({e})"
+        if response.status_code != 200:
+            return None, f"HTTP {response.status_code}"
+        tabella = tabella_da_html(response.text)
+        if tabella is None:
+            return None, "tabella assente nella risposta"
+        return (tabella, response.text), None
+
+    def avvia_browser(self):
+        # niente kill_zombie qui: chiuderebbe i browser degli altri lettori (lo fa main all'avvio)
+        from selenium.webdriver.support.ui import WebDriverWait
+        with LettorePagine._lock_avvio:  # un avvio alla volta tra i lettori del processo
+            print("  -> Avvio il browser.")
+            self.driver, self._profilo = new_chrome_or_exit(headless=False)
+        self.driver.maximize_window()
+        self._wait = WebDriverWait(self.driver, 15)
+
+    def _browser(self, url):
+        from bs4 import BeautifulSoup
+        if self.driver is None:
+            self.avvia_browser()
+        tabella_element = carica_tabella(self.driver, self._wait, url, self.limiter)
+        tabella = BeautifulSoup(tabella_element.get_attribute('outerHTML'), 'lxml')
+        return tabella, self.driver.page_source
 
-            html = driver.page_source
+    def leggi(self, url):
+        if self.modalita == "http" and self.mancate_di_fila < SCREP_HTTP_MAX_MANCATE:
+            letta, motivo = self._http(url)
+            if letta is not None:
+                self.mancate_di_fila = 0
+                self.conteggi["http"] += 1
+                PAGINE_PERCORSO.inc(percorso="http")
+                return letta
+            self.mancate_di_fila += 1
+            print(f"  -> HTTP senza tabella ({motivo}): uso il browser.")
+            if self.mancate_di_fila == SCREP_HTTP_MAX_MANCATE:
+                print(f"  -> {SCREP_HTTP_MAX_MANCATE} pagine di fila senza tabella via HTTP: proseguo solo col browser.")
+        letta = self._browser(url)
+        self.conteggi["browser"] += 1
+        PAGINE_PERCORSO.inc(percorso="browser")
+        return letta
+
+    def chiudi(self):
+        if self.driver is not None:
+            cleanup_profile(self.driver, self._profilo)
+            self.driver = None
+        if self.sessione is not None:
+            self.sessione.close()
+            self.sessione = None
+
+def scansiona_porto(lettore, nome_porto, port_id):
+    """
+    Legge le pagine /inport di un porto. Ritorna (MMSI nell'ordine di pagina senza ripetizioni,
+    pagine lette, righe di log). Su errore ritorna quanto trovato fino a quel punto.
+    """
+    log = [f"\n--- Analizzando: {nome_porto} (ID: {port_id}) ---"]
+    mmsi_del_porto = []
+    visti = set()
+    page = 1
+    total_pages = None  # verrà calcolato solo se leggiamo "Showing ... of N Results"
+
+    try:
+        # Carico pagina 1, provo a leggere il totale "Showing 1 - 50 of N Results"
+        url_porto = f"{BASE_URL}/inport?sort=TIME&page={page}&pid={port_id}"
+        tabella, html = lettore.leggi(url_porto)
+
+        total_results = None
+        try:
+            m = re.search(r"Showing\s+\d+\s*-\s*\d+\s*of\s*(\d+)\s*Results", html, flags=re.IGNORECASE)
+            if m:
+                total_results = int(m.group(1))
+        except Exception:
             total_results = None
-            try:
-                m = re.search(r"Showing\s+\d+\s*-\s*\d+\s*of\s*(\d+)\s*Results", html, flags=re.IGNORECASE)
-                if m:
-                    total_results = int(m.group(1))
-            except Exception:
-                total_results = None
-
-            if total_results is not None and total_results > 0:
-                total_pages = min(MAX_PAGES, (total_results + 49) // 50)  # ceil(N/50)
-
-            # Ciclo pagine: se total_pages è None, uso lo stop quando la pagina ha <50 nuove navi
-            while True:
-             # (per page=1 abbiamo già fatto GET sopra; per le successive rifaccio GET)
-                if page > 1:
-                    url_porto = f"{BASE_URL}/inport?sort=TIME&page={page}&pid={port_id}"
-                    driver.get(url_porto)
-                    tabella_element = wait.until(EC.presence_of_element_located((By.CLASS_NAME, "myst-table")))
-
-                soup = BeautifulSoup(tabella_element.get_attribute('outerHTML'), 'lxml')
-                # NEW: conteggio righe totali in pagina, indipendente dai duplicati
-                righe_totali_in_pagina = len([a for a in soup.find_all('a', href=lambda href: href and '-mmsi-' in href)])
-
-                nuovi_in_questa_pagina = 0
-                for link_nave in soup.find_all('a', href=lambda href: href and '-mmsi-' in href):
-                    match = re.search(r'-mmsi-(\d+)-', link_nave['href'])
-                    if match:
-                        mmsi = match.group(1)
-                        if mmsi not in mmsi_gia_trovati:
-                            risultati_navi.append({'MMSI': mmsi, 'PORTO': nome_porto})
-                            mmsi_gia_trovati.add(mmsi)
-                            nuovi_in_questa_pagina += 1
-                            navi_trovate_nel_porto += 1
-
-                print(f"  -> Pagina {page}: {nuovi_in_questa_pagina} nuove / {righe_totali_in_pagina} totali.")
-
-                # Stop conditions
-                if total_pages is None:
-                    # Fallback: se la pagina mostra meno di 50 righe totali, è l'ultima
-                    if righe_totali_in_pagina < 50:
-                        break
-                else :
-                    # Se abbiamo il totale ed è l'ultima pagina calcolata, usciamo
-                    if page >= total_pages:
-                        break
-                if nuovi_in_questa_pagina == 0 and total_pages is None:
-                    break
 
+        if total_results is not None and total_results > 0:
+            total_pages = min(MAX_PAGES, (total_results + 49) // 50)  # ceil(N/50)
+
+        # Ciclo pagine: se total_pages è None, uso lo stop quando la pagina ha <50 nuove navi
+        while True:
+            # (per page=1 abbiamo già fatto GET sopra; per le successive rifaccio GET)
+            if page > 1:
+                url_porto = f"{BASE_URL}/inport?sort=TIME&page={page}&pid={port_id}"
+                tabella, _ = lettore.leggi(url_porto)
+
+            link_navi = tabella.find_all('a', href=lambda href: href and '-mmsi-' in href)
+            # conteggio righe totali in pagina, indipendente dai duplicati
+            righe_totali_in_pagina = len(link_navi)
 
-                # Prossima pagina
-                page += 1
-                if page > MAX_PAGES:
+            nuovi_in_questa_pagina = 0
+            for link_nave in link_navi:
+                match = re.search(r'-mmsi-(\d+)-', link_nave['href'])
+                if match and match.group(1) not in visti:
+                    visti.add(match.group(1))
+                    mmsi_del_porto.append(match.group(1))
+                    nuovi_in_questa_pagina += 1
+
+            log.append(f"  -> Pagina {page}: {nuovi_in_questa_pagina} nuove / {righe_totali_in_pagina} totali.")
+
+            # Stop conditions
+            if total_pages is None:
+                # Fallback: se la pagina mostra meno di 50 righe totali, è l'ultima
+                if righe_totali_in_pagina < 50:
+                    break
+            else:
+                # Se abbiamo il totale ed è l'ultima pagina calcolata, usciamo
+                if page >= total_pages:
                     break
-                time.sleep(random.uniform(0.05, 0.25))  # micro-delay tra pagine
+            if nuovi_in_questa_pagina == 0 and total_pages is None:
+                break
+
+            # Prossima pagina
+            page += 1
+            if page > MAX_PAGES:
+                break
+
+    except Exception as e:
+        log.append(f"  -> ATTENZIONE: Errore su porto {nome_porto}. {e}")
+    return mmsi_del_porto, page, log
+
+def main(modalita=SCREP_MODALITA, workers=SCREP_WORKERS):
+    """
+    Scansiona i porti con `workers` lettori in parallelo (ognuno con la propria sessione HTTP e,
+    se serve, il proprio browser), tutti sotto lo stesso limiter: il ritmo verso il sito è globale.
+    I risultati sono uniti nell'ordine di porti_screp.xlsx, quindi un MMSI presente in più porti
+    resta assegnato al primo porto della lista, come con la scansione sequenziale.
+    """
+    print("--- Avvio Script 1: Estrazione MMSI ---")
+    if modalita not in MODALITA:
+        print(f"ERRORE: modalità sconosciuta: {modalita}")
+        return
+    workers = max(1, int(workers))
+    limiter = RateLimiterAIMD("screp", log=safe_print)
+    kill_zombie()  # una sola volta: i browser dei lettori partono dopo
 
-            print(f"  -> Trovate {navi_trovate_nel_porto}  navi in totale per : {nome_porto}.")
-            time.sleep(random.uniform(0.6, 1.0))  # delay tra porti
+    try:
+        df = pd.read_excel(FILE_INPUT_PORTI)
+        df_validi = df.dropna(subset=['ID Porto'])
+    except Exception as e:
+        print(f"ERRORE: Impossibile leggere il file dei porti: {e}")
+        return
+    porti = [(riga['Nome Porto'], int(riga['ID Porto'])) for _, riga in df_validi.iterrows()]
+
+    lettori = []
+    lock_lettori = threading.Lock()
+    locale = threading.local()
 
-        except Exception as e:
-            print(f"  -> ATTENZIONE: Errore su porto {nome_porto}. {e}")
+    def _lettore():
+        lettore = getattr(locale, "lettore", None)
+        if lettore is None:
+            lettore = LettorePagine(modalita, limiter)
+            with lock_lettori:
+                lettori.append(lettore)
+            if modalita == "browser":
+                lettore.avvia_browser()  # come in origine: browser aperto subito
+            locale.lettore = lettore
+        return lettore
 
+    def _scansiona(porto):
+        return scansiona_porto(_lettore(), *porto)
+
+    print(f"Scansione di {len(porti)} porti con {min(workers, len(porti)) or 1} lettori in parallelo (modalità {modalita}).")
+    risultati_navi = []
+    mmsi_gia_trovati = set()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="screp") as pool:
+            # map restituisce gli esiti nell'ordine dei porti: unione deterministica
+            for (nome_porto, _), (mmsi_del_porto, pagine, log) in zip(porti, pool.map(_scansiona, porti)):
+                navi_trovate_nel_porto = 0
+                for mmsi in mmsi_del_porto:
+                    if mmsi not in mmsi_gia_trovati:
+                        risultati_navi.append({'MMSI': mmsi, 'PORTO': nome_porto})
+                        mmsi_gia_trovati.add(mmsi)
+                        navi_trovate_nel_porto += 1
+                for riga in log:
+                    print(riga)
+                print(f"  -> Trovate {navi_trovate_nel_porto}  navi in totale per : {nome_porto} "
+                      f"({len(mmsi_del_porto)} nel porto).")
+                PAGINE_PORTO.imposta(pagine, porto=nome_porto)
+                NAVI_PORTO.imposta(navi_trovate_nel_porto, porto=nome_porto)
+    except Exception as e:
+        print(f"ERRORE: scansione dei porti interrotta (avvio di Chrome?). Dettagli: {e}")
+        return
+    finally:
+        for lettore in lettori:
+            lettore.chiudi()
+        # anche se la scansione si interrompe: il prossimo run riparte dal ritmo imparato
+        limiter.salva()
 
-    cleanup_profile(driver, __prof)
+    safe_print(limiter.riepilogo())
+    conteggi = {p: sum(l.conteggi[p] for l in lettori) for p in ("http", "browser")}
+    print(f"Pagine lette: http={conteggi['http']} browser={conteggi['browser']} "
+          f"(modalità {modalita}, {len(lettori)} lettori)")
+    REGISTRO.scrivi("screp")
+    # conteggi per lo storico dei run (gestore2 li somma nel riepilogo di B)
+    salva_riepilogo("screp", righe_in=len(porti), righe_out=len(risultati_navi),
+                    richieste=limiter.contatori["richieste"])
 
     if risultati_navi:
         print(f"\nScrittura di {len(risultati_navi)} MMSI unici nel file...")
@@ -173,4 +326,10 @@ def main():
     print("--- FINE SCRIPT 1 ---")
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modalita", choices=MODALITA, default=SCREP_MODALITA,
+                        help=f"http: requests con fallback al browser | browser: solo Selenium (default {SCREP_MODALITA})")
+    parser.add_argument("--workers", type=int, default=SCREP_WORKERS,
+                        help=f"Porti scansionati in parallelo (default {SCREP_WORKERS}, 1 = sequenziale)")
+    args = parser.parse_args()
+    main(modalita=args.modalita, workers=args.workers)
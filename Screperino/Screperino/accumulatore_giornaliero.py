@@ -0,0 +1,97 @@
+# accumulatore_giornaliero.py
+"""
+Accumulatore per-giorno delle estrazioni orarie, già deduplicato.
+
+Ogni run orario, dopo aver scritto il suo xlsx, aggiunge le righe mai viste prima a
+  Estrazioni_DD_MM_YYYY/_accumulatore.csv
+e aggiorna
+  Estrazioni_DD_MM_YYYY/_accumulatore.json  -> {"colonne": [...], "hash": [...], "file": [xlsx coperti]}
+
+A fine giornata pulisci_giornaliera legge solo il CSV (niente openpyxl) se il manifest copre
+tutti gli xlsx della cartella; altrimenti (accumulatore assente, run di versioni precedenti,
+crash tra CSV e manifest) torna alla rilettura completa dei file.
+
+L'hash di riga tratta come equivalenti i valori che la rilettura da Excel trasforma in NaN
+(None, '', 'N/A', NaN), così la deduplica coincide con drop_duplicates sui file riletti.
+"""
+
+import csv
+import hashlib
+import json
+import math
+import os
+
+import pandas as pd
+
+NOME_CSV = "_accumulatore.csv"
+NOME_MANIFEST = "_accumulatore.json"
+VALORI_VUOTI = ("", "N/A", "nan", "NaN", "None")
+
+
+def _valore(v):
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return ""
+    testo = str(v)
+    return "" if testo in VALORI_VUOTI else testo
+
+
+def hash_riga(valori):
+    return hashlib.sha1("\x1f".join(_valore(v) for v in valori).encode("utf-8")).hexdigest()[:16]
+
+
+class AccumulatoreGiornaliero:
+    def __init__(self, cartella):
+        self.cartella = str(cartella)
+        self.path_csv = os.path.join(self.cartella, NOME_CSV)
+        self.path_manifest = os.path.join(self.cartella, NOME_MANIFEST)
+        self.colonne = None
+        self.hash = set()
+        self.file = []
+        try:
+            with open(self.path_manifest, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.colonne = manifest["colonne"]
+            self.hash = set(manifest["hash"])
+            self.file = list(manifest["file"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def aggiungi(self, righe, colonne, nome_file):
+        """Aggiunge le righe (dict) non ancora viste e registra `nome_file` come coperto. Ritorna le righe nuove."""
+        if self.colonne is not None and list(colonne) != self.colonne:
+            raise ValueError(f"Colonne diverse da quelle dell'accumulatore: {list(colonne)} != {self.colonne}")
+        nuove = []
+        for riga in righe:
+            valori = [riga.get(c) for c in colonne]
+            h = hash_riga(valori)
+            if h not in self.hash:
+                self.hash.add(h)
+                nuove.append([_valore(v) for v in valori])
+
+        nuovo_csv = not os.path.exists(self.path_csv)
+        with open(self.path_csv, "a", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            if nuovo_csv:
+                writer.writerow(colonne)
+            writer.writerows(nuove)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.colonne = list(colonne)
+        if nome_file not in self.file:
+            self.file.append(nome_file)
+        tmp = self.path_manifest + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"colonne": self.colonne, "hash": sorted(self.hash), "file": self.file}, f)
+        os.replace(tmp, self.path_manifest)
+        return len(nuove)
+
+    def copre(self, lista_file):
+        """True se il CSV esiste e il manifest include tutti gli xlsx della cartella."""
+        if not os.path.exists(self.path_csv) or self.colonne is None:
+            return False
+        return {os.path.basename(f) for f in lista_file} <= set(self.file)
+
+    def leggi_df(self):
+        # tutto come testo: come le celle stringa rilette da Excel ('N/A' e vuoti -> NaN)
+        return pd.read_csv(self.path_csv, dtype=str, encoding="utf-8")
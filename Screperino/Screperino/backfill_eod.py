@@ -0,0 +1,156 @@
+# backfill_eod.py
+"""
+Recupero EOD su un intervallo di date (dopo un fermo di più giorni).
+
+Uso:
+  python backfill_eod.py DAL [AL] [--workers N] [--forza] [--dry-run]
+  (date in formato YYYY-MM-DD, DD-MM-YYYY o DD/MM/YYYY; AL di default = ieri)
+
+Per ogni data dell'intervallo:
+  - senza estrazioni orarie (Estrazioni_DD_MM_YYYY vuota o assente) -> saltata
+  - MASTER_DD-MM-YYYY.xlsx mancante                                  -> da rifare
+  - MASTER più vecchio di un input della data (xlsx orari, file bot
+    che secondo il catalogo contengono quella data)                   -> da rifare
+  - altrimenti già a posto (--forza le rifà comunque, senza riuso degli stadi memoizzati)
+
+Le date da rifare vengono elaborate in parallelo (EOD_BACKFILL_WORKERS o --workers):
+ogni data usa run_eod_for_date, quindi dentro la stessa data l'ordine
+pulisci_giornaliera / pulisci_bot -> unione_finale resta quello dell'orchestratore.
+LAST_EOD viene solo fatto avanzare, mai riportato indietro.
+Log in orchestratore.log; a fine run un riepilogo con il throughput.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, date, timedelta
+
+import bootstrap
+from config import SCREPERINO_ROOT, BOT_CATALOGO_DIR, EOD_BACKFILL_WORKERS
+from main2_screperino import logger, run_eod_for_date
+
+PATH_ESTRAZIONI = os.path.join(SCREPERINO_ROOT, "File_Output", "Estrazioni_Giornaliere")
+PATH_MASTER     = os.path.join(SCREPERINO_ROOT, "File_Output", "Master")
+PATH_INPUT_BOT  = os.path.join(SCREPERINO_ROOT, "File_Input", "Bot")
+
+
+def parse_data(raw):
+    for fmt in ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(raw.strip(), fmt).date()
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"data non valida: {raw}")
+
+
+def date_intervallo(dal, al):
+    giorno = dal
+    while giorno <= al:
+        yield giorno
+        giorno += timedelta(days=1)
+
+
+def _bot_per_data():
+    """{data iso: [path file bot]} dal catalogo di pulisci_bot (vuoto se il catalogo non c'è ancora)."""
+    try:
+        with open(os.path.join(BOT_CATALOGO_DIR, "_catalogo.json"), "r", encoding="utf-8") as f:
+            voci = json.load(f).get("file", {})
+    except (OSError, ValueError):
+        return {}
+    per_data = {}
+    for nome, voce in voci.items():
+        for giorno in voce.get("date", []):
+            per_data.setdefault(giorno, []).append(os.path.join(PATH_INPUT_BOT, nome))
+    return per_data
+
+
+def stato_data(giorno, bot_per_data):
+    """'senza_dati' | 'mancante' | 'vecchio' | 'ok' per il MASTER di `giorno`."""
+    cartella = os.path.join(PATH_ESTRAZIONI, f"Estrazioni_{giorno.strftime('%d_%m_%Y')}")
+    orari = [f for f in glob.glob(os.path.join(cartella, "*.xlsx")) if not os.path.basename(f).startswith("~$")]
+    if not orari:
+        return "senza_dati"
+    master = os.path.join(PATH_MASTER, f"MASTER_{giorno.strftime('%d-%m-%Y')}.xlsx")
+    if not os.path.exists(master):
+        return "mancante"
+    mtime_master = os.path.getmtime(master)
+    for path in orari + bot_per_data.get(giorno.isoformat(), []):
+        try:
+            if os.path.getmtime(path) > mtime_master:
+                return "vecchio"
+        except OSError:
+            continue
+    return "ok"
+
+
+def _esegui(giorno, forza):
+    inizio = time.monotonic()
+    ok = run_eod_for_date(giorno, force=forza)
+    return giorno, ok, time.monotonic() - inizio
+
+
+def backfill(dal, al, workers=EOD_BACKFILL_WORKERS, forza=False, dry_run=False):
+    """Ritorna 0 se tutte le date da rifare sono andate a buon fine, 1 altrimenti."""
+    bot_per_data = _bot_per_data()
+    da_fare = []
+    for giorno in date_intervallo(dal, al):
+        stato = stato_data(giorno, bot_per_data)
+        if stato == "senza_dati" or (stato == "ok" and not forza):
+            logger.info(f"Backfill: {giorno.isoformat()} -> {stato}, skip.")
+            continue
+        logger.info(f"Backfill: {giorno.isoformat()} -> {stato}, da rifare.")
+        da_fare.append(giorno)
+
+    if not da_fare:
+        logger.info("Backfill: nessuna data da rifare.")
+        return 0
+    if dry_run:
+        logger.info(f"Backfill (dry-run): {len(da_fare)} date da rifare: {', '.join(g.isoformat() for g in da_fare)}")
+        return 0
+
+    workers = max(1, min(workers, len(da_fare)))
+    logger.info(f"Backfill: {len(da_fare)} date, {workers} in parallelo.")
+    inizio = time.monotonic()
+    esiti = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_esegui, g, forza) for g in da_fare]
+        for fut in as_completed(futures):
+            giorno, ok, durata = fut.result()
+            esiti.append((giorno, ok, durata))
+            logger.info(f"Backfill: {giorno.isoformat()} {'OK' if ok else 'FALLITO'} in {durata:.1f}s "
+                        f"({len(esiti)}/{len(da_fare)})")
+
+    totale = time.monotonic() - inizio
+    falliti = sorted(g for g, ok, _ in esiti if not ok)
+    durate = [d for _, _, d in esiti]
+    logger.info(
+        f"Backfill completato: {len(esiti) - len(falliti)}/{len(esiti)} date OK in {totale:.1f}s | "
+        f"{len(esiti) / max(totale, 1e-9) * 3600:.1f} date/ora | media per data {sum(durate) / len(durate):.1f}s "
+        f"(max {max(durate):.1f}s) | parallelismo effettivo {sum(durate) / max(totale, 1e-9):.2f}x"
+    )
+    if falliti:
+        logger.error(f"Backfill: date fallite: {', '.join(g.isoformat() for g in falliti)}")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recupero EOD su un intervallo di date.")
+    parser.add_argument("dal", type=parse_data)
+    parser.add_argument("al", type=parse_data, nargs="?", default=date.today() - timedelta(days=1))
+    parser.add_argument("--workers", type=int, default=EOD_BACKFILL_WORKERS,
+                        help=f"date elaborate in parallelo (default {EOD_BACKFILL_WORKERS})")
+    parser.add_argument("--forza", action="store_true", help="rifà anche le date con MASTER aggiornato")
+    parser.add_argument("--dry-run", action="store_true", help="mostra solo le date da rifare")
+    args = parser.parse_args(argv)
+    if args.al < args.dal:
+        parser.error("AL precede DAL")
+    return backfill(args.dal, args.al, args.workers, args.forza, args.dry_run)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
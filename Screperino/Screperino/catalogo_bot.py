@@ -0,0 +1,182 @@
+# catalogo_bot.py
+"""
+Catalogo persistente dei file TRATTE del bot (File_Input/Bot), usato da pulisci_bot.
+
+Per ogni xlsx il catalogo ricorda (chiave = nome file, validità = mtime + dimensione):
+  - le date di partenza presenti nel foglio TRATTE
+  - una copia colonnare del foglio già normalizzata (colonne utili + DataOraCompleta),
+    salvata come pickle in Cache/bot/<sha1 del nome>.pkl
+
+Un run giornaliero rilegge da Excel solo i file nuovi o modificati; degli altri carica la
+copia in cache solo se contengono la data richiesta. I file spariti escono dal catalogo.
+Se la copia in cache manca o è illeggibile il file viene riletto, quindi la cache si può
+cancellare in qualsiasi momento.
+
+Indice: Cache/bot/_catalogo.json
+  {"versione": 1, "file": {"<nome>.xlsx": {"mtime", "size", "valido", "date": [...], "copia"}}}
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import pandas as pd
+
+from config import BOT_CATALOGO_DIR
+from lettore_xlsx import ColonneNormalizzate, file_validi, leggi_excel_multipli
+
+VERSIONE = 1
+NOME_INDICE = "_catalogo.json"
+COLONNE_RICHIESTE = ['data partenza', 'orario partenza']
+
+
+def prepara_tratte(df):
+    """Normalizza le colonne e aggiunge DataOraCompleta. None se mancano le colonne richieste."""
+    df.columns = [str(col).strip().lower() for col in df.columns]
+    if not all(col in df.columns for col in COLONNE_RICHIESTE):
+        return None
+    df['DataOraCompleta'] = pd.to_datetime(
+        df['data partenza'].astype(str) + ' ' + df['orario partenza'].astype(str),
+        dayfirst=True,
+        errors='coerce'
+    )
+    return df
+
+
+class CatalogoBot:
+    def __init__(self, cartella_input, colonne, cartella=BOT_CATALOGO_DIR):
+        self.cartella_input = str(cartella_input)
+        self.colonne = list(colonne)
+        self.cartella = str(cartella)
+        self.path_indice = os.path.join(self.cartella, NOME_INDICE)
+        self.file = {}
+        self.contatori = {"riletti": 0, "da_cache": 0, "saltati": 0, "rimossi": 0}
+        try:
+            with open(self.path_indice, "r", encoding="utf-8") as f:
+                indice = json.load(f)
+            if indice.get("versione") == VERSIONE and indice.get("colonne") == self.colonne:
+                self.file = indice["file"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    @staticmethod
+    def _firma(path):
+        st = os.stat(path)
+        return st.st_mtime, st.st_size
+
+    def _path_copia(self, nome):
+        return os.path.join(self.cartella, hashlib.sha1(nome.encode("utf-8")).hexdigest() + ".pkl")
+
+    def _aggiornato(self, nome):
+        voce = self.file.get(nome)
+        if voce is None:
+            return False
+        try:
+            mtime, size = self._firma(os.path.join(self.cartella_input, nome))
+        except OSError:
+            return False
+        return voce["mtime"] == mtime and voce["size"] == size
+
+    def _registra(self, nome, df):
+        """Salva la copia colonnare di `nome` e ritorna la voce di catalogo."""
+        mtime, size = self._firma(os.path.join(self.cartella_input, nome))
+        voce = {"mtime": mtime, "size": size, "valido": df is not None, "date": [], "copia": None}
+        if df is not None:
+            voce["date"] = sorted({d.isoformat() for d in df['DataOraCompleta'].dropna().dt.date})
+            voce["copia"] = os.path.basename(self._path_copia(nome))
+            # scrittura atomica: più EOD (backfill) possono aggiornare il catalogo insieme
+            tmp = f"{self._path_copia(nome)}.{os.getpid()}.tmp"
+            df.to_pickle(tmp)
+            os.replace(tmp, self._path_copia(nome))
+        self.file[nome] = voce
+        return voce
+
+    def _carica_copia(self, nome):
+        try:
+            return pd.read_pickle(os.path.join(self.cartella, self.file[nome]["copia"]))
+        except Exception as e:
+            logging.warning(f"Copia in cache di {nome} non leggibile ({e}): rileggo il file.")
+            return None
+
+    def tratte_del_giorno(self, nomi_file, giorno):
+        """
+        Ritorna [(nome_file, df_filtrato)] per i file che contengono partenze in `giorno`
+        (df con colonne normalizzate, senza DataOraCompleta). Aggiorna il catalogo per i file cambiati.
+        """
+        nomi_file = [os.path.basename(p) for p in file_validi(nomi_file)]
+        chiave_giorno = giorno.isoformat()
+        da_caricare, da_rileggere = [], []
+        for nome in nomi_file:
+            if not self._aggiornato(nome):
+                da_rileggere.append(nome)
+            elif chiave_giorno in self.file[nome]["date"]:
+                da_caricare.append(nome)
+            else:
+                self.contatori["saltati"] += 1
+
+        tabelle = {}
+        for nome in da_caricare:
+            df = self._carica_copia(nome)
+            if df is None:
+                da_rileggere.append(nome)
+            else:
+                tabelle[nome] = df
+                self.contatori["da_cache"] += 1
+
+        if da_rileggere:
+            os.makedirs(self.cartella, exist_ok=True)
+            letture = leggi_excel_multipli(
+                [os.path.join(self.cartella_input, n) for n in da_rileggere],
+                sheet_name='TRATTE', header=0, usecols=ColonneNormalizzate(self.colonne + COLONNE_RICHIESTE),
+            )
+            for percorso, df, errore in letture:
+                nome = os.path.basename(percorso)
+                if errore is not None:
+                    # niente voce di catalogo: al prossimo run si riprova
+                    self.file.pop(nome, None)
+                    logging.error(f"Impossibile processare il file {nome}. Errore: {errore}")
+                    continue
+                self.contatori["riletti"] += 1
+                try:
+                    df = prepara_tratte(df)
+                    voce = self._registra(nome, df)
+                except Exception as e:
+                    self.file.pop(nome, None)
+                    logging.error(f"Impossibile processare il file {nome}. Errore: {e}")
+                    continue
+                if not voce["valido"]:
+                    logging.warning(f"AVVISO: Colonne richieste ('data partenza', 'orario partenza') non trovate nel file {nome}. File saltato.")
+                elif chiave_giorno in voce["date"]:
+                    tabelle[nome] = df
+
+        presenti = set(nomi_file)
+        for nome in [n for n in self.file if n not in presenti]:
+            copia = self.file.pop(nome).get("copia")
+            if copia:
+                try:
+                    os.remove(os.path.join(self.cartella, copia))
+                except OSError:
+                    pass
+            self.contatori["rimossi"] += 1
+
+        risultati = []
+        for nome in nomi_file:
+            if nome not in tabelle:
+                continue
+            df = tabelle[nome]
+            df_filtrato = df[df['DataOraCompleta'].dt.date == giorno].drop(columns=['DataOraCompleta'])
+            risultati.append((nome, df_filtrato))
+        return risultati
+
+    def salva(self):
+        os.makedirs(self.cartella, exist_ok=True)
+        tmp = f"{self.path_indice}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"versione": VERSIONE, "colonne": self.colonne, "file": self.file}, f)
+        os.replace(tmp, self.path_indice)
+
+    def riepilogo(self):
+        c = self.contatori
+        return (f"Catalogo bot: {len(self.file)} file | riletti={c['riletti']} da_cache={c['da_cache']} "
+                f"saltati (data assente)={c['saltati']} rimossi={c['rimossi']}")
@@ -1,18 +1,38 @@
 # --- estrazione_giornaliera.py ---
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
 from datetime import datetime, date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from urllib.parse import urlparse
+import argparse
+import threading
 import time
 import logging
 import os
 import bootstrap
 from config import SCREPERINO_ROOT  # aggiungi in cima all'import dal config
+from config import A_WORKERS, A_MAX_PER_HOST, A_SOLO_VARIAZIONI, A_JOURNAL_FSYNC_OGNI, HTTP_CACHE_ATTIVA, SCREPERINO_STATO
+from config import A_PIANIFICATORE, A_STALENESS_MAX_H, A_FINESTRA_CALDA_H, A_FATTORE_DURATA, A_MARGINE_H
+from storico_run import salva_riepilogo
+from metriche import REGISTRO
+from impronte_viaggi import ImpronteViaggi
+from journal_estrazione import JournalEstrazione
+from pianificatore_mmsi import PianificatoreMMSI
+from accumulatore_giornaliero import AccumulatoreGiornaliero
+from rate_limiter import RateLimiterAIMD, get_con_ritmo
+from http_cache import HttpCache
+from estrattore_html import estrai_dati_nave_html, separa_data_ora
 
+FETCH_MMSI = REGISTRO.istogramma("fetch_mmsi_secondi", "Latenza di estrazione per MMSI", ["funzione"])
+MMSI_ESTRATTI = REGISTRO.contatore("mmsi_totale", "MMSI interrogati per esito", ["esito"])
 
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
 
 
-# ... (le funzioni setup_logging e separa_data_ora rimangono invariate) ...
+
+
+# ... (la funzione setup_logging rimane invariata; separa_data_ora è in estrattore_html) ...
 
 def setup_logging(log_file_path):
     try:
@@ -37,73 +57,119 @@ def setup_logging(log_file_path):
         print(f"ERRORE CRITICO: Impossibile configurare il logging. Dettagli: {e}")
         exit()
 
-def separa_data_ora(datetime_str):
-    testo = datetime_str.strip()
-    if len(testo) > 10 and testo[4] == '-' and testo[7] == '-':
-        data, ora = testo[:10], testo[10:]
-        if ':' in ora:
-            return data, ora
-    return testo, 'N/A'
+class LimiteHost:
+    """Semaforo per host: al massimo `max_per_host` richieste contemporanee verso lo stesso dominio."""
+
+    def __init__(self, max_per_host):
+        self.max_per_host = max(1, int(max_per_host))
+        self._semafori = {}
+        self._lock = threading.Lock()
+
+    def slot(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._semafori:
+                self._semafori[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semafori[host]
+
+
+_locale = threading.local()
+
+def _sessione_thread():
+    """Una requests.Session per thread: riusa le connessioni keep-alive senza condividere lo stato."""
+    sessione = getattr(_locale, 'sessione', None)
+    if sessione is None:
+        sessione = requests.Session()
+        sessione.headers.update(HEADERS)
+        _locale.sessione = sessione
+    return sessione
 
-def estrai_dati_nave(mmsi):
+@FETCH_MMSI.misura(funzione="estrai_dati_nave")
+def estrai_dati_nave(mmsi, sessione=None, limite_host=None, cache=None, limiter=None):
     url = f"https://www.myshiptracking.com/vessels/vessel-mmsi-{mmsi}-imo-0"
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
     logging.info(f"Richiesta dati per MMSI: {mmsi}")
     try:
-        response = requests.get(url, headers=headers, timeout=20)
+        with (limite_host.slot(url) if limite_host else nullcontext()):
+            if cache is not None:
+                response = cache.get(url, sessione or requests, headers=HEADERS, timeout=20, limiter=limiter)
+            else:
+                response = get_con_ritmo(sessione or requests, url, limiter, headers=HEADERS, timeout=20)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
         logging.error(f"ERRORE DI RETE per MMSI {mmsi}. Dettagli: {e}")
         return None
-    
+    except OSError as e:
+        logging.error(f"ERRORE CACHE per MMSI {mmsi}. Dettagli: {e}")
+        return None
+
+    # Pagina invariata (hit, 304 o stesso corpo): riuso i dati già estratti senza rifare il parsing
+    if getattr(response, 'parsed', None) is not None:
+        logging.info(f"Pagina invariata per MMSI {mmsi} ({response.esito}): riuso i dati in cache.")
+        return dict(response.parsed)
+
+    dati_base = analizza_pagina_nave(response.text, mmsi)
+    if cache is not None and dati_base is not None:
+        try:
+            cache.salva_parsed(url, dati_base)
+        except OSError as e:
+            logging.warning(f"Impossibile aggiornare la cache per MMSI {mmsi}: {e}")
+    return dati_base
+
+def analizza_pagina_nave(html, mmsi):
     try:
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Estrae sia IMO che MMSI dalla tabella dei dettagli
-        imo_trovato = 'N/A'
-        imo_header_tag = soup.find('b', string='IMO')
-        if imo_header_tag and imo_header_tag.find_parent('td') and imo_header_tag.find_parent('td').find_next_sibling('td'):
-            imo_trovato = imo_header_tag.find_parent('td').find_next_sibling('td').get_text(strip=True)
-
-        dati_base = {'MMSI': mmsi, 'IMO': imo_trovato}
-        
-        sezione_viaggi = soup.find('div', id='ft-lasttrips')
-        tabella = sezione_viaggi.find('table', class_='myst-table') if sezione_viaggi else None
-        if not tabella or not tabella.find('tbody'):
-            logging.warning(f"AVVISO: Tabella viaggi non trovata per MMSI {mmsi}. Salvo solo MMSI e IMO.")
-            return dati_base
-
-        righe = tabella.find('tbody').find_all('tr')
-        if righe:
-            prima_riga = righe[0]
-            celle = prima_riga.find_all('td')
-            if len(celle) > 5:
-                date_departure, time_departure = separa_data_ora(celle[2].get_text(strip=True))
-                date_arrival, time_arrival = separa_data_ora(celle[4].get_text(strip=True))
-                duration_cell = prima_riga.find('td', class_='table-more-td')
-                duration = duration_cell.get('data-dur', 'N/A').strip() if duration_cell else 'N/A'
-                viaggio_info = {
-                    'Origin': celle[1].get_text(strip=True),
-                    'Date Departure': date_departure,
-                    'Time Departure': time_departure,
-                    'Destination': celle[3].get_text(strip=True),
-                    'Date Arrival': date_arrival,
-                    'Time Arrival': time_arrival,
-                    'Duration': duration,
-                    'Distance': celle[5].get_text(strip=True)
-                }
-                dati_base.update(viaggio_info)
-                logging.info(f"Trovato ultimo viaggio per MMSI {mmsi}.")
-        return dati_base
+        dati_base = estrai_dati_nave_html(html, mmsi)
     except Exception as e:
         logging.error(f"ERRORE DI PARSING per MMSI {mmsi}. Dettagli: {e}")
         return None
+    if 'Origin' in dati_base:
+        logging.info(f"Trovato ultimo viaggio per MMSI {mmsi}.")
+    else:
+        logging.warning(f"AVVISO: Tabella viaggi non trovata per MMSI {mmsi}. Salvo solo MMSI e IMO.")
+    return dati_base
 
-def main():
+def estrai_dati_navi(lista_mmsi, workers=A_WORKERS, max_per_host=A_MAX_PER_HOST, cache=None, al_risultato=None, limiter=None):
+    """
+    Estrae i dati di tutti gli MMSI, in parallelo su `workers` thread.
+    L'ordine del risultato è quello di `lista_mmsi`; gli MMSI falliti (None) vengono scartati.
+    `al_risultato(dati_nave)` è chiamato nel thread principale appena ogni MMSI è pronto (es. journal).
+    """
+    if workers <= 1:
+        dati_totali = []
+        for mmsi in lista_mmsi:
+            dati_nave = estrai_dati_nave(str(mmsi), cache=cache, limiter=limiter)
+            if dati_nave is not None:
+                if al_risultato is not None:
+                    al_risultato(dati_nave)
+                dati_totali.append(dati_nave)
+        return dati_totali
+
+    limite_host = LimiteHost(max_per_host)
+
+    def _job(mmsi):
+        return estrai_dati_nave(str(mmsi), sessione=_sessione_thread(), limite_host=limite_host, cache=cache, limiter=limiter)
+
+    logging.info(f"Estrazione concorrente: {len(lista_mmsi)} MMSI, {workers} worker, max {limite_host.max_per_host} per host.")
+    risultati = [None] * len(lista_mmsi)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="estrazione") as pool:
+        futures = {pool.submit(_job, mmsi): i for i, mmsi in enumerate(lista_mmsi)}
+        for future in as_completed(futures):
+            dati_nave = future.result()
+            if dati_nave is not None and al_risultato is not None:
+                al_risultato(dati_nave)
+            risultati[futures[future]] = dati_nave
+    # ricompongo l'ordine di input, indipendentemente dall'ordine di completamento
+    return [dati_nave for dati_nave in risultati if dati_nave is not None]
+
+def main(workers=None, max_per_host=None, usa_cache=HTTP_CACHE_ATTIVA, completo=not A_SOLO_VARIAZIONI, resume=False,
+         pianifica=A_PIANIFICATORE):
+    workers = A_WORKERS if workers is None else workers
+    max_per_host = A_MAX_PER_HOST if max_per_host is None else max_per_host
 
     path_input = os.path.join(SCREPERINO_ROOT, "File_Input", "MMSI")
     path_output_base = os.path.join(SCREPERINO_ROOT, "File_Output", "Estrazioni_Giornaliere")
     path_log = os.path.join(SCREPERINO_ROOT, "Log", "Log_Estrazione.log")
+    file_impronte = os.path.join(SCREPERINO_STATO, "impronte_viaggi.json")
+    file_pianificatore = os.path.join(SCREPERINO_STATO, "pianificatore_mmsi.json")
 
     setup_logging(path_log)
     logging.info("================== AVVIO SCRIPT DI ESTRAZIONE (MMSI+IMO) ==================")
@@ -118,28 +184,122 @@ def main():
     except Exception as e:
         logging.error(f"ERRORE CRITICO: Impossibile leggere il file di input. Dettagli: {e}")
         return
+
+    # Solo gli MMSI il cui ultimo viaggio può essere cambiato (lo snapshot completo li interroga tutti).
+    # Il primo run del giorno li interroga comunque tutti: il suo file è la base completa di Estrazioni_DD_MM_YYYY.
+    pianificatore = PianificatoreMMSI(file_pianificatore, A_STALENESS_MAX_H, A_FINESTRA_CALDA_H, A_FATTORE_DURATA, A_MARGINE_H)
+    lista_run = lista_mmsi
+    if pianifica and not completo and ImpronteViaggi(file_impronte, datetime.now().date()).nuovo_giorno:
+        logging.info("Primo run del giorno: pianificatore ignorato, interrogo tutti gli MMSI.")
+    elif pianifica and not completo:
+        lista_run, rinviati = pianificatore.seleziona(lista_mmsi)
+        logging.info(f"Pianificatore: {len(lista_run)} MMSI dovuti, {len(rinviati)} rinviati "
+                     f"(ognuno interrogato almeno ogni {A_STALENESS_MAX_H}h).")
     
-    dati_totali = [dati_nave for mmsi in lista_mmsi if (dati_nave := estrai_dati_nave(str(mmsi))) is not None]
-    time.sleep(1)
+    cache = None
+    if usa_cache:
+        try:
+            cache = HttpCache()
+        except OSError as e:
+            logging.warning(f"Cache HTTP non disponibile, procedo senza. Dettagli: {e}")
+
+    # Journal dell'ora corrente: i risultati finiscono su disco appena arrivano
+    journal = JournalEstrazione(
+        os.path.join(SCREPERINO_STATO, "journal", f"estrazione_{datetime.now().strftime('%Y%m%d_%H')}.jsonl"),
+        fsync_ogni=A_JOURNAL_FSYNC_OGNI,
+    )
+    da_estrarre = lista_run
+    if resume and journal.esiste():
+        gia_estratti = journal.leggi()
+        da_estrarre = [mmsi for mmsi in lista_run if str(mmsi) not in gia_estratti]
+        logging.info(f"Resume: {len(gia_estratti)} MMSI già nel journal, ne restano {len(da_estrarre)}.")
+    journal.apri(azzera=not resume)
 
+    limiter = RateLimiterAIMD("estrazione")
+    inizio = time.monotonic()
+    try:
+        estrai_dati_navi(da_estrarre, workers=workers, max_per_host=max_per_host, cache=cache,
+                         al_risultato=journal.scrivi, limiter=limiter)
+    finally:
+        journal.chiudi()
+        limiter.salva()
+
+    # Materializzo dal journal in un solo passaggio, nell'ordine di MMSI.xlsx
+    estratti = journal.leggi()
+    dati_totali = [estratti[str(mmsi)] for mmsi in lista_run if str(mmsi) in estratti]
+    logging.info(f"Raccolti {len(dati_totali)}/{len(lista_run)} MMSI in {time.monotonic() - inizio:.1f}s.")
+    logging.info(limiter.riepilogo())
+    if cache is not None:
+        cache.log_stats()
+
+    righe_scritte = 0
     if dati_totali:
         try:
-            cartella_giornaliera = f"Estrazioni_{datetime.now().strftime('%d_%m_%Y')}"
-            path_output_giornaliero = os.path.join(path_output_base, cartella_giornaliera)
-            os.makedirs(path_output_giornaliero, exist_ok=True)
-            timestamp = datetime.now().strftime("%d_%m_%Y-%H_%M")
-            nome_file_output = f'Estrazione_Giornaliera_{timestamp}.xlsx'
-            percorso_completo_output = os.path.join(path_output_giornaliero, nome_file_output)
-            df_output = pd.DataFrame(dati_totali)
-            # Assicura che IMO sia presente e all'inizio
-            colonne_ordinate = ['MMSI', 'IMO', 'Origin', 'Date Departure', 'Time Departure', 'Destination', 'Date Arrival', 'Time Arrival', 'Duration', 'Distance']
-            df_output = df_output.reindex(columns=colonne_ordinate)
-            df_output.to_excel(percorso_completo_output, index=False)
-            logging.info(f"✅ Estrazione completata! Dati salvati in: {percorso_completo_output}")
+            adesso = datetime.now()
+            # Impronte azzerate a ogni nuovo giorno: il primo run scrive tutto, i successivi solo le variazioni
+            impronte = ImpronteViaggi(file_impronte, adesso.date())
+            variati = impronte.filtra_variati(dati_totali)
+            logging.info(f"Viaggi nuovi o cambiati: {len(variati)}/{len(dati_totali)}.")
+            dati_da_scrivere = dati_totali if completo else variati
+            if completo:
+                logging.info("Modalità snapshot completo: scrivo tutti gli MMSI raccolti.")
+
+            if dati_da_scrivere:
+                cartella_giornaliera = f"Estrazioni_{adesso.strftime('%d_%m_%Y')}"
+                path_output_giornaliero = os.path.join(path_output_base, cartella_giornaliera)
+                os.makedirs(path_output_giornaliero, exist_ok=True)
+                timestamp = adesso.strftime("%d_%m_%Y-%H_%M")
+                nome_file_output = f'Estrazione_Giornaliera_{timestamp}.xlsx'
+                percorso_completo_output = os.path.join(path_output_giornaliero, nome_file_output)
+                df_output = pd.DataFrame(dati_da_scrivere)
+                # Assicura che IMO sia presente e all'inizio
+                colonne_ordinate = ['MMSI', 'IMO', 'Origin', 'Date Departure', 'Time Departure', 'Destination', 'Date Arrival', 'Time Arrival', 'Duration', 'Distance']
+                df_output = df_output.reindex(columns=colonne_ordinate)
+                df_output.to_excel(percorso_completo_output, index=False)
+                righe_scritte = len(df_output)
+                logging.info(f"✅ Estrazione completata! Dati salvati in: {percorso_completo_output}")
+
+                # Accumulatore del giorno già deduplicato: a fine giornata evita di rileggere tutti gli xlsx
+                try:
+                    accumulatore = AccumulatoreGiornaliero(path_output_giornaliero)
+                    nuove = accumulatore.aggiungi(df_output.to_dict('records'), colonne_ordinate, nome_file_output)
+                    logging.info(f"Accumulatore giornaliero: {nuove} righe nuove su {len(df_output)}.")
+                except Exception as e:
+                    logging.warning(f"Accumulatore giornaliero non aggiornato (a fine giornata si rileggeranno gli xlsx). Dettagli: {e}")
+            else:
+                logging.info("✅ Estrazione completata: nessun viaggio cambiato dall'ultimo run, nessun file scritto.")
+
+            # aggiorno le impronte e chiudo il journal solo dopo un salvataggio riuscito
+            impronte.aggiorna(dati_totali)
+            impronte.salva()
+            pianificatore.registra(dati_totali)
+            pianificatore.salva(lista_mmsi)
+            journal.rimuovi()
         except Exception as e:
             logging.error(f"ERRORE CRITICO: Impossibile salvare il file di output. Dettagli: {e}")
+    elif not lista_run:
+        # normale tra un cambio di viaggio e l'altro: il pianificatore ha rinviato tutti gli MMSI
+        logging.info("✅ Estrazione completata: nessun MMSI dovuto in questo run, nessuna richiesta fatta.")
+        journal.rimuovi()
     else:
         logging.warning("❌ Estrazione completata, ma nessun dato è stato raccolto.")
 
+    # conteggi per lo storico dei run dell'orchestratore
+    salva_riepilogo("estrazione_giornaliera", righe_in=len(lista_run), righe_out=righe_scritte,
+                    richieste=limiter.contatori["richieste"])
+    MMSI_ESTRATTI.inc(len(dati_totali), esito="ok")
+    MMSI_ESTRATTI.inc(len(lista_run) - len(dati_totali), esito="fallito")
+    REGISTRO.scrivi("estrazione_giornaliera")
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None, help=f"Richieste MMSI in parallelo (default {A_WORKERS})")
+    parser.add_argument("--max-per-host", type=int, default=None, help=f"Richieste contemporanee per host (default {A_MAX_PER_HOST})")
+    parser.add_argument("--no-cache", action="store_true", help="Ignora la cache HTTP su disco")
+    parser.add_argument("--completo", action="store_true", help="Scrive tutti gli MMSI, non solo i viaggi cambiati (audit)")
+    parser.add_argument("--resume", action="store_true", help="Riprende l'ora corrente saltando gli MMSI già nel journal")
+    parser.add_argument("--tutti", action="store_true", help="Ignora il pianificatore e interroga tutti gli MMSI")
+    args = parser.parse_args()
+    main(workers=args.workers, max_per_host=args.max_per_host, usa_cache=HTTP_CACHE_ATTIVA and not args.no_cache,
+         completo=args.completo or not A_SOLO_VARIAZIONI, resume=args.resume,
+         pianifica=A_PIANIFICATORE and not args.tutti)
@@ -0,0 +1,54 @@
+# impronte_viaggi.py
+"""
+Impronte per-MMSI dell'ultimo viaggio, per scrivere nei file orari solo i viaggi nuovi o cambiati.
+
+L'impronta è un hash di Origin, partenza (data+ora), Destination e arrivo (data+ora).
+Lo stato è persistito in Stato/impronte_viaggi.json ed è azzerato a ogni cambio di giorno:
+il primo run del giorno scrive quindi tutti gli MMSI, così la cartella Estrazioni_DD_MM_YYYY
+resta autosufficiente per pulisci_giornaliera (che unisce e deduplica solo i file di quel giorno).
+Per questo estrazione_giornaliera ignora il pianificatore finché `nuovo_giorno` è vero
+(nessun salvataggio riuscito per la data corrente) e interroga tutti gli MMSI.
+"""
+
+import hashlib
+import json
+import os
+from datetime import date
+
+CAMPI_IMPRONTA = ('Origin', 'Date Departure', 'Time Departure', 'Destination', 'Date Arrival', 'Time Arrival')
+
+
+def impronta(dati_nave):
+    testo = '|'.join(str(dati_nave.get(campo, '')) for campo in CAMPI_IMPRONTA)
+    return hashlib.sha1(testo.encode('utf-8')).hexdigest()[:16]
+
+
+class ImpronteViaggi:
+    def __init__(self, path, giorno: date | None = None):
+        self.path = str(path)
+        self.giorno = (giorno or date.today()).isoformat()
+        self.impronte = {}
+        self.nuovo_giorno = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stato = json.load(f)
+            if stato.get('giorno') == self.giorno:
+                self.impronte = stato.get('impronte', {})
+                self.nuovo_giorno = False
+        except (OSError, ValueError):
+            pass
+
+    def filtra_variati(self, dati_totali):
+        """Ritorna solo le righe il cui ultimo viaggio è nuovo o diverso dall'ultima volta (stato non modificato)."""
+        return [d for d in dati_totali if self.impronte.get(str(d['MMSI'])) != impronta(d)]
+
+    def aggiorna(self, dati_totali):
+        for d in dati_totali:
+            self.impronte[str(d['MMSI'])] = impronta(d)
+
+    def salva(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'giorno': self.giorno, 'impronte': self.impronte}, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,78 @@
+# journal_estrazione.py
+"""
+Journal append-only dell'estrazione oraria: una riga JSON per MMSI estratto con successo.
+
+- Ogni risultato è scritto appena arriva (flush immediato, fsync ogni `fsync_ogni` righe e in chiusura),
+  così un crash a metà run perde al massimo le ultime righe non sincronizzate.
+- Con --resume lo script rilegge il journal dell'ora corrente e salta gli MMSI già presenti.
+- Un'eventuale ultima riga troncata dal crash viene ignorata in lettura.
+- Il file è rimosso solo dopo che l'xlsx dell'ora è stato scritto.
+"""
+
+import json
+import logging
+import os
+
+
+class JournalEstrazione:
+    def __init__(self, path, fsync_ogni=50):
+        self.path = str(path)
+        self.fsync_ogni = max(1, int(fsync_ogni))
+        self._file = None
+        self._da_sincronizzare = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def esiste(self):
+        return os.path.exists(self.path)
+
+    def leggi(self):
+        """Ritorna {MMSI: dati_nave} dal journal; in caso di righe ripetute vale l'ultima."""
+        risultati = {}
+        if not self.esiste():
+            return risultati
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for numero, riga in enumerate(f, start=1):
+                riga = riga.strip()
+                if not riga:
+                    continue
+                try:
+                    dati_nave = json.loads(riga)
+                    risultati[str(dati_nave['MMSI'])] = dati_nave
+                except (ValueError, KeyError, TypeError):
+                    logging.warning(f"Journal {os.path.basename(self.path)}: riga {numero} illeggibile, ignorata.")
+        return risultati
+
+    def apri(self, azzera=False):
+        troncato = False
+        if not azzera and self.esiste() and os.path.getsize(self.path) > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                troncato = f.read(1) != b'\n'
+        self._file = open(self.path, 'w' if azzera else 'a', encoding='utf-8')
+        if troncato:
+            # chiudo la riga parziale lasciata dal crash, così il prossimo record resta leggibile
+            self._file.write('\n')
+
+    def scrivi(self, dati_nave):
+        self._file.write(json.dumps(dati_nave, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self._da_sincronizzare += 1
+        if self._da_sincronizzare >= self.fsync_ogni:
+            os.fsync(self._file.fileno())
+            self._da_sincronizzare = 0
+
+    def chiudi(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._da_sincronizzare = 0
+
+    def rimuovi(self):
+        self.chiudi()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
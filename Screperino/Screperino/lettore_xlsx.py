@@ -0,0 +1,74 @@
+# lettore_xlsx.py
+"""
+Lettura xlsx condivisa dagli script EOD (pulisci_giornaliera, pulisci_bot, unione_finale).
+
+- Motore: calamine (pacchetto python-calamine, pandas >= 2.2) se installato, altrimenti openpyxl.
+- Più file: letti in parallelo in un pool di processi (XLSX_WORKERS); sotto XLSX_POOL_MIN_BYTES
+  totali si legge in sequenza, perché l'avvio dei processi costerebbe più della lettura.
+- usecols/dtype vengono passati a read_excel, così si decodificano solo le colonne utili.
+  ColonneNormalizzate permette di selezionare le colonne per nome normalizzato (strip + lower).
+
+Gli errori non interrompono la lettura degli altri file: ogni risultato è (path, df|None, errore|None).
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from config import XLSX_WORKERS, XLSX_POOL_MIN_BYTES
+
+try:
+    import python_calamine  # noqa: F401
+    MOTORE = "calamine"
+except ImportError:
+    MOTORE = "openpyxl"
+
+
+class ColonneNormalizzate:
+    """usecols per nome normalizzato: tiene la colonna se str(col).strip().lower() è tra `nomi` (picklabile)."""
+
+    def __init__(self, nomi):
+        self.nomi = frozenset(nomi)
+
+    def __call__(self, colonna):
+        return str(colonna).strip().lower() in self.nomi
+
+
+def file_validi(paths):
+    """Scarta i temporanei di Excel (~$...)."""
+    return [p for p in paths if not os.path.basename(p).startswith("~$")]
+
+
+def leggi_excel(path, **kwargs):
+    """pd.read_excel con il motore più veloce disponibile (sovrascrivibile con engine=...)."""
+    kwargs.setdefault("engine", MOTORE)
+    return pd.read_excel(path, **kwargs)
+
+
+def _leggi_sicuro(path, kwargs):
+    try:
+        return path, leggi_excel(path, **kwargs), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def leggi_excel_multipli(paths, max_workers=XLSX_WORKERS, **kwargs):
+    """
+    Legge più xlsx con gli stessi parametri read_excel.
+    Ritorna [(path, df | None, errore | None)] nell'ordine di `paths`.
+    """
+    paths = [str(p) for p in file_validi(paths)]
+    try:
+        totale = sum(os.path.getsize(p) for p in paths)
+    except OSError:
+        totale = 0  # file mancanti: l'errore lo riporterà la lettura
+
+    if max_workers > 1 and len(paths) > 1 and totale >= XLSX_POOL_MIN_BYTES:
+        try:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+                return list(pool.map(_leggi_sicuro, paths, [kwargs] * len(paths)))
+        except Exception as e:
+            logging.warning(f"Lettura parallela non disponibile ({e}): leggo in sequenza.")
+    return [_leggi_sicuro(p, kwargs) for p in paths]
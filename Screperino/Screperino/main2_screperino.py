@@ -1,12 +1,18 @@
-import os, sys, time, subprocess, logging
+import os, sys, time, subprocess, logging, threading, sqlite3
 from logging.handlers import RotatingFileHandler
 from datetime import datetime, timedelta, date
 import bootstrap
+from pipeline_eod import STADI_EOD, OK, esegui_pipeline
+from memo_eod import esegui_memoizzato
 
 from config import (
     PYTHON_A, PYTHON_B, A_DIR, B_FILE, LOG_DIR, LAST_B, LAST_EOD,
-    EOD_HOUR, EOD_MIN, B_EVERY_H, A_MINUTE, ensure_dirs
+    EOD_HOUR, EOD_MIN, B_EVERY_H, A_MINUTE, EOD_MEMO_ATTIVA, ORCH_RESIDENTE,
+    ORCH_INATTIVITA_A_SEC, ORCH_INATTIVITA_EOD_SEC, ORCH_INATTIVITA_B_SEC, METRICHE_HTTP_PORTA, ensure_dirs
 )
+from stream_runner import esegui_streaming
+from storico_run import StoricoRun, leggi_riepilogo
+from metriche import REGISTRO, avvia_server
 
 # prepara log-dir
 ensure_dirs()
@@ -26,38 +32,143 @@ sh.setFormatter(fmt)
 logger.addHandler(sh)
 
 # ===== Util per subprocess con log =====
-def run_and_log(cmd, cwd):
+def run_and_log(cmd, cwd, prefix=None, inactivity_sec=ORCH_INATTIVITA_EOD_SEC):
     """
-    Esegue un comando, logga stdout/stderr e solleva CalledProcessError se returncode != 0.
+    Esegue un comando loggando stdout (INFO) e stderr (ERROR) riga per riga con un prefisso,
+    e solleva CalledProcessError se returncode != 0 (anche se terminato dal watchdog di inattività).
     """
+    prefix = prefix or os.path.splitext(os.path.basename(cmd[1] if len(cmd) > 1 else cmd[0]))[0]
     logger.info(f"Eseguo: {cmd} (cwd={cwd})")
-    res = subprocess.run(cmd, cwd=cwd, text=True, capture_output=True)
-    if res.stdout:
-        logger.info(res.stdout.strip())
-    if res.stderr:
-        logger.error(res.stderr.strip())
+    res = esegui_streaming(cmd, cwd, logger, prefisso=prefix, inattivita_sec=inactivity_sec)
     if res.returncode != 0:
-        raise subprocess.CalledProcessError(res.returncode, cmd, output=res.stdout, stderr=res.stderr)
+        raise subprocess.CalledProcessError(res.returncode, cmd, output=res.testo_coda)
+
+# ===== Worker residenti (ORCH_RESIDENTE) =====
+_pool_residente = None
+_lock_pool = threading.Lock()
+
+def get_pool():
+    """Pool di worker caldi, creato al primo uso (solo con ORCH_RESIDENTE)."""
+    global _pool_residente
+    with _lock_pool:
+        if _pool_residente is None:
+            from worker_residente import PoolResidente
+            _pool_residente = PoolResidente(logger)
+        return _pool_residente
+
+def close_pool():
+    global _pool_residente
+    with _lock_pool:
+        if _pool_residente is not None:
+            _pool_residente.chiudi()
+            _pool_residente = None
+
+def run_resident_and_log(job: str, day: date | None = None, inactivity_sec=ORCH_INATTIVITA_EOD_SEC):
+    """
+    Come run_and_log, ma esegue il job in un worker residente (output riga per riga, stesso watchdog).
+    Solleva CalledProcessError se il job termina con rc != 0.
+    """
+    logger.info(f"Eseguo (residente): {job} {day.isoformat() if day else ''}".rstrip())
+    res = get_pool().esegui(job, day, prefisso=job, inattivita_sec=inactivity_sec)
+    if res.returncode != 0:
+        raise subprocess.CalledProcessError(res.returncode, f"[residente] {job}", output=res.testo_coda)
+
+# ===== Storico dei run (storico_run) =====
+_storico = None
+
+# job dell'orchestratore -> nome con cui lo script salva il proprio riepilogo
+SCRIPT_JOB = {"A": "estrazione_giornaliera"}
+
+# metriche dei job (A, B, EOD e stadi EOD), scritte in orchestratore.prom dopo ogni job
+JOB_SECONDI = REGISTRO.istogramma("job_secondi", "Durata dei job dell'orchestratore", ["lavoro", "esito"])
+JOB_ULTIMA_DURATA = REGISTRO.gauge("job_ultima_durata_secondi", "Durata dell'ultimo run del job", ["lavoro"])
+JOB_RIGHE = REGISTRO.contatore("job_righe_totale", "Righe lette/scritte dai job", ["lavoro", "verso"])
+JOB_RICHIESTE = REGISTRO.contatore("job_richieste_totale", "Richieste HTTP fatte dai job", ["lavoro"])
+
+def get_storico():
+    """StoricoRun condiviso, aperto al primo uso (None se il DB non è utilizzabile)."""
+    global _storico
+    if _storico is None:
+        try:
+            _storico = StoricoRun()
+        except sqlite3.Error as e:
+            logger.warning(f"Storico run non disponibile: {e}")
+    return _storico
+
+def history_start(job: str, day: date | None = None):
+    """Registra l'avvio di un job nello storico; ritorna l'handle per history_end."""
+    run_id = None
+    storico = get_storico()
+    if storico is not None:
+        try:
+            run_id = storico.inizia(job, day)
+        except sqlite3.Error as e:
+            logger.warning(f"Storico run: avvio di {job} non registrato ({e}).")
+    return run_id, job, day, time.time(), time.monotonic()
+
+def history_end(handle, rc, esito: str, note: str | None = None):
+    """
+    Chiude la riga del job aggiungendo i conteggi del riepilogo scritto dallo script (se presente)
+    e aggiorna le metriche dell'orchestratore.
+    """
+    run_id, job, day, avvio, inizio = handle
+    riepilogo = leggi_riepilogo(SCRIPT_JOB.get(job, job), day, dal=avvio - 1) or {}
+    if run_id is not None:
+        try:
+            get_storico().termina(run_id, rc, esito, riepilogo.get("righe_in"), riepilogo.get("righe_out"),
+                                  riepilogo.get("richieste"), note)
+        except sqlite3.Error as e:
+            logger.warning(f"Storico run: esito di {job} non registrato ({e}).")
+
+    durata = time.monotonic() - inizio
+    JOB_SECONDI.osserva(durata, lavoro=job, esito=esito)
+    JOB_ULTIMA_DURATA.imposta(round(durata, 3), lavoro=job)
+    for verso in ("in", "out"):
+        if riepilogo.get(f"righe_{verso}") is not None:
+            JOB_RIGHE.inc(riepilogo[f"righe_{verso}"], lavoro=job, verso=verso)
+    if riepilogo.get("richieste") is not None:
+        JOB_RICHIESTE.inc(riepilogo["richieste"], lavoro=job)
+    REGISTRO.scrivi("orchestratore")
+
+def _history_last(query):
+    storico = get_storico()
+    if storico is None:
+        return None
+    try:
+        return query(storico)
+    except (sqlite3.Error, ValueError) as e:
+        logger.warning(f"Storico run non leggibile, uso i file di stato: {e}")
+        return None
 
 # ===== Persistenza ultimi run =====
 def read_last_b():
+    """Fine dell'ultimo B riuscito: dallo storico dei run, con LAST_B come riserva (il più recente dei due)."""
+    dal_file = None
     try:
         with open(LAST_B, "r", encoding="utf-8") as f:
-            return datetime.fromisoformat(f.read().strip())
+            dal_file = datetime.fromisoformat(f.read().strip())
     except Exception:
-        return None
+        pass
+    dallo_storico = _history_last(lambda s: s.ultima_fine("B"))
+    return max((t for t in (dallo_storico, dal_file) if t is not None), default=None)
 
 def write_last_b(ts: datetime):
     with open(LAST_B, "w", encoding="utf-8") as f:
         f.write(ts.isoformat())
 
 def read_last_eod():
-    """Ritorna la *data* (date) dell’ultimo EOD eseguito, oppure None."""
+    """
+    Ritorna la *data* (date) dell’ultimo EOD eseguito, oppure None.
+    Dallo storico dei run (giorno più recente con EOD riuscito), con LAST_EOD come riserva.
+    """
+    dal_file = None
     try:
         with open(LAST_EOD, "r", encoding="utf-8") as f:
-            return datetime.fromisoformat(f.read().strip()).date()
+            dal_file = datetime.fromisoformat(f.read().strip()).date()
     except Exception:
-        return None
+        pass
+    dallo_storico = _history_last(lambda s: s.ultimo_giorno("EOD"))
+    return max((d for d in (dallo_storico, dal_file) if d is not None), default=None)
 
 def write_last_eod_for_day(day: date):
     """
@@ -68,28 +179,76 @@ def write_last_eod_for_day(day: date):
         ts = datetime.combine(day, datetime.min.time())
         f.write(ts.isoformat())
 
+_lock_last_eod = threading.Lock()
+
+def advance_last_eod(day: date):
+    """
+    Come write_last_eod_for_day, ma non torna mai indietro: un backfill di date vecchie
+    (anche in parallelo) non deve far credere all'orchestratore che l'EOD recente manchi.
+    """
+    with _lock_last_eod:
+        last = read_last_eod()
+        if last is None or day >= last:
+            write_last_eod_for_day(day)
+
 # ===== EOD =====
-def run_eod_for_date(target_date: date):
+def run_eod_stage(stage: str, target_date: date, force: bool = False):
     """
-    Esegue gli script EOD per una data specifica (oggi o catch-up di ieri).
-    Passa la data a pulisci_giornaliera.py come 'YYYY-MM-DD'.
+    Esegue uno stadio della catena EOD (script in A_DIR) per la data indicata.
+    Con EOD_MEMO_ATTIVA lo stadio viene saltato se input e codice sono identici all'ultimo run (memo_eod).
     """
+    script = STADI_EOD[stage][0]
+    cmd = [PYTHON_A, os.path.join(A_DIR, script), target_date.isoformat()]
+    if ORCH_RESIDENTE:
+        esegui = lambda: run_resident_and_log(stage, target_date)
+    else:
+        esegui = lambda: run_and_log(cmd, A_DIR)
+    handle = history_start(stage, target_date)
     try:
-        logger.info(f"EOD: avvio pulizia/unione per la data {target_date.isoformat()}.")
-        # pulizia giornaliera con data specifica (il tuo script la supporta)
-        run_and_log([PYTHON_A, os.path.join(A_DIR, "pulisci_giornaliera.py"), target_date.isoformat()], A_DIR)
+        if EOD_MEMO_ATTIVA:
+            reused = esegui_memoizzato(stage, target_date, esegui, logger, forza=force)
+        else:
+            esegui()
+            reused = False
+    except subprocess.CalledProcessError as e:
+        history_end(handle, e.returncode, "errore")
+        raise
+    except Exception as e:
+        history_end(handle, None, "errore", note=str(e)[:500])
+        raise
+    history_end(handle, 0, "riusato" if reused else "ok")
 
-        # gli altri due come prima (se un giorno servirà la data, estendili in modo analogo)
-        run_and_log([PYTHON_A, os.path.join(A_DIR, "pulisci_bot.py"), target_date.isoformat()], A_DIR)
-        run_and_log([PYTHON_A, os.path.join(A_DIR, "unione_finale.py"), target_date.isoformat()], A_DIR)
+def run_eod_for_date(target_date: date, force: bool = False) -> bool:
+    """
+    Esegue gli script EOD per una data specifica (oggi, catch-up di ieri o backfill).
+    Gli stadi seguono il grafo di pipeline_eod: pulisci_giornaliera e pulisci_bot in parallelo,
+    unione_finale appena entrambi sono riusciti. Tempi per stadio in orchestratore.log.
+    force=True riesegue anche gli stadi con input invariati.
+    Ritorna True se tutti gli stadi sono terminati con successo.
+    """
+    handle = history_start("EOD", target_date)
+    try:
+        logger.info(f"EOD: avvio pulizia/unione per la data {target_date.isoformat()}.")
+        inizio = time.monotonic()
+        esiti = esegui_pipeline(target_date, lambda stage, day: run_eod_stage(stage, day, force), logger)
+        riepilogo = ", ".join(f"{nome}={esito} {durata:.1f}s" for nome, (esito, durata, _) in esiti.items())
+        logger.info(f"EOD {target_date.isoformat()}: {riepilogo} | totale {time.monotonic() - inizio:.1f}s")
+
+        falliti = [nome for nome, (esito, _, _) in esiti.items() if esito != OK]
+        if falliti:
+            logger.error(f"EOD: non completato per la data {target_date.isoformat()}.")
+            history_end(handle, 1, "errore", note="non completati: " + ", ".join(falliti))
+            return False
 
-        # scrivo la *data processata* (non l'istante di esecuzione)
-        write_last_eod_for_day(target_date)
+        # scrivo la *data processata* (non l'istante di esecuzione), senza mai tornare indietro
+        history_end(handle, 0, "ok")
+        advance_last_eod(target_date)
         logger.info(f"EOD completato per la data {target_date.isoformat()}.")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"EOD: script fallito (rc={e.returncode}) -> {e.cmd}")
+        return True
     except Exception as e:
         logger.error(f"EOD: errore inatteso: {e}")
+        history_end(handle, None, "errore", note=str(e)[:500])
+    return False
 
 def maybe_run_eod():
     """
@@ -149,45 +308,76 @@ def sleep_until_next_A():
     delta = (next_run - datetime.now()).total_seconds()
     logger.info(f"Sleep fino a {next_run.strftime('%d-%m %H:%M:%S')} (~{int(delta)}s)")
     time.sleep(max(0, delta))
+    return next_run
 
 def run_A_once():
     # Esegue l’equivalente di compito_estrazione_oraria()
     cmd = [PYTHON_A, os.path.join(A_DIR, "estrazione_giornaliera.py")]
+    if ORCH_RESIDENTE:
+        return run_A_resident()
     logger.info(f"Eseguo A: {cmd}")
+    handle = history_start("A")
     try:
-        subprocess.run(cmd, cwd=A_DIR, check=True)
-        logger.info("A OK")
-        return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"A exit {e.returncode}")
+        # A logga su stderr (StreamHandler): un solo flusso a livello INFO, come gestore2 con screp/elaboratore
+        res = esegui_streaming(cmd, A_DIR, logger, prefisso="A", inattivita_sec=ORCH_INATTIVITA_A_SEC,
+                               unisci_stderr=True)
+        if res.returncode == 0:
+            logger.info("A OK")
+            history_end(handle, 0, "ok")
+            return True
+        if res.inattivo:
+            logger.error("A terminato dal watchdog di inattività.")
+        logger.error(f"A exit {res.returncode}")
+        history_end(handle, res.returncode, "errore", note="inattività" if res.inattivo else None)
+    except Exception as e:
+        logger.error(f"A errore: {e}")
+        history_end(handle, None, "errore", note=str(e)[:500])
+    return False
+
+def run_A_resident():
+    # A in un worker caldo: output riga per riga con prefisso [A] (il log resta Log_Estrazione.log)
+    logger.info("Eseguo A (residente)")
+    handle = history_start("A")
+    try:
+        res = get_pool().esegui("A", prefisso="A", inattivita_sec=ORCH_INATTIVITA_A_SEC, unisci_stderr=True)
+        rc = res.returncode
+        history_end(handle, rc, "ok" if rc == 0 else "errore", note="inattività" if res.inattivo else None)
+        if rc == 0:
+            logger.info("A OK")
+            return True
+        logger.error(f"A exit {rc}")
     except Exception as e:
         logger.error(f"A errore: {e}")
+        history_end(handle, None, "errore", note=str(e)[:500])
     return False
 
 def run_B_once():
     # Richiede che il gestore B supporti --once e usi rc=111 per 'SKIPPED (LOCK)'
     cmd = [PYTHON_B, B_FILE, "--once"]
     logger.info(f"Eseguo B (once): {cmd}")
+    handle = history_start("B")
     try:
-        res = subprocess.run(cmd, cwd=os.path.dirname(B_FILE), text=True, capture_output=True)
-        if res.stdout:
-            logger.info(res.stdout.strip())
-        if res.stderr:
-            logger.error(res.stderr.strip())
-
+        res = esegui_streaming(cmd, os.path.dirname(B_FILE), logger, prefisso="B",
+                               inattivita_sec=ORCH_INATTIVITA_B_SEC)
         rc = res.returncode
+        if res.inattivo:
+            logger.error("B terminato dal watchdog di inattività.")
         if rc == 0:
             logger.info("B DONE")
+            history_end(handle, rc, "ok")
             write_last_b(datetime.now())  # aggiorna SOLO se ha eseguito davvero
             return True
         elif rc == 111:
             logger.info("B SKIPPED (LOCK)")
+            history_end(handle, rc, "lock")
             return False
         else:
             logger.error(f"B ERROR rc={rc}")
+            history_end(handle, rc, "errore", note="inattività" if res.inattivo else None)
             return False
     except Exception as e:
         logger.error(f"B errore: {e}")
+        history_end(handle, None, "errore", note=str(e)[:500])
         return False
 
 def should_run_B():
@@ -196,6 +386,60 @@ def should_run_B():
         return True
     return datetime.now() - last >= timedelta(hours=B_EVERY_H)
 
+class BackgroundB:
+    """
+    B (gestore2 --once) come job in background supervisionato dal loop principale:
+    A mantiene la cadenza a :05 mentre B è in volo. run_B_once resta invariato
+    (LAST_B aggiornato solo a B completato con rc 0, rc 111 = lock di un altro B).
+    Metriche nel log: ritardo di avvio rispetto alla scadenza, durata, run di A sovrapposti.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._start = None
+        self._result = None
+        self.overlapped_A = 0
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        last = read_last_b()
+        if last is not None:
+            lag = datetime.now() - (last + timedelta(hours=B_EVERY_H))
+            logger.info(f"B: avvio in background (ritardo sulla scadenza {int(lag.total_seconds() // 60)} min).")
+        else:
+            logger.info("B: avvio in background (nessun run precedente).")
+        self._start = time.monotonic()
+        self._result = None
+        self.overlapped_A = 0
+        self._thread = threading.Thread(target=self._run, name="B-background", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        self._result = run_B_once()
+
+    def note_A(self, seconds: float):
+        """Da chiamare dopo ogni A: conta i run di A eseguiti mentre B era in volo."""
+        if self.running():
+            self.overlapped_A += 1
+            logger.info(f"B in volo da {int((time.monotonic() - self._start) // 60)} min: "
+                        f"A eseguito in sovrapposizione ({seconds:.0f}s, #{self.overlapped_A}).")
+
+    def poll(self):
+        """Raccoglie l'esito di un B terminato (una sola volta). Ritorna True/False se appena concluso, None altrimenti."""
+        if self._thread is None or self._thread.is_alive():
+            return None
+        self._thread = None
+        duration = time.monotonic() - self._start
+        logger.info(f"B: concluso in background ({'DONE' if self._result else 'non eseguito/errore'}) "
+                    f"in {duration / 60:.1f} min, run di A sovrapposti: {self.overlapped_A}.")
+        return self._result
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
 def sanity_checks():
     assert os.path.isdir(A_DIR), f"A_DIR non esiste: {A_DIR}"
     assert os.path.isfile(os.path.join(A_DIR, "estrazione_giornaliera.py")), \
@@ -208,19 +452,32 @@ def sanity_checks():
 def main():
     sanity_checks()
     logger.info("=== Orchestratore LEAN avviato (h24/7) ===")
+    if METRICHE_HTTP_PORTA:
+        try:
+            avvia_server(METRICHE_HTTP_PORTA)
+            logger.info(f"Metriche su http://127.0.0.1:{METRICHE_HTTP_PORTA}/metrics")
+        except OSError as e:
+            logger.warning(f"Endpoint metriche non avviato sulla porta {METRICHE_HTTP_PORTA}: {e}")
 
     # Se avvii dopo la finestra EOD, fa subito l'EOD (e catch-up se serve)
     maybe_run_eod()
 
+    b_job = BackgroundB()
     while True:
         try:
-            sleep_until_next_A()
+            scheduled = sleep_until_next_A()
+            lag_A = (datetime.now() - scheduled).total_seconds()
+            if lag_A >= 60:
+                logger.warning(f"A: avvio in ritardo di {int(lag_A)}s sullo slot delle {scheduled.strftime('%H:%M')}.")
+            start_A = time.monotonic()
             okA = run_A_once()
+            b_job.note_A(time.monotonic() - start_A)
 
-            # dopo A, se servono le 4h lancia B
-            if okA and should_run_B():
+            # dopo A, se servono le 4h lancia B in background (uno alla volta)
+            b_job.poll()
+            if okA and not b_job.running() and should_run_B():
                 logger.info("Sono passate >= 4h dall'ultimo B: avvio B.")
-                run_B_once()
+                b_job.start()
 
             # dopo A/B valuta l'EOD (e se sei tra 23:00 e EOD_MIN-1, attende fino all'orario EOD)
             maybe_run_eod()
@@ -232,6 +489,9 @@ def main():
         except Exception as e:
             logger.error(f"Errore inatteso in main loop: {e}")
             time.sleep(30)
+    if b_job.running():
+        logger.info("B ancora in volo alla chiusura: il gestore termina da solo e rilascia il suo lock.")
+    close_pool()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
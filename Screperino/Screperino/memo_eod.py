@@ -0,0 +1,214 @@
+# memo_eod.py
+"""
+Memoizzazione degli stadi EOD in base al contenuto degli input.
+
+Accanto all'output di ogni stadio viene salvato un manifest <output>.manifest.json:
+  {
+    "versione": 1, "stadio", "giorno",
+    "input":  {path: {"size", "mtime", "sha1"}},   # file dati + script dello stadio + config.py
+    "output": {"path", "size", "mtime", "sha1", "righe"},
+    "storico": [{"quando", "esito": "eseguito" | "riusato", "secondi", "righe"}, ...]
+  }
+
+Se al rerun (catch-up, rilancio a mano, backfill) gli input hanno lo stesso contenuto e l'output
+è ancora quello registrato, lo stadio viene saltato e l'output riusato.
+Per non rileggere tutto a ogni controllo, lo sha1 viene ricalcolato solo per i file con
+size/mtime diversi da quelli del manifest.
+
+Lo storico (ultimi EOD_MEMO_STORICO run) con durate e righe rende visibili le regressioni.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+from config import SCREPERINO_ROOT, BASE_DIR, EOD_MEMO_STORICO
+
+VERSIONE = 1
+DIR_SCRIPT = os.path.dirname(os.path.abspath(__file__))
+OUTPUT = os.path.join(SCREPERINO_ROOT, "File_Output")
+INPUT = os.path.join(SCREPERINO_ROOT, "File_Input")
+
+# moduli locali da cui dipende ogni stadio (un cambio di codice invalida il manifest)
+SCRIPT_STADIO = {
+    "pulisci_giornaliera": ["pulisci_giornaliera.py", "accumulatore_giornaliero.py", "lettore_xlsx.py"],
+    "pulisci_bot":         ["pulisci_bot.py", "catalogo_bot.py", "lettore_xlsx.py"],
+    "unione_finale":       ["unione_finale.py", "statici_compilati.py", "lettore_xlsx.py"],
+}
+
+
+def _xlsx(cartella):
+    return sorted(f for f in glob.glob(os.path.join(cartella, "*.xlsx")) if not os.path.basename(f).startswith("~$"))
+
+
+def output_stadio(stadio, giorno):
+    d = giorno.strftime("%d-%m-%Y")
+    return {
+        "pulisci_giornaliera": os.path.join(OUTPUT, "Estrazioni_Giornaliere_Pulite", f"Giornaliera_Pulita_{d}.xlsx"),
+        "pulisci_bot":         os.path.join(OUTPUT, "Bot_Pulito", f"Bot_Pulito_{d}.xlsx"),
+        "unione_finale":       os.path.join(OUTPUT, "Master", f"MASTER_{d}.xlsx"),
+    }[stadio]
+
+
+def input_stadio(stadio, giorno):
+    """Tutti i file da cui dipende l'output di `stadio` per `giorno` (dati + codice)."""
+    if stadio == "pulisci_giornaliera":
+        dati = _xlsx(os.path.join(OUTPUT, "Estrazioni_Giornaliere", f"Estrazioni_{giorno.strftime('%d_%m_%Y')}"))
+    elif stadio == "pulisci_bot":
+        dati = _xlsx(os.path.join(INPUT, "Bot"))
+    elif stadio == "unione_finale":
+        dati = [
+            output_stadio("pulisci_giornaliera", giorno),
+            output_stadio("pulisci_bot", giorno),
+            os.path.join(INPUT, "Statici", "MASTER_IHS FINALE.xlsx"),
+            os.path.join(INPUT, "Statici", "DECODIFICA_FINALE.xlsx"),
+        ]
+    else:
+        raise ValueError(f"Stadio EOD sconosciuto: {stadio}")
+    codice = [os.path.join(DIR_SCRIPT, s) for s in SCRIPT_STADIO[stadio]] + [os.path.join(BASE_DIR, "config.py")]
+    return dati + codice
+
+
+def sha1_file(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for blocco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(blocco)
+    return h.hexdigest()
+
+
+def impronta(path, nota=None):
+    """{'size', 'mtime', 'sha1'} di `path` (None se non esiste); riusa lo sha1 di `nota` se size/mtime coincidono."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if nota and nota.get("size") == st.st_size and nota.get("mtime") == st.st_mtime:
+        return dict(nota)
+    return {"size": st.st_size, "mtime": st.st_mtime, "sha1": sha1_file(path)}
+
+
+def righe_xlsx(path):
+    """Righe dati del primo foglio lette dalla dimensione del foglio (senza caricare le celle)."""
+    try:
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True)
+        try:
+            max_row = wb.worksheets[0].max_row
+        finally:
+            wb.close()
+        return max(0, max_row - 1) if max_row else None
+    except Exception:
+        return None
+
+
+class ManifestStadio:
+    def __init__(self, stadio, giorno):
+        self.stadio = stadio
+        self.giorno = giorno
+        self.path_output = output_stadio(stadio, giorno)
+        self.path = self.path_output + ".manifest.json"
+        self.dati = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                dati = json.load(f)
+            if dati.get("versione") == VERSIONE:
+                self.dati = dati
+        except (OSError, ValueError):
+            pass
+
+    def impronte_input(self):
+        note = self.dati.get("input", {})
+        return {p: impronta(p, note.get(p)) for p in input_stadio(self.stadio, self.giorno)}
+
+    def riusabile(self):
+        """Ritorna (True, motivo) se l'output registrato è ancora valido per gli input attuali."""
+        if not self.dati:
+            return False, "nessun manifest"
+        uscita = self.dati.get("output") or {}
+        attuale = impronta(self.path_output, uscita)
+        if attuale is None:
+            return False, "output mancante"
+        if attuale.get("sha1") != uscita.get("sha1"):
+            return False, "output modificato"
+        registrati = self.dati.get("input", {})
+        attuali = {p: i for p, i in self.impronte_input().items() if i is not None}
+        for path in set(registrati) | set(attuali):
+            if (attuali.get(path) or {}).get("sha1") != (registrati.get(path) or {}).get("sha1"):
+                stato = "nuovo" if path not in registrati else "rimosso" if path not in attuali else "cambiato"
+                return False, f"input {stato}: {os.path.basename(path)}"
+        return True, "input invariati"
+
+    def _salva(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.dati, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def _storico(self, esito, secondi, righe):
+        storico = self.dati.get("storico", [])
+        storico.append({
+            "quando": datetime.now().isoformat(timespec="seconds"),
+            "esito": esito,
+            "secondi": round(secondi, 2),
+            "righe": righe,
+        })
+        self.dati["storico"] = storico[-EOD_MEMO_STORICO:]
+
+    def registra_esecuzione(self, secondi, impronte_input, avvio):
+        """
+        Dopo un run riuscito: fotografa input (presi prima del run) e output.
+        Se lo stadio non ha (ri)scritto l'output dopo `avvio` (es. nessun dato) il manifest non viene registrato.
+        """
+        uscita = impronta(self.path_output)
+        if uscita is None or uscita["mtime"] < avvio:
+            return None
+        uscita["righe"] = righe_xlsx(self.path_output)
+        storico = self.dati.get("storico", [])
+        self.dati = {
+            "versione": VERSIONE,
+            "stadio": self.stadio,
+            "giorno": self.giorno.isoformat(),
+            "input": {p: i for p, i in impronte_input.items() if i is not None},
+            "output": dict(uscita, path=self.path_output),
+            "storico": storico,
+        }
+        self._storico("eseguito", secondi, uscita["righe"])
+        self._salva()
+        return uscita["righe"]
+
+    def registra_riuso(self):
+        self._storico("riusato", 0.0, (self.dati.get("output") or {}).get("righe"))
+        self._salva()
+
+
+def esegui_memoizzato(stadio, giorno, esegui, logger, forza=False):
+    """
+    Esegue `esegui()` solo se gli input di `stadio` per `giorno` sono cambiati dall'ultimo run riuscito.
+    Ritorna True se lo stadio è stato riusato senza eseguirlo.
+    """
+    manifest = ManifestStadio(stadio, giorno)
+    if not forza:
+        ok, motivo = manifest.riusabile()
+        if ok:
+            logger.info(f"EOD {giorno.isoformat()}: stadio {stadio} riusato ({motivo}).")
+            try:
+                manifest.registra_riuso()
+            except OSError as e:
+                logger.warning(f"EOD {giorno.isoformat()}: manifest di {stadio} non aggiornato ({e}).")
+            return True
+        logger.info(f"EOD {giorno.isoformat()}: stadio {stadio} da eseguire ({motivo}).")
+
+    impronte_input = manifest.impronte_input()  # prima del run: un input cambiato durante il run invalida
+    avvio, inizio = time.time(), time.monotonic()
+    esegui()
+    try:
+        righe = manifest.registra_esecuzione(time.monotonic() - inizio, impronte_input, avvio - 1)
+        if righe is not None:
+            logger.info(f"EOD {giorno.isoformat()}: stadio {stadio} -> {righe} righe in output.")
+    except OSError as e:
+        logger.warning(f"EOD {giorno.isoformat()}: manifest di {stadio} non salvato ({e}).")
+    return False
@@ -0,0 +1,119 @@
+# pianificatore_mmsi.py
+"""
+Pianificatore del polling orario: decide quali MMSI interrogare in questo run.
+
+Dopo ogni estrazione riuscita si stima quando l'ultimo viaggio potrà cambiare:
+  - viaggio appena cambiato (entro A_FINESTRA_CALDA_H)      -> caldo, ogni ora
+  - arrivo ancora nel futuro (nave in navigazione)          -> a ridosso dell'arrivo
+  - arrivo passato: un nuovo viaggio completo non può chiudersi prima di
+    arrivo + A_FATTORE_DURATA × durata dell'ultimo viaggio -> a ridosso di quell'istante
+  - dati non interpretabili o MMSI mai visto                -> caldo
+Le stime sono anticipate di A_MARGINE_H (copre anche l'ambiguità di fuso orario degli orari
+del sito) e non superano mai A_STALENESS_MAX_H: ogni MMSI è interrogato almeno con quella cadenza.
+Gli MMSI falliti non vengono registrati, quindi restano dovuti al run successivo.
+
+Stato in Stato/pianificatore_mmsi.json.
+"""
+
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+from impronte_viaggi import impronta
+
+# tolleranza sul confronto "dovuto": i run partono a :05 ma la durata varia
+TOLLERANZA = timedelta(minutes=10)
+
+
+def parse_durata(testo):
+    """'5 h, 23 mins' / '1 d, 2 h' / '39 mins' -> timedelta; None se non interpretabile."""
+    if not isinstance(testo, str):
+        return None
+    parti = {u: re.search(rf"(\d+)\s*{u}", testo) for u in ("d", "h", "min")}
+    if not any(parti.values()):
+        return None
+    valore = lambda u: int(parti[u].group(1)) if parti[u] else 0
+    return timedelta(days=valore("d"), hours=valore("h"), minutes=valore("min"))
+
+
+def parse_istante(data, ora):
+    if not isinstance(data, str):
+        return None
+    testo = data.strip() + (" " + ora.strip() if isinstance(ora, str) and ":" in ora else "")
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(testo, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+class PianificatoreMMSI:
+    def __init__(self, path, staleness_max_h, finestra_calda_h, fattore_durata, margine_h, adesso=None):
+        self.path = str(path)
+        self.staleness_max = timedelta(hours=staleness_max_h)
+        self.finestra_calda = timedelta(hours=finestra_calda_h)
+        self.fattore_durata = fattore_durata
+        self.margine = timedelta(hours=margine_h)
+        self.adesso = adesso or datetime.now()
+        self.stato = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.stato = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def seleziona(self, lista_mmsi):
+        """Divide gli MMSI in (da interrogare ora, rinviati), mantenendo l'ordine di input."""
+        da_interrogare, rinviati = [], []
+        for mmsi in lista_mmsi:
+            voce = self.stato.get(str(mmsi))
+            dovuto = voce is None or datetime.fromisoformat(voce["prossimo_poll"]) <= self.adesso + TOLLERANZA
+            (da_interrogare if dovuto else rinviati).append(mmsi)
+        return da_interrogare, rinviati
+
+    def _prossimo_poll(self, dati_nave, ultimo_cambio):
+        adesso = self.adesso
+        limite = adesso + self.staleness_max
+        if adesso - ultimo_cambio < self.finestra_calda:
+            return adesso
+        arrivo = parse_istante(dati_nave.get("Date Arrival"), dati_nave.get("Time Arrival"))
+        if arrivo is None:
+            return adesso
+        if arrivo > adesso:
+            stima = arrivo
+        else:
+            durata = parse_durata(dati_nave.get("Duration"))
+            if durata is None:
+                return adesso
+            stima = arrivo + durata * self.fattore_durata
+        return max(adesso, min(limite, stima - self.margine))
+
+    def registra(self, dati_totali):
+        """Aggiorna lo stato con gli MMSI appena estratti."""
+        for dati_nave in dati_totali:
+            mmsi = str(dati_nave["MMSI"])
+            voce = self.stato.get(mmsi, {})
+            nuova_impronta = impronta(dati_nave)
+            if voce.get("impronta") != nuova_impronta:
+                ultimo_cambio = self.adesso
+            else:
+                ultimo_cambio = datetime.fromisoformat(voce["ultimo_cambio"])
+            self.stato[mmsi] = {
+                "impronta": nuova_impronta,
+                "ultimo_poll": self.adesso.isoformat(timespec="seconds"),
+                "ultimo_cambio": ultimo_cambio.isoformat(timespec="seconds"),
+                "prossimo_poll": self._prossimo_poll(dati_nave, ultimo_cambio).isoformat(timespec="seconds"),
+            }
+
+    def salva(self, lista_mmsi=None):
+        if lista_mmsi is not None:
+            # dimentica gli MMSI tolti da MMSI.xlsx
+            validi = {str(m) for m in lista_mmsi}
+            self.stato = {m: v for m, v in self.stato.items() if m in validi}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.stato, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,103 @@
+# pipeline_eod.py
+"""
+Catena EOD descritta come piccolo grafo di dipendenze.
+
+    pulisci_giornaliera ──┐
+                          ├──> unione_finale
+    pulisci_bot ──────────┘
+
+Gli stadi senza dipendenze tra loro girano in parallelo; uno stadio parte appena tutti i suoi
+prerequisiti sono terminati con successo. Se un prerequisito fallisce, gli stadi che ne
+dipendono vengono segnati come 'saltato', mentre i rami indipendenti arrivano comunque
+in fondo e il loro esito viene registrato.
+
+L'esecuzione del singolo stadio è delegata al chiamante (`esegui_stadio(stadio, giorno)`,
+che solleva eccezione in caso di errore): main2_screperino usa run_and_log.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# nome -> (script, dipendenze)
+STADI_EOD = {
+    "pulisci_giornaliera": ("pulisci_giornaliera.py", ()),
+    "pulisci_bot":         ("pulisci_bot.py", ()),
+    "unione_finale":       ("unione_finale.py", ("pulisci_giornaliera", "pulisci_bot")),
+}
+
+OK, FALLITO, SALTATO = "ok", "fallito", "saltato"
+
+
+def ordine_topologico(stadi):
+    """Verifica che il grafo sia aciclico e con dipendenze note; ritorna i nomi in ordine eseguibile."""
+    ordine, visitati, in_corso = [], set(), set()
+
+    def visita(nome):
+        if nome in visitati:
+            return
+        if nome in in_corso:
+            raise ValueError(f"Ciclo nel grafo EOD che coinvolge '{nome}'")
+        if nome not in stadi:
+            raise ValueError(f"Dipendenza sconosciuta nel grafo EOD: '{nome}'")
+        in_corso.add(nome)
+        for dip in stadi[nome][1]:
+            visita(dip)
+        in_corso.discard(nome)
+        visitati.add(nome)
+        ordine.append(nome)
+
+    for nome in stadi:
+        visita(nome)
+    return ordine
+
+
+def esegui_pipeline(giorno, esegui_stadio, logger, stadi=STADI_EOD, max_paralleli=None):
+    """
+    Esegue il grafo `stadi` per `giorno`. Ritorna {nome: (esito, secondi, errore | None)}.
+    Ogni esito (e la durata) viene loggato appena disponibile.
+    """
+    ordine_topologico(stadi)
+    esiti = {}
+    in_volo = {}
+
+    def pronti():
+        for nome in stadi:
+            if nome in esiti or nome in in_volo.values():
+                continue
+            dipendenze = stadi[nome][1]
+            if any(esiti.get(d, (None,))[0] in (FALLITO, SALTATO) for d in dipendenze):
+                bloccanti = [d for d in dipendenze if esiti.get(d, (None,))[0] != OK]
+                esiti[nome] = (SALTATO, 0.0, f"prerequisiti non riusciti: {', '.join(bloccanti)}")
+                logger.warning(f"EOD {giorno.isoformat()}: stadio {nome} saltato ({esiti[nome][2]}).")
+                continue
+            if all(esiti.get(d, (None,))[0] == OK for d in dipendenze):
+                yield nome
+
+    def cronometra(nome):
+        inizio = time.monotonic()
+        esegui_stadio(nome, giorno)
+        return time.monotonic() - inizio
+
+    with ThreadPoolExecutor(max_workers=max_paralleli or len(stadi)) as pool:
+        avvii = {}
+        while True:
+            for nome in list(pronti()):
+                logger.info(f"EOD {giorno.isoformat()}: avvio stadio {nome}.")
+                avvii[nome] = time.monotonic()
+                in_volo[pool.submit(cronometra, nome)] = nome
+            if not in_volo:
+                if len(esiti) == len(stadi):
+                    break
+                continue  # uno stadio appena saltato può sbloccare (saltandoli) i suoi dipendenti
+            completati, _ = wait(in_volo, return_when=FIRST_COMPLETED)
+            for fut in completati:
+                nome = in_volo.pop(fut)
+                try:
+                    durata = fut.result()
+                    esiti[nome] = (OK, durata, None)
+                    logger.info(f"EOD {giorno.isoformat()}: stadio {nome} OK in {durata:.1f}s.")
+                except Exception as e:
+                    durata = time.monotonic() - avvii[nome]
+                    esiti[nome] = (FALLITO, durata, str(e))
+                    logger.error(f"EOD {giorno.isoformat()}: stadio {nome} FALLITO dopo {durata:.1f}s ({e}).")
+    return esiti
@@ -6,6 +6,14 @@ import bootstrap
 
 # importa i path centralizzati
 from config import SCREPERINO_ROOT
+from catalogo_bot import CatalogoBot
+from storico_run import salva_riepilogo
+
+COLONNE_DA_SALVARE = [
+    'data partenza', 'nave', 'porto partenza', 'orario partenza',
+    'porto arrivo', 'orario arrivo', 'durata viaggio',
+    'operatore', 'prezzo', 'fonte', 'note'
+]
 
 def setup_logging(log_path):
     """Configura il logging per scrivere su un percorso specifico."""
@@ -29,7 +37,8 @@ def setup_logging(log_path):
 
 def pulisci_bot(data_da_processare=None):
     """
-    Pulisce i file del bot per un giorno specifico, scansionando tutti i file ogni volta.
+    Pulisce i file del bot per un giorno specifico.
+    Grazie al catalogo (catalogo_bot) rilegge da Excel solo i file nuovi o modificati.
     """
     path_input_bot  = os.path.join(SCREPERINO_ROOT, "File_Input", "Bot")
     path_output_bot = os.path.join(SCREPERINO_ROOT, "File_Output", "Bot_Pulito")
@@ -58,41 +67,27 @@ def pulisci_bot(data_da_processare=None):
 
     logging.info(f"Trovati {len(file_da_processare)} file da analizzare per la data {data_da_processare.strftime('%d-%m-%Y')}.")
 
+    # Solo i file nuovi/modificati vengono riletti; degli altri si usa la copia in cache
+    # e solo se il catalogo dice che contengono la data richiesta.
+    catalogo = CatalogoBot(path_input_bot, COLONNE_DA_SALVARE)
     dati_trovati = []
-    for filename in file_da_processare:
-        percorso_file = os.path.join(path_input_bot, filename)
-        try:
-            df_temp = pd.read_excel(percorso_file, sheet_name='TRATTE', header=0)
-            
-            df_temp.columns = [str(col).strip().lower() for col in df_temp.columns]
-            
-            required_cols = ['data partenza', 'orario partenza']
-            if not all(col in df_temp.columns for col in required_cols):
-                logging.warning(f"AVVISO: Colonne richieste ('data partenza', 'orario partenza') non trovate nel file {filename}. File saltato.")
-                continue
-
-            df_temp['DataOraCompleta'] = pd.to_datetime(
-                df_temp['data partenza'].astype(str) + ' ' + df_temp['orario partenza'].astype(str),
-                dayfirst=True,
-                errors='coerce'
-            )
-            
-            df_filtrato = df_temp[df_temp['DataOraCompleta'].dt.date == data_da_processare].copy()
-            
-            if not df_filtrato.empty:
-                logging.info(f"Trovate {len(df_filtrato)} righe nel file {filename}.")
-                df_filtrato = df_filtrato.drop(columns=['DataOraCompleta'], errors='ignore')
-                dati_trovati.append(df_filtrato)
-
-        except Exception as e:
-            logging.error(f"Impossibile processare il file {filename}. Errore: {e}")
+    for filename, df_filtrato in catalogo.tratte_del_giorno(file_da_processare, data_da_processare):
+        if not df_filtrato.empty:
+            logging.info(f"Trovate {len(df_filtrato)} righe nel file {filename}.")
+            dati_trovati.append(df_filtrato)
+    try:
+        catalogo.salva()
+    except OSError as e:
+        logging.warning(f"Impossibile salvare il catalogo bot: {e}")
+    logging.info(catalogo.riepilogo())
 
     if not dati_trovati:
         logging.warning(f"Nessun dato trovato per la data {data_da_processare.strftime('%d-%m-%Y')} in nessun file.")
         return
         
     df_totale = pd.concat(dati_trovati, ignore_index=True)
-    logging.info(f"Righe totali trovate prima della pulizia: {len(df_totale)}")
+    righe_lette = len(df_totale)
+    logging.info(f"Righe totali trovate prima della pulizia: {righe_lette}")
 
     df_totale.dropna(how='all', inplace=True)
     df_totale.drop_duplicates(inplace=True)
@@ -103,17 +98,12 @@ def pulisci_bot(data_da_processare=None):
         nome_file_output = f"Bot_Pulito_{data_da_processare.strftime('%d-%m-%Y')}.xlsx"
         percorso_completo_output = os.path.join(path_output_bot, nome_file_output)
         
-        colonne_da_salvare = [
-            col for col in [
-                'data partenza', 'nave', 'porto partenza', 'orario partenza',
-                'porto arrivo', 'orario arrivo', 'durata viaggio',
-                'operatore', 'prezzo', 'fonte', 'note'
-            ] if col in df_totale.columns
-        ]
+        colonne_da_salvare = [col for col in COLONNE_DA_SALVARE if col in df_totale.columns]
         df_totale = df_totale[colonne_da_salvare]
 
         df_totale.to_excel(percorso_completo_output, index=False)
         logging.info(f"✅ Dati del bot puliti e salvati in: {percorso_completo_output}")
+        salva_riepilogo("pulisci_bot", data_da_processare, righe_in=righe_lette, righe_out=len(df_totale))
 
 def _parse_cli_date():
     import sys
@@ -20,6 +20,9 @@ import pandas as pd
 
 # importa i path centralizzati
 from config import SCREPERINO_ROOT
+from accumulatore_giornaliero import AccumulatoreGiornaliero
+from lettore_xlsx import MOTORE, leggi_excel_multipli
+from storico_run import salva_riepilogo
 
 # =========================
 # Config percorsi
@@ -110,36 +113,53 @@ def pulisci_giornaliere(data_da_processare: date | None = None) -> int:
         logging.info("================== FINE SCRIPT DI PULIZIA ===================\n")
         return 0
 
-    # Lettura file con engine esplicito
-    df_list = []
-    for file in lista_file:
+    # Accumulatore aggiornato dai run orari: se copre tutti i file evito di rileggere gli xlsx
+    df_totale = None
+    accumulatore = AccumulatoreGiornaliero(path_input_specifico)
+    if accumulatore.copre(lista_file):
         try:
-            df_temp = pd.read_excel(file, engine="openpyxl")
+            df_totale = accumulatore.leggi_df()
+            logging.info(
+                f"Accumulatore giornaliero completo ({len(lista_file)} file coperti): "
+                f"salto la rilettura degli xlsx. Righe: {len(df_totale)}"
+            )
+        except Exception as e:
+            logging.warning(f"Accumulatore illeggibile, torno alla rilettura completa. Errore: {e}")
+            df_totale = None
+    else:
+        logging.info("Accumulatore giornaliero assente o incompleto: rileggo tutti gli xlsx.")
+
+    if df_totale is None:
+        # Lettura file in parallelo (motore più veloce disponibile)
+        logging.info(f"Lettura di {len(lista_file)} file con motore '{MOTORE}'.")
+        df_list = []
+        for file, df_temp, errore in leggi_excel_multipli(lista_file):
+            if errore is not None:
+                logging.error(f"Impossibile leggere il file '{file}'. Errore: {errore}")
+                continue
             df_list.append(df_temp)
             logging.info(f"Letto: {os.path.basename(file)} (righe: {len(df_temp)})")
-        except Exception as e:
-            logging.error(f"Impossibile leggere il file '{file}'. Errore: {e}")
 
-    if not df_list:
-        logging.error(
-            "Tutti i file hanno fallito la lettura: nessun DataFrame disponibile. "
-            "Esco con codice errore."
-        )
-        logging.info("================== FINE SCRIPT DI PULIZIA ===================\n")
-        return 2
+        if not df_list:
+            logging.error(
+                "Tutti i file hanno fallito la lettura: nessun DataFrame disponibile. "
+                "Esco con codice errore."
+            )
+            logging.info("================== FINE SCRIPT DI PULIZIA ===================\n")
+            return 2
 
-    # Concatenazione sicura
-    try:
-        df_totale = pd.concat(df_list, ignore_index=True)
-    except Exception as e:
-        logging.exception(f"Concat fallita: {e}")
-        logging.info("================== FINE SCRIPT DI PULIZIA ===================\n")
-        return 2
+        # Concatenazione sicura
+        try:
+            df_totale = pd.concat(df_list, ignore_index=True)
+        except Exception as e:
+            logging.exception(f"Concat fallita: {e}")
+            logging.info("================== FINE SCRIPT DI PULIZIA ===================\n")
+            return 2
 
-    logging.info(f"Uniti {len(df_list)} file. Righe totali prima della pulizia: {len(df_totale)}")
+        logging.info(f"Uniti {len(df_list)} file. Righe totali prima della pulizia: {len(df_totale)}")
 
     # Pulizia
-    righe_prima = len(df_totale)
+    righe_lette = righe_prima = len(df_totale)
     df_totale.dropna(how="all", inplace=True)
     logging.info(f"Rimosse {righe_prima - len(df_totale)} righe completamente vuote.")
 
@@ -155,6 +175,7 @@ def pulisci_giornaliere(data_da_processare: date | None = None) -> int:
         percorso_output = os.path.join(PATH_OUTPUT_PULITE, nome_file_output)
         df_totale.to_excel(percorso_output, index=False)
         logging.info(f"✅ Pulizia completata! Dati salvati in: {percorso_output}")
+        salva_riepilogo("pulisci_giornaliera", data_da_processare, righe_in=righe_lette, righe_out=len(df_totale))
     except Exception as e:
         logging.error(f"ERRORE salvataggio file pulito: {e}")
         logging.info("================== FINE SCRIPT DI PULIZIA ===================\n")
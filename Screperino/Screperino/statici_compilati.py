@@ -0,0 +1,166 @@
+# statici_compilati.py
+"""
+Copie compilate delle tabelle statiche di File_Input/Statici usate da unione_finale.
+
+MASTER_IHS FINALE.xlsx e DECODIFICA_FINALE.xlsx cambiano di rado ma vanno riletti (e rinormalizzati)
+a ogni EOD. Qui vengono letti una volta, preparati (colonne in minuscolo, chiavi mmsi/porto già
+normalizzate) e salvati come pickle in Cache/statici, con accanto un JSON di metadati:
+  {"versione", "sorgente", "mtime", "size", "sha1", "righe"}
+
+Al run successivo:
+  - mtime e dimensione invariati          -> si carica il pickle
+  - mtime cambiato ma contenuto identico  -> si aggiornano i metadati e si carica il pickle
+  - altrimenti (o pickle illeggibile)     -> si rilegge l'xlsx e si ricompila
+
+Cambiando la preparazione va incrementato VERSIONE, così le copie vecchie vengono scartate.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import pandas as pd
+
+from config import STATICI_CACHE_DIR
+from lettore_xlsx import leggi_excel_multipli
+
+VERSIONE = 1
+
+
+def normalizza_chiave(serie):
+    """
+    Chiave di join come testo: senza '.0' finale (numeri letti come float), senza spazi, minuscola.
+    Le operazioni su stringa girano solo sui valori distinti (factorize) e il risultato viene
+    riproiettato sulle righe tramite i codici: stesso esito del calcolo riga per riga.
+    """
+    codici, distinti = pd.factorize(serie, use_na_sentinel=False)
+    normalizzati = (
+        pd.Series(distinti, dtype=object).astype(str)
+          .str.replace(r"\.0$", "", regex=True)
+          .str.strip()
+          .str.lower()
+    )
+    return normalizzati.take(codici).set_axis(serie.index).rename(serie.name)
+
+
+def normalizza_colonne(df):
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    return df
+
+
+def prepara_specifiche(df):
+    df = normalizza_colonne(df).rename(columns={"mmsi number": "mmsi"})
+    if "mmsi" in df.columns:
+        df["mmsi"] = normalizza_chiave(df["mmsi"])
+    return df
+
+
+def prepara_decodifica(df):
+    df = normalizza_colonne(df)
+    if "porto" in df.columns:
+        df["porto"] = normalizza_chiave(df["porto"])
+    return df
+
+
+def _sha1_file(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for blocco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(blocco)
+    return h.hexdigest()
+
+
+class StaticiCompilati:
+    def __init__(self, cartella=STATICI_CACHE_DIR):
+        self.cartella = str(cartella)
+        self.contatori = {"da_cache": 0, "ricompilati": 0}
+
+    def _path(self, sorgente, est):
+        nome = os.path.splitext(os.path.basename(str(sorgente)))[0]
+        return os.path.join(self.cartella, nome + est)
+
+    def _leggi_meta(self, sorgente):
+        try:
+            with open(self._path(sorgente, ".json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _scrivi_meta(self, sorgente, meta):
+        path = self._path(sorgente, ".json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def _da_cache(self, sorgente):
+        """DataFrame compilato se ancora valido per `sorgente`, altrimenti None."""
+        meta = self._leggi_meta(sorgente)
+        if not meta or meta.get("versione") != VERSIONE:
+            return None
+        st = os.stat(sorgente)
+        if (meta.get("mtime"), meta.get("size")) != (st.st_mtime, st.st_size):
+            if meta.get("size") != st.st_size or meta.get("sha1") != _sha1_file(sorgente):
+                return None
+            meta["mtime"] = st.st_mtime  # file toccato ma identico
+            self._scrivi_meta(sorgente, meta)
+        try:
+            return pd.read_pickle(self._path(sorgente, ".pkl"))
+        except Exception as e:
+            logging.warning(f"Copia compilata di {os.path.basename(str(sorgente))} non leggibile ({e}).")
+            return None
+
+    def _salva(self, sorgente, df):
+        st = os.stat(sorgente)
+        pkl = self._path(sorgente, ".pkl")
+        tmp = f"{pkl}.{os.getpid()}.tmp"
+        df.to_pickle(tmp)
+        os.replace(tmp, pkl)
+        self._scrivi_meta(sorgente, {
+            "versione": VERSIONE,
+            "sorgente": str(sorgente),
+            "mtime": st.st_mtime,
+            "size": st.st_size,
+            "sha1": _sha1_file(sorgente),
+            "righe": len(df),
+        })
+
+    def carica(self, voci):
+        """
+        voci: [(path_xlsx, prepara)]. Ritorna [(path, df | None, errore | None)] nell'ordine di `voci`,
+        con i df già preparati. Le tabelle da ricompilare vengono lette insieme (lettore_xlsx).
+        """
+        os.makedirs(self.cartella, exist_ok=True)
+        risultati = {}
+        da_leggere = []
+        for sorgente, prepara in voci:
+            try:
+                df = self._da_cache(sorgente)
+            except OSError as e:
+                risultati[str(sorgente)] = (str(sorgente), None, str(e))
+                continue
+            if df is not None:
+                self.contatori["da_cache"] += 1
+                risultati[str(sorgente)] = (str(sorgente), df, None)
+            else:
+                da_leggere.append((sorgente, prepara))
+
+        if da_leggere:
+            preparazioni = {str(s): p for s, p in da_leggere}
+            for path, df, errore in leggi_excel_multipli([s for s, _ in da_leggere]):
+                if errore is None:
+                    df = preparazioni[path](df)
+                    try:
+                        self._salva(path, df)
+                        self.contatori["ricompilati"] += 1
+                    except Exception as e:
+                        # la copia non si salva, ma il dato letto è buono: si prosegue
+                        logging.warning(f"Impossibile salvare la copia compilata di {os.path.basename(path)}: {e}")
+                risultati[path] = (path, df, errore)
+
+        return [risultati[str(s)] for s, _ in voci]
+
+    def riepilogo(self):
+        c = self.contatori
+        return f"Statici compilati: da_cache={c['da_cache']} ricompilati={c['ricompilati']}"
@@ -4,7 +4,15 @@ from datetime import datetime, date
 import logging
 import pandas as pd
 import bootstrap
-from config import SCREPERINO_ROOT, LOG_DIR
+from config import (
+    SCREPERINO_ROOT, LOG_DIR,
+    UNIONE_BOT_MODALITA, UNIONE_BOT_TOLLERANZA_MIN, UNIONE_BOT_MAX_CORRISPONDENZE,
+)
+from lettore_xlsx import leggi_excel_multipli
+from storico_run import salva_riepilogo
+from statici_compilati import (
+    StaticiCompilati, normalizza_chiave, normalizza_colonne, prepara_decodifica, prepara_specifiche,
+)
 
 
 def setup_logging(log_path: Path):
@@ -27,6 +35,109 @@ def setup_logging(log_path: Path):
     logger.addHandler(console_handler)
 
 
+COLONNE_PORTO = ("porto partenza", "porto arrivo")
+MAX_PORTI_NEL_LOG = 20
+
+
+def decodifica_come_dizionario(master_df, df_decodifica) -> bool:
+    """
+    True se la lookup porto -> nazione dà lo stesso risultato dei due merge:
+    decodifica con sole colonne porto/nazione, porti univoci, colonne nazione non già presenti.
+    """
+    return (
+        set(df_decodifica.columns) == {"porto", "nazione"}
+        and df_decodifica["porto"].is_unique
+        and not {"porto", "nazione partenza", "nazione arrivo"} & set(master_df.columns)
+        and all(c in master_df.columns for c in COLONNE_PORTO)
+    )
+
+
+def decodifica_nazioni(master_df, df_decodifica):
+    """Aggiunge 'nazione partenza'/'nazione arrivo' con una sola tabella porto -> nazione (niente merge)."""
+    mappa = pd.Series(df_decodifica["nazione"].to_numpy(), index=pd.Index(df_decodifica["porto"]))
+    master_df["nazione partenza"] = master_df["porto partenza"].map(mappa)
+    master_df["nazione arrivo"] = master_df["porto arrivo"].map(mappa)
+    return master_df
+
+
+def porti_non_decodificati(master_df, df_decodifica) -> pd.Series:
+    """Conteggio (porto -> occorrenze) dei porti di partenza/arrivo assenti dalla decodifica."""
+    noti = set(df_decodifica["porto"].dropna())
+    porti = pd.concat([master_df[c] for c in COLONNE_PORTO if c in master_df.columns], ignore_index=True)
+    porti = porti[porti.notna() & ~porti.isin(["", "nan", "n/a", "none"])]
+    return porti[~porti.isin(noti)].value_counts()
+
+
+def salva_porti_non_decodificati(master_df, df_decodifica, path_log: Path, giorno: date):
+    mancanti = porti_non_decodificati(master_df, df_decodifica)
+    if mancanti.empty:
+        logging.info("Tutti i porti sono presenti in DECODIFICA_FINALE.")
+        return
+    logging.warning(f"{len(mancanti)} porti non presenti in DECODIFICA_FINALE ({int(mancanti.sum())} occorrenze).")
+    for porto, n in mancanti.head(MAX_PORTI_NEL_LOG).items():
+        logging.warning(f"  porto non decodificato: '{porto}' x{n}")
+    out = path_log / f"Porti_Non_Decodificati_{giorno.strftime('%d-%m-%Y')}.csv"
+    try:
+        mancanti.rename_axis("porto").rename("occorrenze").to_csv(out, encoding="utf-8")
+        logging.info(f"Elenco completo dei porti non decodificati: {out}")
+    except OSError as e:
+        logging.warning(f"Impossibile salvare l'elenco dei porti non decodificati: {e}")
+
+
+def minuti_del_giorno(serie) -> pd.Series:
+    """'HH:MM', 'HH:MM:SS' o datetime testuale -> minuti dalla mezzanotte (NaN se assente)."""
+    hm = serie.astype(str).str.extract(r"(\d{1,2}):(\d{2})")
+    return (pd.to_numeric(hm[0], errors="coerce") * 60 + pd.to_numeric(hm[1], errors="coerce")).astype(float)
+
+
+def limita_corrispondenze(df, colonna_riga: str, massimo: int, righe_origine: int):
+    """Guardia sul fan-out: al massimo `massimo` righe per viaggio estratto (le prime in ordine)."""
+    per_riga = df.groupby(colonna_riga, sort=False).size()
+    eccesso = per_riga[per_riga > massimo]
+    if eccesso.empty:
+        return df
+    logging.warning(
+        f"Unione bot: {len(eccesso)} viaggi con più di {massimo} corse bot "
+        f"({len(df)} righe da {righe_origine}). Tengo le prime {massimo} per viaggio."
+    )
+    return df.groupby(colonna_riga, sort=False).head(massimo)
+
+
+def unisci_bot(master_df, df_bot, chiave_join, modalita=UNIONE_BOT_MODALITA,
+               tolleranza_min=UNIONE_BOT_TOLLERANZA_MIN, max_corrispondenze=UNIONE_BOT_MAX_CORRISPONDENZE):
+    """
+    Aggancia le corse del bot ai viaggi estratti.
+    - 'vicino': per ogni viaggio, la sola corsa bot della stessa data/tratta con l'orario di partenza
+      più vicino entro `tolleranza_min` (merge_asof). Richiede 'time departure' e 'orario partenza'.
+    - 'esatta': merge su data+tratta come in origine (tutte le corse del giorno).
+    In entrambi i casi l'ordine dei viaggi è quello di partenza e il fan-out è limitato.
+    """
+    righe_origine = len(master_df)
+    master_df = master_df.assign(_riga=range(righe_origine))
+
+    orari_presenti = "time departure" in master_df.columns and "orario partenza" in df_bot.columns
+    if modalita == "vicino" and orari_presenti:
+        sinistra = master_df.assign(_minuti=minuti_del_giorno(master_df["time departure"]))
+        # senza orario non si può scegliere la corsa: restano senza dati bot (minuti fuori scala)
+        sinistra["_minuti"] = sinistra["_minuti"].fillna(-10 ** 6)
+        destra = df_bot.assign(_minuti=minuti_del_giorno(df_bot["orario partenza"])).dropna(subset=["_minuti"])
+        unito = pd.merge_asof(
+            sinistra.sort_values("_minuti"), destra.sort_values("_minuti"),
+            on="_minuti", by=chiave_join, direction="nearest", tolerance=float(tolleranza_min),
+        )
+        unito = unito.sort_values("_riga", kind="stable").drop(columns="_minuti")
+        abbinati = unito[[c for c in destra.columns if c not in chiave_join and c in unito.columns and c != "_minuti"]]
+        logging.info(f"Unione bot (orario più vicino, ±{tolleranza_min} min): "
+                     f"{int(abbinati.notna().any(axis=1).sum())}/{righe_origine} viaggi abbinati.")
+    else:
+        if modalita == "vicino":
+            logging.warning("Unione bot: colonne orario mancanti, uso il merge su data+tratta.")
+        unito = master_df.merge(df_bot, on=chiave_join, how="left")
+
+    unito = limita_corrispondenze(unito, "_riga", max_corrispondenze, righe_origine)
+    return unito.drop(columns="_riga").reset_index(drop=True)
+
+
 def unione_finale(data_da_processare: date | None = None):
     # --- PERCORSI DINAMICI: tutti sotto Screperino (root dati) ---
     base = Path(SCREPERINO_ROOT)
@@ -60,31 +171,36 @@ def unione_finale(data_da_processare: date | None = None):
             logging.error("Mancano i seguenti input richiesti: " + " | ".join(missing))
             return
 
-        df_giornaliera = pd.read_excel(fg)
-        df_bot         = pd.read_excel(fb)
-        df_specifiche  = pd.read_excel(path_statici / "MASTER_IHS FINALE.xlsx")
-        df_decodifica  = pd.read_excel(path_statici / "DECODIFICA_FINALE.xlsx")
+        # Statici da copia compilata (già normalizzati), ricompilati solo se il file sorgente cambia
+        statici = StaticiCompilati()
+        letture = leggi_excel_multipli([fg, fb]) + statici.carica([
+            (path_statici / "MASTER_IHS FINALE.xlsx", prepara_specifiche),
+            (path_statici / "DECODIFICA_FINALE.xlsx", prepara_decodifica),
+        ])
+        errori = [f"{path}: {errore}" for path, _, errore in letture if errore is not None]
+        if errori:
+            raise RuntimeError(" | ".join(errori))
+        df_giornaliera, df_bot, df_specifiche, df_decodifica = (df for _, df, _ in letture)
         logging.info("Tutti i file sorgente sono stati caricati.")
+        logging.info(statici.riepilogo())
     except Exception as e:
         logging.error(f"ERRORE CRITICO nel caricamento file: {e}")
         return
 
     # --- 2) ARMONIZZAZIONE ---
     logging.info("Inizio armonizzazione...")
-    for df in (df_giornaliera, df_bot, df_specifiche, df_decodifica):
-        df.columns = [str(c).strip().lower() for c in df.columns]
+    for df in (df_giornaliera, df_bot):
+        normalizza_colonne(df)
 
     df_giornaliera.rename(columns={
         "origin": "porto partenza",
         "destination": "porto arrivo",
         "date departure": "data partenza",
     }, inplace=True)
-    df_specifiche.rename(columns={"mmsi number": "mmsi"}, inplace=True)
 
+    # specifiche e decodifica arrivano già normalizzate da statici_compilati
     chiavi_da_convertire = {
         "df_giornaliera": ["mmsi", "porto partenza", "porto arrivo"],
-        "df_specifiche":  ["mmsi"],
-        "df_decodifica":  ["porto"],
         "df_bot":         ["porto partenza", "porto arrivo"],
     }
     loc = locals()
@@ -92,12 +208,7 @@ def unione_finale(data_da_processare: date | None = None):
         df = loc[nome_df]
         for k in keys:
             if k in df.columns:
-                df[k] = (
-                    df[k].astype(str)
-                         .str.replace(r"\.0$", "", regex=True)
-                         .str.strip()
-                         .str.lower()
-                )
+                df[k] = normalizza_chiave(df[k])
 
     df_giornaliera["data partenza"] = pd.to_datetime(
         df_giornaliera.get("data partenza"), errors="coerce"
@@ -115,23 +226,34 @@ def unione_finale(data_da_processare: date | None = None):
         logging.info("Unite le specifiche della nave.")
 
     if {"porto", "nazione"} <= set(df_decodifica.columns):
-        master_df = (
-            master_df.merge(
-                df_decodifica.rename(columns={"nazione": "nazione partenza"}),
-                left_on="porto partenza", right_on="porto", how="left"
-            ).drop(columns="porto", errors="ignore")
-        )
-        master_df = (
-            master_df.merge(
-                df_decodifica.rename(columns={"nazione": "nazione arrivo"}),
-                left_on="porto arrivo", right_on="porto", how="left"
-            ).drop(columns="porto", errors="ignore")
-        )
+        if decodifica_come_dizionario(master_df, df_decodifica):
+            master_df = decodifica_nazioni(master_df, df_decodifica)
+        else:
+            # colonne extra o porti duplicati: il merge le porta nel master, quindi resta il merge
+            master_df = (
+                master_df.merge(
+                    df_decodifica.rename(columns={"nazione": "nazione partenza"}),
+                    left_on="porto partenza", right_on="porto", how="left"
+                ).drop(columns="porto", errors="ignore")
+            )
+            master_df = (
+                master_df.merge(
+                    df_decodifica.rename(columns={"nazione": "nazione arrivo"}),
+                    left_on="porto arrivo", right_on="porto", how="left"
+                ).drop(columns="porto", errors="ignore")
+            )
         logging.info("Unite Nazione Partenza/Arrivo.")
+        salva_porti_non_decodificati(master_df, df_decodifica, path_log_script, data_da_processare)
+    else:
+        logging.warning(
+            "DECODIFICA_FINALE senza le colonne 'porto'/'nazione' (trovate: "
+            f"{', '.join(map(str, df_decodifica.columns)) or 'nessuna'}): nazioni non decodificate "
+            "e report dei porti non decodificati saltato."
+        )
 
     chiave_join = ["data partenza", "porto partenza", "porto arrivo"]
     if all(c in df_bot.columns for c in chiave_join):
-        master_df = master_df.merge(df_bot, on=chiave_join, how="left")
+        master_df = unisci_bot(master_df, df_bot, chiave_join)
         logging.info("Uniti dati dal Bot.")
 
     # --- 4) SALVATAGGIO ---
@@ -140,6 +262,7 @@ def unione_finale(data_da_processare: date | None = None):
     out_path = path_output_master / nome_file_output
     master_df.to_excel(out_path, index=False)
     logging.info(f"✅ UNIONE COMPLETATA! File salvato in: {out_path}")
+    salva_riepilogo("unione_finale", data_da_processare, righe_in=len(df_giornaliera), righe_out=len(master_df))
 
 
 if __name__ == "__main__":
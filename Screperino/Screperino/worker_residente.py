@@ -0,0 +1,296 @@
+# worker_residente.py
+"""
+Modalità residente dell'orchestratore (ORCH_RESIDENTE = True in config).
+
+Invece di lanciare un nuovo interprete per ogni run di A e per ogni script EOD, l'orchestratore
+tiene uno o più processi worker "caldi" (pandas, requests, bs4, openpyxl già importati) e chiama
+direttamente le funzioni di ingresso degli script:
+
+  A                   -> estrazione_giornaliera.main()
+  pulisci_giornaliera -> pulisci_giornaliera.pulisci_giornaliere(data)   (rc 0/2 come da CLI)
+  pulisci_bot         -> pulisci_bot.pulisci_bot(data)
+  unione_finale       -> unione_finale.unione_finale(data)
+
+Isolamento:
+  - ogni job imposta il proprio logging (file di log separati come da script); stdout/stderr del
+    job arrivano all'orchestratore riga per riga mentre il job gira e vengono loggati con prefisso
+    come fa esegui_streaming (in memoria restano solo le ultime righe, per i messaggi di errore)
+  - watchdog di inattività: se il job non scrive nulla per `inattivita_sec` il worker viene
+    terminato (con i suoi figli, se c'è psutil) e ricreato al job successivo (rc RC_INATTIVITA)
+  - exit code come da CLI: valore di ritorno int, SystemExit, 1 su eccezione
+  - il worker viene riciclato dopo RESIDENTE_MAX_JOB job o se la memoria residente supera
+    RESIDENTE_MAX_RSS_MB; se muore durante un job, il job risulta fallito (rc -1) e il worker
+    viene ricreato al job successivo
+
+B (gestore2) resta un sottoprocesso: pilota Chrome e ha il proprio lock (rc 111).
+I worker non sono daemon perché gli script EOD usano a loro volta un pool di processi (lettore_xlsx).
+"""
+
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from config import A_DIR, RESIDENTE_WORKERS, RESIDENTE_MAX_JOB, RESIDENTE_MAX_RSS_MB
+from stream_runner import CODA_RIGHE, MAX_CARATTERI_RIGA, RC_INATTIVITA, EsitoStreaming
+
+MODULI_CALDI = ("pandas", "requests", "bs4", "openpyxl")
+
+# job -> (modulo, funzione, accetta la data)
+JOB = {
+    "A":                   ("estrazione_giornaliera", "main", False),
+    "pulisci_giornaliera": ("pulisci_giornaliera", "pulisci_giornaliere", True),
+    "pulisci_bot":         ("pulisci_bot", "pulisci_bot", True),
+    "unione_finale":       ("unione_finale", "unione_finale", True),
+}
+
+RC_WORKER_MORTO = -1
+
+
+def rss_mb():
+    """Memoria residente del processo corrente in MB (None se non misurabile)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _termina_albero(processo, attesa=10):
+    """Termina il worker e, se c'è psutil, i suoi discendenti (pool di lettore_xlsx)."""
+    figli = []
+    try:
+        import psutil
+        figli = psutil.Process(processo.pid).children(recursive=True)
+    except ImportError:
+        pass
+    except Exception:
+        figli = []
+    processo.terminate()
+    processo.join(attesa)
+    if processo.is_alive():
+        processo.kill()
+        processo.join(attesa)
+    for figlio in figli:
+        try:
+            figlio.kill()
+        except Exception:
+            pass
+
+
+class _RigheVersoPipe(io.TextIOBase):
+    """File di testo che spedisce all'orchestratore ogni riga completa: ("riga", stderr, testo)."""
+
+    def __init__(self, conn, lock, stderr):
+        self._conn = conn
+        self._lock = lock
+        self._stderr = stderr
+        self._resto = ""
+
+    def writable(self):
+        return True
+
+    def write(self, testo):
+        with self._lock:
+            righe = (self._resto + testo).split("\n")
+            self._resto = righe.pop()
+            for riga in righe:
+                self._conn.send(("riga", self._stderr, riga.rstrip("\r")))
+        return len(testo)
+
+    def svuota(self):
+        with self._lock:
+            if self._resto:
+                self._conn.send(("riga", self._stderr, self._resto))
+                self._resto = ""
+
+
+def _esegui_job(conn, nome, giorno):
+    import importlib
+
+    modulo, funzione, con_data = JOB[nome]
+    lock = threading.Lock()  # i job usano thread (A): una send alla volta sulla pipe
+    out, err = _RigheVersoPipe(conn, lock, False), _RigheVersoPipe(conn, lock, True)
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            fn = getattr(importlib.import_module(modulo), funzione)
+            rc = fn(giorno) if con_data else fn()
+            rc = rc if isinstance(rc, int) else 0
+        except SystemExit as e:
+            rc = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception:
+            traceback.print_exc()
+            rc = 1
+    out.svuota()
+    err.svuota()
+    return rc
+
+
+def _ciclo(conn, cartella):
+    """Corpo del processo worker: riceve (job, data), manda le righe di output e infine ("fine", rc, rss_mb)."""
+    os.chdir(cartella)
+    if cartella not in sys.path:
+        sys.path.insert(0, cartella)
+    for nome in MODULI_CALDI:
+        try:
+            __import__(nome)
+        except ImportError:
+            pass
+    while True:
+        try:
+            richiesta = conn.recv()
+        except EOFError:
+            return
+        if richiesta is None:
+            return
+        rc = _esegui_job(conn, *richiesta)
+        conn.send(("fine", rc, rss_mb()))
+
+
+class _Worker:
+    def __init__(self, contesto):
+        self.conn, figlio = contesto.Pipe()
+        self.processo = contesto.Process(target=_ciclo, args=(figlio, str(A_DIR)), name="orch-worker")
+        self.processo.start()
+        figlio.close()
+        self.job = 0
+        self.rss = None
+
+    def esegui(self, nome, giorno, alla_riga, inattivita_sec=None):
+        """
+        Esegue il job passando ogni riga di output a alla_riga(stderr, testo). Ritorna rc, oppure None
+        se il job non scrive nulla per `inattivita_sec` (il worker va allora terminato).
+        """
+        self.conn.send((nome, giorno))
+        ultima = time.monotonic()
+        while True:
+            if self.conn.poll(1):
+                messaggio = self.conn.recv()  # EOFError se il worker è morto
+                if messaggio[0] == "riga":
+                    ultima = time.monotonic()
+                    alla_riga(messaggio[1], messaggio[2])
+                    continue
+                _, rc, self.rss = messaggio
+                self.job += 1
+                return rc
+            if not self.processo.is_alive():
+                raise EOFError(f"worker uscito con codice {self.processo.exitcode}")
+            if inattivita_sec and time.monotonic() - ultima > inattivita_sec:
+                return None
+
+    def da_riciclare(self, max_job, max_rss_mb):
+        if self.job >= max_job:
+            return f"{self.job} job eseguiti"
+        if self.rss is not None and max_rss_mb and self.rss > max_rss_mb:
+            return f"memoria {self.rss:.0f} MB > {max_rss_mb} MB"
+        return None
+
+    def chiudi(self, attesa=10):
+        try:
+            self.conn.send(None)
+        except (OSError, EOFError, BrokenPipeError):
+            pass
+        self.processo.join(attesa)
+        if self.processo.is_alive():
+            self.processo.terminate()
+            self.processo.join(attesa)
+        self.conn.close()
+
+
+class PoolResidente:
+    """Pool di worker caldi; thread-safe (gli stadi EOD indipendenti girano in parallelo)."""
+
+    def __init__(self, logger, workers=RESIDENTE_WORKERS, max_job=RESIDENTE_MAX_JOB, max_rss_mb=RESIDENTE_MAX_RSS_MB):
+        self.logger = logger
+        self.max_job = max_job
+        self.max_rss_mb = max_rss_mb
+        self._contesto = multiprocessing.get_context("spawn")
+        self._liberi = queue.Queue()
+        self._lock = threading.Lock()
+        self._tutti = []
+        for _ in range(max(1, workers)):
+            self._liberi.put(None)  # creato al primo uso
+
+    def _nuovo(self):
+        w = _Worker(self._contesto)
+        with self._lock:
+            self._tutti.append(w)
+        self.logger.info(f"Worker residente avviato (pid={w.processo.pid}).")
+        return w
+
+    def _scarta(self, w, motivo, forza=False):
+        self.logger.info(f"Worker residente pid={w.processo.pid} riciclato: {motivo}.")
+        if forza:
+            _termina_albero(w.processo)
+            w.conn.close()
+        else:
+            w.chiudi()
+        with self._lock:
+            if w in self._tutti:
+                self._tutti.remove(w)
+
+    def esegui(self, nome, giorno=None, prefisso=None, inattivita_sec=None, unisci_stderr=False,
+               livello_stdout=logging.INFO, livello_stderr=logging.ERROR, coda_righe=CODA_RIGHE):
+        """
+        Esegue il job `nome` in un worker caldo loggando ogni riga con `prefisso`, come esegui_streaming.
+        Ritorna un EsitoStreaming (rc RC_WORKER_MORTO se il worker muore, RC_INATTIVITA dal watchdog).
+        """
+        if nome not in JOB:
+            raise ValueError(f"Job residente sconosciuto: {nome}")
+        etichetta = f"[{prefisso or nome}] "
+        coda = deque(maxlen=coda_righe)
+        righe = [0]
+        avvio = time.monotonic()
+
+        def alla_riga(stderr, linea):
+            if len(linea) > MAX_CARATTERI_RIGA:
+                linea = linea[:MAX_CARATTERI_RIGA] + " [...]"
+            righe[0] += 1
+            coda.append(linea)
+            if linea:
+                livello = livello_stderr if stderr and not unisci_stderr else livello_stdout
+                self.logger.log(livello, f"{etichetta}{linea}")
+
+        def esito(rc, inattivo=False):
+            return EsitoStreaming(rc, list(coda), righe[0], inattivo, time.monotonic() - avvio)
+
+        w = self._liberi.get()
+        try:
+            if w is None or not w.processo.is_alive():
+                w = self._nuovo()
+            try:
+                rc = w.esegui(nome, giorno, alla_riga, inattivita_sec)
+            except (EOFError, OSError, BrokenPipeError) as e:
+                self._scarta(w, f"terminato durante il job {nome} ({e!r})")
+                w = None
+                return esito(RC_WORKER_MORTO)
+            if rc is None:
+                self.logger.error(f"{etichetta}Nessun output da oltre {inattivita_sec}s: termino il worker.")
+                self._scarta(w, f"inattività durante il job {nome}", forza=True)
+                w = None
+                return esito(RC_INATTIVITA, inattivo=True)
+            motivo = w.da_riciclare(self.max_job, self.max_rss_mb)
+            if motivo:
+                self._scarta(w, motivo)
+                w = None
+            return esito(rc)
+        finally:
+            self._liberi.put(w)
+
+    def chiudi(self):
+        with self._lock:
+            tutti, self._tutti = self._tutti, []
+        for w in tutti:
+            w.chiudi()
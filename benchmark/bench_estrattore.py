@@ -0,0 +1,109 @@
+# benchmark/bench_estrattore.py
+"""
+Benchmark del parsing delle pagine vessel-mmsi-*: percorso lxml (estrattore_html) vs BeautifulSoup.
+
+Legge tutti i file .html di una cartella (default: benchmark/fixtures, pagine anonimizzate
+versionate col repo; con --cache la cache HTTP degli ultimi run), estrae i campi con entrambi
+i percorsi per A e per B, verifica che i dict siano identici e stampa i tempi.
+
+Uso:
+  python benchmark/bench_estrattore.py [cartella_fixture | --cache] [--ripetizioni N]
+
+Exit code:
+  0 -> tutti i dict identici
+  1 -> almeno una differenza tra i due percorsi
+  2 -> nessuna fixture trovata / lxml non installato
+"""
+
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import bootstrap
+
+from config import HTTP_CACHE_DIR
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures"
+import estrattore_html
+from estrattore_html import estrai_dati_nave_html, estrai_dati_viaggio_html
+
+
+def _cronometra(funzione, pagine, ripetizioni):
+    inizio = time.perf_counter()
+    for _ in range(ripetizioni):
+        for nome, html in pagine:
+            funzione(nome, html)
+    return time.perf_counter() - inizio
+
+
+def _esegui_sicuro(funzione, *args):
+    """Come nello script reale un'eccezione è un esito: deve esserlo per entrambi i percorsi."""
+    try:
+        return funzione(*args)
+    except Exception as e:
+        return f"ECCEZIONE {type(e).__name__}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("cartella", nargs="?", default=str(FIXTURE_DIR), help="Cartella con le pagine .html salvate")
+    parser.add_argument("--cache", action="store_true", help="usa le pagine della cache HTTP (HTTP_CACHE_DIR)")
+    parser.add_argument("--ripetizioni", type=int, default=5)
+    args = parser.parse_args()
+    if args.cache:
+        args.cartella = str(HTTP_CACHE_DIR)
+
+    if estrattore_html.etree is None:
+        print("lxml non installato: niente da confrontare.")
+        return 2
+
+    files = sorted(glob.glob(os.path.join(args.cartella, "*.html")))
+    if not files:
+        print(f"Nessuna fixture .html in {args.cartella}")
+        return 2
+
+    pagine = []
+    for f in files:
+        with open(f, "r", encoding="utf-8", errors="replace") as fh:
+            pagine.append((Path(f).stem, fh.read()))
+    mega = sum(len(h) for _, h in pagine) / 1_000_000
+    print(f"{len(pagine)} pagine ({mega:.1f} MB) da {args.cartella}")
+
+    # silenzia i warning di parsing: qui interessano solo dict e tempi
+    logging.disable(logging.WARNING)
+
+    differenze = 0
+    for nome, html in pagine:
+        for etichetta, veloce, riserva in (
+            ("A", lambda h: estrai_dati_nave_html(h, nome, motore="lxml"), lambda h: estrai_dati_nave_html(h, nome, motore="bs4")),
+            ("B", lambda h: estrai_dati_viaggio_html(h, motore="lxml"), lambda h: estrai_dati_viaggio_html(h, motore="bs4")),
+        ):
+            a, b = _esegui_sicuro(veloce, html), _esegui_sicuro(riserva, html)
+            if a != b:
+                differenze += 1
+                print(f"DIFFERENZA [{etichetta}] {nome}:\n  lxml: {a}\n  bs4:  {b}")
+
+    for etichetta, funzione in (
+        ("A", lambda motore: (lambda nome, h: _esegui_sicuro(estrai_dati_nave_html, h, nome, motore))),
+        ("B", lambda motore: (lambda nome, h: _esegui_sicuro(estrai_dati_viaggio_html, h, motore))),
+    ):
+        t_lxml = _cronometra(funzione("lxml"), pagine, args.ripetizioni)
+        t_bs4 = _cronometra(funzione("bs4"), pagine, args.ripetizioni)
+        n = len(pagine) * args.ripetizioni
+        print(f"[{etichetta}] lxml {t_lxml / n * 1000:.2f} ms/pagina | bs4 {t_bs4 / n * 1000:.2f} ms/pagina "
+              f"| speedup x{t_bs4 / t_lxml if t_lxml else float('inf'):.1f}")
+
+    if differenze:
+        print(f"❌ {differenze} differenze tra lxml e BeautifulSoup.")
+        return 1
+    print("✅ Dict identici su tutte le pagine.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
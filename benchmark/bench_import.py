@@ -0,0 +1,112 @@
+# benchmark/bench_import.py
+"""
+Tempo di avvio (import a freddo) degli script di ingresso, misurato con `python -X importtime`.
+
+Per ogni script lancia un interprete nuovo che fa solo `import <modulo>` (il codice sotto
+`if __name__ == "__main__"` non gira), somma il tempo cumulativo di import del modulo e mostra
+i 5 import diretti più pesanti. Il valore riportato è la mediana su N ripetizioni.
+
+Ogni script ha un budget in ms (BUDGET_MS): se la mediana lo supera il benchmark esce con 1,
+così può essere usato come controllo prima di un rilascio.
+
+Uso:
+  python benchmark/bench_import.py [--ripetizioni N] [--solo NOME ...] [--scala X]
+
+Exit code:
+  0 -> tutti gli script entro il budget
+  1 -> almeno uno script oltre il budget
+  2 -> almeno uno script non importabile (dipendenza mancante, errore a import)
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+RADICE = Path(__file__).resolve().parent.parent
+SCREPERINO = RADICE / "Screperino" / "Screperino"
+MASE = RADICE / "MASE" / "script"
+
+# nome -> (cartella, modulo, budget ms)
+SCRIPT = {
+    "main2_screperino":       (SCREPERINO, "main2_screperino", 300),
+    "estrazione_giornaliera": (SCREPERINO, "estrazione_giornaliera", 1500),
+    "pulisci_giornaliera":    (SCREPERINO, "pulisci_giornaliera", 1200),
+    "pulisci_bot":            (SCREPERINO, "pulisci_bot", 1200),
+    "unione_finale":          (SCREPERINO, "unione_finale", 1200),
+    "backfill_eod":           (SCREPERINO, "backfill_eod", 300),
+    "gestore2":               (MASE, "gestore2", 200),
+    "elaboratore":            (MASE, "elaboratore", 1500),
+    "screp":                  (MASE, "screp", 1200),
+}
+BUDGET_MS = {nome: budget for nome, (_, _, budget) in SCRIPT.items()}
+
+RIGA = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def misura(cartella, modulo):
+    """Ritorna (ms cumulativi del modulo, [(ms, import diretto)]) oppure solleva RuntimeError."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(RADICE), os.environ.get("PYTHONPATH", "")]))
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=str(cartella), env=env, text=True, capture_output=True,
+    )
+    if res.returncode != 0:
+        ultima = (res.stderr.strip().splitlines() or ["?"])[-1]
+        raise RuntimeError(ultima)
+
+    righe = []
+    for linea in res.stderr.splitlines():
+        m = RIGA.match(linea)
+        if m:
+            righe.append((int(m.group(2)), len(m.group(3)), m.group(4)))
+
+    # importtime scrive i figli prima del padre: i figli diretti del modulo sono le righe
+    # con un livello di rientro in più subito prima della sua
+    totale_us, figli = None, []
+    for i, (cumulativo, rientro, nome) in enumerate(righe):
+        if nome == modulo and rientro == 1:
+            totale_us = cumulativo
+            j = i - 1
+            while j >= 0 and righe[j][1] > rientro:
+                if righe[j][1] == rientro + 2:
+                    figli.append((righe[j][0] / 1000, righe[j][2]))
+                j -= 1
+            break
+    if totale_us is None:
+        raise RuntimeError(f"modulo {modulo} non trovato nell'output di -X importtime")
+    return totale_us / 1000, sorted(figli, reverse=True)[:5]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ripetizioni", type=int, default=3)
+    parser.add_argument("--solo", nargs="*", choices=sorted(SCRIPT), help="Misura solo questi script")
+    parser.add_argument("--scala", type=float, default=1.0, help="Moltiplica i budget (macchine più lente)")
+    args = parser.parse_args()
+
+    esito = 0
+    print(f"{'script':<24}{'mediana ms':>12}{'budget ms':>11}  import più pesanti")
+    for nome in args.solo or SCRIPT:
+        cartella, modulo, _ = SCRIPT[nome]
+        budget = BUDGET_MS[nome] * args.scala
+        try:
+            misure = [misura(cartella, modulo) for _ in range(max(1, args.ripetizioni))]
+        except RuntimeError as e:
+            print(f"{nome:<24}{'ERRORE':>12}{budget:>11.0f}  {e}")
+            esito = max(esito, 2)
+            continue
+        mediana = statistics.median(ms for ms, _ in misure)
+        pesanti = ", ".join(f"{n} {ms:.0f}" for ms, n in misure[-1][1])
+        oltre = mediana > budget
+        if oltre:
+            esito = max(esito, 1)
+        print(f"{nome:<24}{mediana:>12.0f}{budget:>11.0f}  {pesanti}{'  <-- OLTRE BUDGET' if oltre else ''}")
+    return esito
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,6 +10,8 @@ BASE_DIR = Path(__file__).resolve().parent
 SCREPERINO_DIR  = BASE_DIR / "Screperino" / "Screperino"
 # cartella dati (input/output/log)
 SCREPERINO_ROOT = BASE_DIR / "Screperino"
+# stato persistente tra un run e l'altro (impronte viaggi, ecc.)
+SCREPERINO_STATO = SCREPERINO_ROOT / "Stato"
 
 # --- MASE ---
 # cartella script
@@ -26,6 +28,15 @@ MASE_TEMP              = MASE_INPUT / "File_Temp"         # mmsi_*.csv
 MASE_OUTPUT_NAVI       = MASE_OUTPUT / "Navi_Estratte"    # Report_Navi_Tracciate_MASTER.xlsx
 MASE_CHROME_PROFILE    = MASE_ROOT / "chrome-profile"     # user-data-dir Chrome
 
+# --- Cache condivise (A + MASE) ---
+CACHE_DIR            = BASE_DIR / "Cache"
+HTTP_CACHE_DIR       = CACHE_DIR / "http"           # pagine vessel-mmsi-*
+HTTP_CACHE_ATTIVA    = True
+HTTP_CACHE_TTL_SEC   = 30 * 60                      # entro il TTL niente rete; oltre, GET condizionale
+HTTP_CACHE_MAX_BYTES = 500 * 1024 * 1024            # oltre questa soglia sfratto LRU
+BOT_CATALOGO_DIR     = CACHE_DIR / "bot"            # catalogo date + copie TRATTE di File_Input/Bot
+STATICI_CACHE_DIR    = CACHE_DIR / "statici"        # MASTER_IHS / DECODIFICA già normalizzati
+
 # Python interpreti (usa quello corrente)
 PYTHON_A = sys.executable
 PYTHON_B = sys.executable
@@ -36,12 +47,79 @@ B_FILE  = MASE_DIR / "gestore2.py"  # entry MASE
 LOG_DIR = SCREPERINO_ROOT / "Log"
 LAST_B   = LOG_DIR / "last_b_run.txt"
 LAST_EOD = LOG_DIR / "last_eod.txt"
+STORICO_RUN_DB = LOG_DIR / "storico_run.sqlite3"  # storico dei run (storico_run.py); LAST_B/LAST_EOD restano come riserva
 
 # --- EOD / schedulazione ---
 EOD_HOUR  = 23
 EOD_MIN   = 30
 B_EVERY_H = 4
 A_MINUTE  = 5  # esegui A a :05
+EOD_BACKFILL_WORKERS = 2  # date elaborate in parallelo da backfill_eod.py
+EOD_MEMO_ATTIVA      = True  # salta gli stadi EOD con input identici all'ultimo run (manifest accanto all'output)
+EOD_MEMO_STORICO     = 30    # run conservati nello storico di ogni manifest
+
+# --- Metriche Prometheus (metriche.py) ---
+METRICHE_ATTIVE     = True
+METRICHE_DIR        = LOG_DIR / "metriche"  # un file <job>.prom per processo (textfile collector)
+METRICHE_HTTP_PORTA = None                   # es. 9109: l'orchestratore espone /metrics su 127.0.0.1
+
+# --- Lettura xlsx negli script EOD ---
+XLSX_WORKERS        = 4                # processi per leggere più xlsx in parallelo
+XLSX_POOL_MIN_BYTES = 2 * 1024 * 1024  # sotto questa dimensione totale si legge in sequenza
+
+# --- Unione finale (EOD) ---
+UNIONE_BOT_MODALITA           = "vicino"  # "vicino": una corsa bot per viaggio (orario più vicino) | "esatta": merge su data+tratta
+UNIONE_BOT_TOLLERANZA_MIN     = 90        # scarto massimo tra orario estratto e orario bot
+UNIONE_BOT_MAX_CORRISPONDENZE = 3         # oltre, le righe bot in più per lo stesso viaggio vengono scartate (con log)
+
+# --- Orchestratore: worker residenti (A ed EOD senza un nuovo interprete per ogni run) ---
+ORCH_RESIDENTE       = False  # True: A ed EOD girano in worker caldi (worker_residente), B resta sottoprocesso
+RESIDENTE_WORKERS    = 2      # worker caldi (2: pulisci_giornaliera e pulisci_bot in parallelo)
+RESIDENTE_MAX_JOB    = 24     # job per worker prima del riciclo
+RESIDENTE_MAX_RSS_MB = 1500   # oltre questa memoria residente il worker viene riciclato
+
+# --- Output dei processi figli (stream_runner, anche per i worker residenti) ---
+ORCH_INATTIVITA_A_SEC   = 20 * 60  # A senza output per più di così -> terminato (deve chiudere prima del :05 successivo)
+ORCH_INATTIVITA_EOD_SEC = 30 * 60  # script EOD senza output per più di così -> terminato
+ORCH_INATTIVITA_B_SEC   = 40 * 60  # gestore2 (B) visto dall'orchestratore
+MASE_INATTIVITA_SEC     = 30 * 60  # screp/elaboratore visti da gestore2
+
+# --- MASE: screp (pagine /inport dei porti) ---
+SCREP_MODALITA        = "http"  # "http": requests + parsing diretto, browser solo se manca la tabella | "browser": solo Selenium
+SCREP_HTTP_MAX_MANCATE = 3      # pagine di fila senza tabella via HTTP dopo cui il run prosegue solo col browser
+SCREP_WORKERS          = 4      # porti scansionati in parallelo (ritmo comunque globale, vedi rate_limiter)
+
+# --- MASE: pool di browser residenti (MASE/script/pool_browser.py) ---
+BROWSER_POOL_ATTIVO           = True     # usa il pool se il servizio è in ascolto, altrimenti Chrome a freddo
+BROWSER_POOL_PORTA            = 9230     # API di noleggio su 127.0.0.1
+BROWSER_POOL_PORTA_DEBUG      = 9240     # porta DevTools dello slot n = questa + n
+BROWSER_POOL_DIMENSIONE       = 2        # Chrome tenuti caldi
+BROWSER_POOL_HEADLESS         = False
+BROWSER_POOL_MAX_PAGINE       = 500      # pagine caricate prima del riciclo dello slot
+BROWSER_POOL_MAX_RSS_MB       = 2000     # Chrome + chromedriver oltre questa memoria -> riciclo (serve psutil)
+BROWSER_POOL_RINNOVO_SEC      = 60       # il cliente rinnova il noleggio ogni N secondi finché è vivo
+BROWSER_POOL_SCADENZA_SEC     = 5 * 60   # noleggio senza rinnovi da più di così: cliente morto, slot ripreso e riavviato
+BROWSER_POOL_ATTESA_SEC       = 30       # attesa di uno slot libero prima di ripiegare su Chrome a freddo
+BROWSER_POOL_CONTROLLO_SEC    = 60       # intervallo dei health check sugli slot liberi
+
+# --- Ritmo richieste verso myshiptracking (AIMD per processo, budget per host comune ad A e MASE) ---
+RATE_INIZIALE   = 4.0   # req/s al primo avvio (~A_MAX_PER_HOST pagine da ~1s in volo); poi si riparte dall'ultimo ritmo salvato
+RATE_MIN        = 0.2
+RATE_MAX        = 8.0
+RATE_INCREMENTO = 0.05  # +req/s per ogni risposta sana
+RATE_RIDUZIONE  = 0.5   # fattore su 429/403/5xx/timeout
+RATE_BUDGET_HOST = 8.0  # req/s totali verso l'host, divisi tra i processi attivi (A e B sovrapposti)
+
+# --- Estrazione oraria (A) ---
+A_WORKERS      = 8  # richieste MMSI in parallelo (1 = sequenziale come in origine)
+A_MAX_PER_HOST = 4  # tetto di richieste contemporanee verso lo stesso host
+A_SOLO_VARIAZIONI = True  # file orario con i soli viaggi nuovi/cambiati (--completo per lo snapshot intero)
+A_JOURNAL_FSYNC_OGNI = 50  # fsync del journal orario ogni N MMSI (crash-safe, vedi --resume)
+A_PIANIFICATORE    = True  # interroga solo gli MMSI dovuti (--tutti per forzare il giro completo)
+A_STALENESS_MAX_H  = 4     # ogni MMSI è comunque interrogato almeno ogni N ore
+A_FINESTRA_CALDA_H = 3     # dopo un cambio di viaggio l'MMSI resta "caldo" (ogni ora) per N ore
+A_FATTORE_DURATA   = 0.5   # nuovo viaggio atteso non prima di arrivo + fattore x durata dell'ultimo
+A_MARGINE_H        = 1     # anticipo di sicurezza sulle stime
 
 def ensure_dirs():
     """Crea le cartelle necessarie se mancano (Screperino + MASE)."""
@@ -54,7 +132,9 @@ def ensure_dirs():
         SCREPERINO_ROOT / "File_Output" / "Estrazioni_Giornaliere_Pulite",
         SCREPERINO_ROOT / "File_Output" / "Bot_Pulito",
         SCREPERINO_ROOT / "File_Output" / "Master",
+        SCREPERINO_STATO,
         LOG_DIR,
+        METRICHE_DIR,
     ]:
         os.makedirs(p, exist_ok=True)
 
@@ -67,3 +147,11 @@ def ensure_dirs():
         MASE_CHROME_PROFILE,
     ]:
         os.makedirs(p, exist_ok=True)
+
+    # Cache condivise
+    for p in [
+        HTTP_CACHE_DIR,
+        BOT_CATALOGO_DIR,
+        STATICI_CACHE_DIR,
+    ]:
+        os.makedirs(p, exist_ok=True)
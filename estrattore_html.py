@@ -0,0 +1,288 @@
+# estrattore_html.py
+"""
+Estrazione mirata dei campi dalle pagine vessel-mmsi-* di myshiptracking.
+
+Servono solo pochi nodi:
+  - A (estrazione_giornaliera): cella IMO + prima riga di #ft-lasttrips
+  - B (elaboratore):            blocchi di #vpage-current-trip + prima riga di #ft-lasttrips
+
+Percorso veloce: parser incrementale lxml (HTMLPullParser) alimentato a blocchi, che si ferma
+appena i nodi richiesti sono chiusi, senza costruire il resto della pagina.
+Percorso di riserva: BeautifulSoup 'html.parser', identico alla logica storica degli script.
+Il fallback scatta se lxml non è installato o se il percorso veloce solleva un'eccezione;
+BeautifulSoup viene importato solo in quel caso.
+
+benchmark/bench_estrattore.py confronta i due percorsi su pagine salvate.
+"""
+
+import logging
+
+try:
+    from lxml import etree
+except ImportError:  # lxml opzionale: resta solo BeautifulSoup
+    etree = None
+
+BLOCCO_FEED = 64 * 1024
+MOTORI = ("auto", "lxml", "bs4")
+
+
+def separa_data_ora(datetime_str):
+    testo = datetime_str.strip()
+    if len(testo) > 10 and testo[4] == '-' and testo[7] == '-':
+        data, ora = testo[:10], testo[10:]
+        if ':' in ora:
+            return data, ora
+    return testo, 'N/A'
+
+
+# =========================
+# Percorso BeautifulSoup (riferimento)
+# =========================
+def _nave_bs4(html, mmsi):
+    from bs4 import BeautifulSoup  # import ritardato: serve solo come riserva
+    soup = BeautifulSoup(html, 'html.parser')
+
+    imo_trovato = 'N/A'
+    imo_header_tag = soup.find('b', string='IMO')
+    if imo_header_tag and imo_header_tag.find_parent('td') and imo_header_tag.find_parent('td').find_next_sibling('td'):
+        imo_trovato = imo_header_tag.find_parent('td').find_next_sibling('td').get_text(strip=True)
+
+    dati_base = {'MMSI': mmsi, 'IMO': imo_trovato}
+
+    sezione_viaggi = soup.find('div', id='ft-lasttrips')
+    tabella = sezione_viaggi.find('table', class_='myst-table') if sezione_viaggi else None
+    if not tabella or not tabella.find('tbody'):
+        return dati_base
+
+    righe = tabella.find('tbody').find_all('tr')
+    if righe:
+        prima_riga = righe[0]
+        celle = prima_riga.find_all('td')
+        if len(celle) > 5:
+            date_departure, time_departure = separa_data_ora(celle[2].get_text(strip=True))
+            date_arrival, time_arrival = separa_data_ora(celle[4].get_text(strip=True))
+            duration_cell = prima_riga.find('td', class_='table-more-td')
+            duration = duration_cell.get('data-dur', 'N/A').strip() if duration_cell else 'N/A'
+            dati_base.update({
+                'Origin': celle[1].get_text(strip=True),
+                'Date Departure': date_departure,
+                'Time Departure': time_departure,
+                'Destination': celle[3].get_text(strip=True),
+                'Date Arrival': date_arrival,
+                'Time Arrival': time_arrival,
+                'Duration': duration,
+                'Distance': celle[5].get_text(strip=True)
+            })
+    return dati_base
+
+
+def _viaggio_bs4(html):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    dati_viaggi = {}
+
+    sezione_viaggio_attuale = soup.find('div', id='vpage-current-trip')
+    if sezione_viaggio_attuale:
+        blocchi = sezione_viaggio_attuale.find_all('div', class_='myst-arrival-cont')
+        if len(blocchi) >= 2:
+            dati_viaggi['Porto Partenza Scraped'] = blocchi[0].find('h3').get_text(strip=True)
+            partenza_raw = blocchi[0].find_all('span', class_='line')
+            dati_viaggi['Data Partenza Completa'] = f"{partenza_raw[0].text.strip()} {partenza_raw[1].text.strip()}"
+
+            dati_viaggi['Porto Arrivo'] = blocchi[1].find('h3').get_text(strip=True)
+            arrivo_raw = blocchi[1].find_all('span', class_='line')
+            dati_viaggi['Data Arrivo Completa'] = f"{arrivo_raw[0].text.strip()} {arrivo_raw[1].text.strip()}"
+
+    sezione_storico = soup.find('div', id='ft-lasttrips')
+    if sezione_storico and sezione_storico.find('tbody'):
+        prima_riga = sezione_storico.find('tbody').find('tr')
+        if prima_riga and prima_riga.find('td'):
+            celle = prima_riga.find_all('td')
+            if len(celle) >= 5:
+                dati_viaggi['Origin'] = celle[1].get_text(strip=True)
+                dati_viaggi['Departure'] = celle[2].get_text(strip=True)
+                dati_viaggi['Destination'] = celle[3].get_text(strip=True)
+                dati_viaggi['Arrival'] = celle[4].get_text(strip=True)
+    return dati_viaggi
+
+
+# =========================
+# Percorso lxml (veloce, con stop anticipato)
+# =========================
+def _testo(el, strip=True):
+    """Equivalente di get_text(strip=True) / .text di BeautifulSoup."""
+    if strip:
+        return ''.join(t.strip() for t in el.itertext())
+    return ''.join(el.itertext())
+
+
+def _ha_classe(el, classe):
+    return classe in (el.get('class') or '').split()
+
+
+def _stringa(el):
+    """Equivalente di Tag.string: testo dell'unico figlio, scendendo finché c'è un solo figlio."""
+    if len(el) == 0:
+        return el.text
+    if len(el) == 1 and not el.text and not el[0].tail and isinstance(el[0].tag, str):
+        return _stringa(el[0])
+    return None
+
+
+def _primo(el, tag, classe=None):
+    for x in el.iter(tag):
+        if x is not el and (classe is None or _ha_classe(x, classe)):
+            return x
+    return None
+
+
+def _tutti(el, tag, classe=None):
+    return [x for x in el.iter(tag) if x is not el and (classe is None or _ha_classe(x, classe))]
+
+
+class _Scansione:
+    """
+    Alimenta un HTMLPullParser a blocchi e si ferma quando tutte le sezioni `ids` sono chiuse
+    (e, se richiesto, la riga che contiene la cella IMO).
+    """
+
+    def __init__(self, html, ids, cerca_imo):
+        self.sezioni = {i: None for i in ids}
+        self._chiuse = set()
+        self.cerca_imo = cerca_imo
+        self.b_imo = None
+        self._imo_risolto = not cerca_imo
+        self._attesa_imo = None
+        self._esegui(html)
+
+    def _completa(self):
+        return self._imo_risolto and len(self._chiuse) == len(self.sezioni)
+
+    def _consuma(self, parser):
+        for evento, el in parser.read_events():
+            if evento == 'start':
+                id_el = el.get('id')
+                if el.tag == 'div' and id_el in self.sezioni and self.sezioni[id_el] is None:
+                    self.sezioni[id_el] = el
+                continue
+            if el.tag == 'div' and el.get('id') in self.sezioni and self.sezioni[el.get('id')] is el:
+                self._chiuse.add(el.get('id'))
+            elif self.cerca_imo and self.b_imo is None and el.tag == 'b' and _stringa(el) == 'IMO':
+                self.b_imo = el
+                td = next(el.iterancestors('td'), None)
+                if td is None:
+                    self._imo_risolto = True
+                else:
+                    # i fratelli della cella sono completi quando si chiude il suo genitore
+                    self._attesa_imo = td.getparent()
+            elif self._attesa_imo is not None and el is self._attesa_imo:
+                self._imo_risolto = True
+            if self._completa():
+                return True
+        return False
+
+    def _esegui(self, html):
+        parser = etree.HTMLPullParser(events=('start', 'end'))
+        for inizio in range(0, len(html), BLOCCO_FEED):
+            parser.feed(html[inizio:inizio + BLOCCO_FEED])
+            if self._consuma(parser):
+                return
+        parser.close()
+        self._consuma(parser)
+
+
+def _nave_lxml(html, mmsi):
+    scan = _Scansione(html, ('ft-lasttrips',), cerca_imo=True)
+
+    imo_trovato = 'N/A'
+    if scan.b_imo is not None:
+        td = next(scan.b_imo.iterancestors('td'), None)
+        successiva = next(td.itersiblings('td'), None) if td is not None else None
+        if successiva is not None:
+            imo_trovato = _testo(successiva)
+
+    dati_base = {'MMSI': mmsi, 'IMO': imo_trovato}
+
+    sezione_viaggi = scan.sezioni['ft-lasttrips']
+    tabella = _primo(sezione_viaggi, 'table', 'myst-table') if sezione_viaggi is not None else None
+    tbody = _primo(tabella, 'tbody') if tabella is not None else None
+    if tbody is None:
+        return dati_base
+
+    righe = _tutti(tbody, 'tr')
+    if righe:
+        prima_riga = righe[0]
+        celle = _tutti(prima_riga, 'td')
+        if len(celle) > 5:
+            date_departure, time_departure = separa_data_ora(_testo(celle[2]))
+            date_arrival, time_arrival = separa_data_ora(_testo(celle[4]))
+            duration_cell = _primo(prima_riga, 'td', 'table-more-td')
+            duration = duration_cell.get('data-dur', 'N/A').strip() if duration_cell is not None else 'N/A'
+            dati_base.update({
+                'Origin': _testo(celle[1]),
+                'Date Departure': date_departure,
+                'Time Departure': time_departure,
+                'Destination': _testo(celle[3]),
+                'Date Arrival': date_arrival,
+                'Time Arrival': time_arrival,
+                'Duration': duration,
+                'Distance': _testo(celle[5])
+            })
+    return dati_base
+
+
+def _viaggio_lxml(html):
+    scan = _Scansione(html, ('vpage-current-trip', 'ft-lasttrips'), cerca_imo=False)
+    dati_viaggi = {}
+
+    sezione_viaggio_attuale = scan.sezioni['vpage-current-trip']
+    if sezione_viaggio_attuale is not None:
+        blocchi = _tutti(sezione_viaggio_attuale, 'div', 'myst-arrival-cont')
+        if len(blocchi) >= 2:
+            dati_viaggi['Porto Partenza Scraped'] = _testo(_primo(blocchi[0], 'h3'))
+            partenza_raw = _tutti(blocchi[0], 'span', 'line')
+            dati_viaggi['Data Partenza Completa'] = f"{_testo(partenza_raw[0], False).strip()} {_testo(partenza_raw[1], False).strip()}"
+
+            dati_viaggi['Porto Arrivo'] = _testo(_primo(blocchi[1], 'h3'))
+            arrivo_raw = _tutti(blocchi[1], 'span', 'line')
+            dati_viaggi['Data Arrivo Completa'] = f"{_testo(arrivo_raw[0], False).strip()} {_testo(arrivo_raw[1], False).strip()}"
+
+    sezione_storico = scan.sezioni['ft-lasttrips']
+    tbody = _primo(sezione_storico, 'tbody') if sezione_storico is not None else None
+    if tbody is not None:
+        prima_riga = _primo(tbody, 'tr')
+        if prima_riga is not None and _primo(prima_riga, 'td') is not None:
+            celle = _tutti(prima_riga, 'td')
+            if len(celle) >= 5:
+                dati_viaggi['Origin'] = _testo(celle[1])
+                dati_viaggi['Departure'] = _testo(celle[2])
+                dati_viaggi['Destination'] = _testo(celle[3])
+                dati_viaggi['Arrival'] = _testo(celle[4])
+    return dati_viaggi
+
+
+# =========================
+# API
+# =========================
+def _con_fallback(veloce, riserva, motore, *args):
+    if motore not in MOTORI:
+        raise ValueError(f"Motore di parsing sconosciuto: {motore}")
+    if motore == 'bs4' or etree is None:
+        return riserva(*args)
+    if motore == 'lxml':
+        return veloce(*args)
+    try:
+        return veloce(*args)
+    except Exception as e:
+        logging.debug(f"Percorso lxml fallito ({e}), uso BeautifulSoup.")
+        return riserva(*args)
+
+
+def estrai_dati_nave_html(html, mmsi, motore='auto'):
+    """Dati per A: {'MMSI', 'IMO'} più i campi dell'ultimo viaggio, se la tabella #ft-lasttrips ha una riga valida."""
+    return _con_fallback(_nave_lxml, _nave_bs4, motore, html, mmsi)
+
+
+def estrai_dati_viaggio_html(html, motore='auto'):
+    """Dati per B: viaggio attuale (#vpage-current-trip) e precedente (prima riga di #ft-lasttrips)."""
+    return _con_fallback(_viaggio_lxml, _viaggio_bs4, motore, html)
@@ -0,0 +1,231 @@
+# http_cache.py
+"""
+Cache HTTP su disco condivisa da Screperino (A) e MASE (B).
+
+Ogni URL è salvato in due file nella cartella di cache:
+  <sha1>.html  -> corpo della risposta
+  <sha1>.json  -> metadati (url, ETag, Last-Modified, istante di salvataggio, TTL,
+                  hash del corpo, eventuale risultato del parsing)
+
+- Entro il TTL la pagina è servita dal disco senza rete (hit).
+- Oltre il TTL, se il server ha fornito ETag/Last-Modified, si fa una GET condizionale:
+  su 304 si rinnova l'entry e si riusa anche il parsing già fatto (rivalidato).
+- La dimensione totale è limitata: oltre `max_bytes` si eliminano le entry usate meno di recente (LRU).
+
+Le scritture sono atomiche (tmp + os.replace), quindi A e B possono usare la stessa cartella.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from config import HTTP_CACHE_DIR, HTTP_CACHE_TTL_SEC, HTTP_CACHE_MAX_BYTES
+from rate_limiter import get_con_ritmo
+
+
+def _chiave(url):
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def _scrivi_atomico(path, dati, binario=False):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if binario:
+        with open(tmp, "wb") as f:
+            f.write(dati)
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(dati)
+    os.replace(tmp, path)
+
+
+class RispostaCache:
+    """Risposta servita dalla cache: espone lo stesso sottoinsieme di requests.Response usato dagli script."""
+
+    def __init__(self, url, text, esito, parsed=None):
+        self.url = url
+        self.text = text
+        self.status_code = 200
+        self.esito = esito      # 'hit' | 'rivalidato' | 'miss'
+        self.parsed = parsed    # risultato del parsing salvato in precedenza (o None)
+
+    @property
+    def da_cache(self):
+        return self.esito != "miss"
+
+    def raise_for_status(self):
+        return None
+
+
+class HttpCache:
+    def __init__(self, cartella=HTTP_CACHE_DIR, ttl_sec=HTTP_CACHE_TTL_SEC, max_bytes=HTTP_CACHE_MAX_BYTES):
+        self.cartella = str(cartella)
+        self.ttl_sec = ttl_sec
+        self.max_bytes = max_bytes
+        self.contatori = {"hit": 0, "rivalidato": 0, "miss": 0, "sfrattate": 0}
+        self._lock = threading.Lock()
+        self._indice = {}  # chiave -> [ultimo_accesso, bytes]
+        os.makedirs(self.cartella, exist_ok=True)
+        self._carica_indice()
+
+    # ----- indice LRU -----
+    def _carica_indice(self):
+        for nome in os.listdir(self.cartella):
+            if not nome.endswith(".json"):
+                continue
+            chiave = nome[:-5]
+            try:
+                accesso = os.path.getmtime(os.path.join(self.cartella, nome))
+                dimensione = os.path.getsize(os.path.join(self.cartella, chiave + ".html"))
+            except OSError:
+                continue
+            self._indice[chiave] = [accesso, dimensione]
+
+    def _tocca(self, chiave):
+        adesso = time.time()
+        if chiave in self._indice:
+            self._indice[chiave][0] = adesso
+        try:
+            os.utime(os.path.join(self.cartella, chiave + ".json"), (adesso, adesso))
+        except OSError:
+            pass
+
+    def _sfratta(self):
+        totale = sum(d for _, d in self._indice.values())
+        if totale <= self.max_bytes:
+            return
+        for chiave, (_, dimensione) in sorted(self._indice.items(), key=lambda kv: kv[1][0]):
+            for est in (".json", ".html"):
+                try:
+                    os.remove(os.path.join(self.cartella, chiave + est))
+                except OSError:
+                    pass
+            del self._indice[chiave]
+            self.contatori["sfrattate"] += 1
+            totale -= dimensione
+            if totale <= self.max_bytes:
+                break
+
+    # ----- lettura/scrittura entry -----
+    def _leggi_meta(self, chiave):
+        try:
+            with open(os.path.join(self.cartella, chiave + ".json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _leggi_corpo(self, chiave):
+        try:
+            with open(os.path.join(self.cartella, chiave + ".html"), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _scrivi_meta(self, chiave, meta):
+        _scrivi_atomico(os.path.join(self.cartella, chiave + ".json"), json.dumps(meta, ensure_ascii=False))
+
+    def salva(self, url, text, etag=None, last_modified=None, ttl_sec=None):
+        """Salva (o sostituisce) il corpo di `url`. Il parsing salvato resta valido solo se il corpo non è cambiato."""
+        chiave = _chiave(url)
+        corpo = text.encode("utf-8")
+        digest = hashlib.sha1(corpo).hexdigest()
+        precedente = self._leggi_meta(chiave) or {}
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "salvato": time.time(),
+            "ttl": self.ttl_sec if ttl_sec is None else ttl_sec,
+            "sha1": digest,
+            "parsed": precedente.get("parsed") if precedente.get("sha1") == digest else None,
+        }
+        with self._lock:
+            _scrivi_atomico(os.path.join(self.cartella, chiave + ".html"), corpo, binario=True)
+            self._scrivi_meta(chiave, meta)
+            self._indice[chiave] = [time.time(), len(corpo)]
+            self._sfratta()
+        return meta
+
+    def salva_parsed(self, url, parsed):
+        """Associa all'entry di `url` il risultato del parsing, riusato finché la pagina non cambia."""
+        chiave = _chiave(url)
+        with self._lock:
+            meta = self._leggi_meta(chiave)
+            if meta is None:
+                return
+            meta["parsed"] = parsed
+            self._scrivi_meta(chiave, meta)
+
+    def leggi_fresco(self, url):
+        """Ritorna il corpo di `url` se in cache e dentro il TTL, altrimenti None (nessuna richiesta di rete)."""
+        chiave = _chiave(url)
+        meta = self._leggi_meta(chiave)
+        if meta and time.time() - meta.get("salvato", 0) < meta.get("ttl", self.ttl_sec):
+            corpo = self._leggi_corpo(chiave)
+            if corpo is not None:
+                with self._lock:
+                    self.contatori["hit"] += 1
+                    self._tocca(chiave)
+                return corpo
+        with self._lock:
+            self.contatori["miss"] += 1
+        return None
+
+    def get(self, url, sessione, headers=None, timeout=20, ttl_sec=None, limiter=None):
+        """
+        GET con cache. Ritorna una RispostaCache (hit/rivalidato/miss) oppure, se il server risponde
+        con un errore, la requests.Response originale (così raise_for_status() funziona come prima).
+        Solo le richieste che vanno davvero in rete passano dal `limiter`.
+        """
+        chiave = _chiave(url)
+        meta = self._leggi_meta(chiave)
+        corpo = self._leggi_corpo(chiave) if meta else None
+        if meta and corpo is not None:
+            if time.time() - meta.get("salvato", 0) < meta.get("ttl", self.ttl_sec):
+                with self._lock:
+                    self.contatori["hit"] += 1
+                    self._tocca(chiave)
+                return RispostaCache(url, corpo, "hit", meta.get("parsed"))
+
+        headers = dict(headers or {})
+        if meta and corpo is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = get_con_ritmo(sessione, url, limiter, headers=headers, timeout=timeout)
+
+        if response.status_code == 304 and meta and corpo is not None:
+            meta["salvato"] = time.time()
+            if ttl_sec is not None:
+                meta["ttl"] = ttl_sec
+            with self._lock:
+                self._scrivi_meta(chiave, meta)
+                self.contatori["rivalidato"] += 1
+                self._tocca(chiave)
+            return RispostaCache(url, corpo, "rivalidato", meta.get("parsed"))
+
+        with self._lock:
+            self.contatori["miss"] += 1
+        if response.status_code != 200:
+            return response
+
+        nuovo = self.salva(url, response.text,
+                           etag=response.headers.get("ETag"),
+                           last_modified=response.headers.get("Last-Modified"),
+                           ttl_sec=ttl_sec)
+        # stesso corpo di prima anche senza validatori: il parsing salvato è ancora buono
+        return RispostaCache(url, response.text, "miss", nuovo.get("parsed"))
+
+    def riepilogo(self):
+        c = self.contatori
+        richieste = c["hit"] + c["rivalidato"] + c["miss"]
+        quota = (c["hit"] + c["rivalidato"]) / richieste * 100 if richieste else 0.0
+        return (f"Cache HTTP: hit={c['hit']} rivalidati={c['rivalidato']} miss={c['miss']} "
+                f"sfrattate={c['sfrattate']} (riuso {quota:.0f}%, {len(self._indice)} entry)")
+
+    def log_stats(self, logger=None):
+        (logger or logging).info(self.riepilogo())
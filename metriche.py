@@ -0,0 +1,291 @@
+# metriche.py
+"""
+Metriche in formato Prometheus (testo), senza dipendenze esterne.
+
+Ogni processo (A, screp, elaboratore, orchestratore) accumula contatori, gauge e istogrammi in
+memoria e a fine run li scrive in METRICHE_DIR/<processo>.prom (scrittura atomica), con l'etichetta
+processo="<processo>" su ogni campione ("job" è riservata a Prometheus).
+La cartella può essere letta in due modi:
+  - textfile collector di node_exporter (--collector.textfile.directory=<METRICHE_DIR>)
+  - endpoint HTTP locale che unisce tutti i file:  python metriche.py serve [--porta 9109]
+    (oppure avviato dall'orchestratore se METRICHE_HTTP_PORTA è impostata)
+
+Uso negli script:
+    from metriche import REGISTRO
+    FETCH = REGISTRO.istogramma("fetch_secondi", "Latenza per MMSI", ["funzione"])
+    @FETCH.misura(funzione="estrai_dati_nave")
+    def estrai_dati_nave(...): ...
+    REGISTRO.scrivi("estrazione_giornaliera")
+
+Thread-safe. Con METRICHE_ATTIVE = False scrivi() non fa nulla (le misure restano in memoria).
+"""
+
+import argparse
+import functools
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from config import METRICHE_ATTIVE, METRICHE_DIR, METRICHE_HTTP_PORTA
+
+PREFISSO = "screperino_"
+BUCKET_SECONDI = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+TIPO_CONTENUTO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(valore):
+    return str(valore).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etichette(coppie):
+    if not coppie:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in coppie) + "}"
+
+
+def _numero(valore):
+    if valore == math.inf:
+        return "+Inf"
+    return repr(float(valore)) if isinstance(valore, float) else str(valore)
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, aiuto, etichette=()):
+        self.nome = PREFISSO + nome
+        self.aiuto = aiuto
+        self.etichette = tuple(etichette)
+        self._valori = {}
+        self._lock = threading.Lock()
+
+    def _chiave(self, etichette):
+        if set(etichette) != set(self.etichette):
+            raise ValueError(f"{self.nome}: etichette attese {self.etichette}, ricevute {tuple(etichette)}")
+        return tuple(str(etichette[k]) for k in self.etichette)
+
+    def campioni(self, extra=()):
+        """[(nome, [(etichetta, valore)], valore)] da esporre."""
+        with self._lock:
+            return [(self.nome, list(extra) + list(zip(self.etichette, k)), v) for k, v in sorted(self._valori.items())]
+
+
+class Contatore(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valore=1, **etichette):
+        chiave = self._chiave(etichette)
+        with self._lock:
+            self._valori[chiave] = self._valori.get(chiave, 0) + valore
+
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def imposta(self, valore, **etichette):
+        chiave = self._chiave(etichette)
+        with self._lock:
+            self._valori[chiave] = valore
+
+
+class Istogramma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, aiuto, etichette=(), bucket=BUCKET_SECONDI):
+        super().__init__(nome, aiuto, etichette)
+        self.bucket = tuple(sorted(bucket)) + (math.inf,)
+
+    def osserva(self, valore, **etichette):
+        chiave = self._chiave(etichette)
+        with self._lock:
+            conteggi, somma = self._valori.get(chiave, ([0] * len(self.bucket), 0.0))
+            for i, limite in enumerate(self.bucket):
+                if valore <= limite:
+                    conteggi[i] += 1
+            self._valori[chiave] = (conteggi, somma + valore)
+
+    @contextmanager
+    def tempo(self, **etichette):
+        """Misura la durata del blocco (anche se solleva)."""
+        inizio = time.monotonic()
+        try:
+            yield
+        finally:
+            self.osserva(time.monotonic() - inizio, **etichette)
+
+    def misura(self, **etichette):
+        """Decoratore: osserva la durata di ogni chiamata della funzione."""
+        def decoratore(fn):
+            @functools.wraps(fn)
+            def avvolta(*args, **kwargs):
+                with self.tempo(**etichette):
+                    return fn(*args, **kwargs)
+            return avvolta
+        return decoratore
+
+    def campioni(self, extra=()):
+        righe = []
+        with self._lock:
+            for k, (conteggi, somma) in sorted(self._valori.items()):
+                base = list(extra) + list(zip(self.etichette, k))
+                for limite, n in zip(self.bucket, conteggi):
+                    righe.append((self.nome + "_bucket", base + [("le", _numero(limite))], n))
+                righe.append((self.nome + "_sum", base, round(somma, 6)))
+                righe.append((self.nome + "_count", base, conteggi[-1]))
+        return righe
+
+
+class Registro:
+    def __init__(self):
+        self._metriche = {}
+        self._lock = threading.Lock()
+        self._lock_scrittura = threading.Lock()
+
+    def _registra(self, classe, nome, aiuto, etichette, **opzioni):
+        with self._lock:
+            metrica = self._metriche.get(nome)
+            if metrica is None:
+                metrica = self._metriche[nome] = classe(nome, aiuto, etichette, **opzioni)
+            elif not isinstance(metrica, classe):
+                raise ValueError(f"Metrica {nome} già registrata come {metrica.tipo}")
+            return metrica
+
+    def contatore(self, nome, aiuto, etichette=()):
+        return self._registra(Contatore, nome, aiuto, etichette)
+
+    def gauge(self, nome, aiuto, etichette=()):
+        return self._registra(Gauge, nome, aiuto, etichette)
+
+    def istogramma(self, nome, aiuto, etichette=(), bucket=BUCKET_SECONDI):
+        return self._registra(Istogramma, nome, aiuto, etichette, bucket=bucket)
+
+    def testo(self, processo=None):
+        """Esposizione Prometheus di tutte le metriche (con processo="<processo>" se indicato)."""
+        extra = [("processo", processo)] if processo else []
+        righe = []
+        with self._lock:
+            metriche = list(self._metriche.values())
+        for m in sorted(metriche, key=lambda m: m.nome):
+            campioni = m.campioni(extra)
+            if not campioni:
+                continue
+            righe.append(f"# HELP {m.nome} {m.aiuto}")
+            righe.append(f"# TYPE {m.nome} {m.tipo}")
+            righe.extend(f"{nome}{_etichette(et)} {_numero(v)}" for nome, et, v in campioni)
+        return "\n".join(righe) + "\n" if righe else ""
+
+    def scrivi(self, processo, cartella=METRICHE_DIR):
+        """
+        Scrive METRICHE_DIR/<processo>.prom in modo atomico. Non solleva: le metriche sono accessorie.
+        Più thread dello stesso processo (orchestratore: B in background, stadi EOD, backfill) scrivono
+        uno alla volta, ognuno col proprio file temporaneo.
+        """
+        if not METRICHE_ATTIVE:
+            return None
+        path = os.path.join(str(cartella), f"{processo}.prom")
+        with self._lock_scrittura:
+            try:
+                os.makedirs(str(cartella), exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(self.testo(processo))
+                    f.write(f"# TYPE {PREFISSO}ultima_scrittura_timestamp gauge\n")
+                    f.write(f'{PREFISSO}ultima_scrittura_timestamp{{processo="{_escape(processo)}"}} {time.time():.0f}\n')
+                os.replace(tmp, path)
+                return path
+            except OSError:
+                return None
+
+
+# registro del processo corrente
+REGISTRO = Registro()
+
+
+# ----- endpoint HTTP: unione dei file .prom -----
+def unisci_textfile(cartella=METRICHE_DIR):
+    """
+    Concatena i .prom della cartella tenendo una sola riga HELP/TYPE per famiglia
+    (la stessa metrica compare in più file con processi diversi).
+    """
+    famiglie = {}
+    try:
+        nomi = sorted(n for n in os.listdir(str(cartella)) if n.endswith(".prom"))
+    except OSError:
+        nomi = []
+    for nome in nomi:
+        try:
+            with open(os.path.join(str(cartella), nome), "r", encoding="utf-8") as f:
+                righe = f.read().splitlines()
+        except OSError:
+            continue
+        corrente = None
+        for riga in righe:
+            if riga.startswith("# HELP ") or riga.startswith("# TYPE "):
+                parti = riga.split(" ", 3)
+                corrente = famiglie.setdefault(parti[2], {"HELP": None, "TYPE": None, "campioni": []})
+                corrente[parti[1]] = corrente[parti[1]] or riga
+            elif riga and not riga.startswith("#") and corrente is not None:
+                corrente["campioni"].append(riga)
+    uscita = []
+    for famiglia in famiglie.values():
+        uscita.extend(r for r in (famiglia["HELP"], famiglia["TYPE"]) if r)
+        uscita.extend(famiglia["campioni"])
+    return "\n".join(uscita) + "\n" if uscita else ""
+
+
+def _gestore(cartella):
+    from http.server import BaseHTTPRequestHandler  # solo per chi espone l'endpoint
+
+    class Gestore(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            corpo = unisci_textfile(cartella).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", TIPO_CONTENUTO)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass  # niente righe per ogni scrape
+
+    return Gestore
+
+
+def avvia_server(porta=METRICHE_HTTP_PORTA, host="127.0.0.1", cartella=METRICHE_DIR):
+    """Avvia l'endpoint /metrics in un thread daemon e ritorna il server (server.shutdown() per fermarlo)."""
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer((host, porta), _gestore(cartella))
+    threading.Thread(target=server.serve_forever, name="metriche-http", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Metriche Prometheus di Screperino/MASE.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_serve = sub.add_parser("serve", help="endpoint HTTP /metrics con tutti i file .prom")
+    p_serve.add_argument("--porta", type=int, default=METRICHE_HTTP_PORTA or 9109)
+    p_serve.add_argument("--host", default="127.0.0.1")
+    sub.add_parser("mostra", help="stampa le metriche correnti")
+    args = parser.parse_args(argv)
+
+    if args.comando == "mostra":
+        sys.stdout.write(unisci_textfile())
+        return 0
+    server = avvia_server(args.porta, args.host)
+    print(f"Metriche su http://{args.host}:{args.porta}/metrics (cartella {METRICHE_DIR}). Ctrl+C per uscire.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+# rate_limiter.py
+"""
+Controllo del ritmo delle richieste verso myshiptracking (AIMD), usato da
+estrazione_giornaliera (A), elaboratore e screp (MASE).
+
+- Risposta sana: il ritmo sale in modo additivo (+`incremento` req/s, fino a `rate_max`).
+- 429, 403, 5xx, timeout o errori di rete: il ritmo è moltiplicato per `riduzione`
+  (al massimo una volta ogni `finestra_taglio` secondi, per non tagliare N volte per la
+  stessa raffica di risposte in volo) e viene rispettato l'eventuale Retry-After.
+- Il ritmo raggiunto viene salvato in Stato/ritmo_<nome>.json e riusato al run successivo.
+
+Il ritmo AIMD è per processo (ogni script ha la sua istanza). Il tetto verso l'host invece è
+comune: ogni limiter attivo tiene un file battito in Stato/ritmo_attivi/ e il budget
+RATE_BUDGET_HOST viene diviso in parti uguali tra i processi vivi (es. A e B sovrapposti),
+così la somma dei ritmi non supera il budget. Un processo morto esce dal conteggio quando
+il suo battito invecchia oltre BATTITO_SCADENZA_SEC; salva() a fine run lo rimuove subito.
+
+Thread-safe: più thread possono chiamare attendi()/esito() sullo stesso oggetto.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from config import (
+    SCREPERINO_STATO, RATE_INIZIALE, RATE_MIN, RATE_MAX, RATE_INCREMENTO, RATE_RIDUZIONE, RATE_BUDGET_HOST,
+)
+from metriche import REGISTRO
+
+RISPOSTE = REGISTRO.contatore(
+    "http_risposte_totale", "Esiti delle richieste per limiter (status HTTP, 'errore' o 'ok' se via browser)",
+    ["limiter", "status"])
+
+STATUS_DA_RALLENTARE = (403, 429)
+DIR_ATTIVI = os.path.join(SCREPERINO_STATO, "ritmo_attivi")
+BATTITO_OGNI_SEC = 5
+BATTITO_SCADENZA_SEC = 60
+
+
+def secondi_retry_after(valore):
+    """Converte l'header Retry-After (secondi o data HTTP) in secondi di attesa; None se assente/non valido."""
+    if not valore:
+        return None
+    valore = str(valore).strip()
+    if valore.isdigit():
+        return float(valore)
+    try:
+        istante = parsedate_to_datetime(valore)
+    except (TypeError, ValueError):
+        return None
+    if istante.tzinfo is None:
+        istante = istante.replace(tzinfo=timezone.utc)
+    return max(0.0, (istante - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiterAIMD:
+    def __init__(self, nome, rate_iniziale=RATE_INIZIALE, rate_min=RATE_MIN, rate_max=RATE_MAX,
+                 incremento=RATE_INCREMENTO, riduzione=RATE_RIDUZIONE, finestra_taglio=2.0,
+                 log=None, log_ogni=50, persistente=True, budget_host=RATE_BUDGET_HOST):
+        self.nome = nome
+        self.rate_min = rate_min
+        self.rate_max = rate_max
+        self.incremento = incremento
+        self.riduzione = riduzione
+        self.finestra_taglio = finestra_taglio
+        self.log = log or logging.info
+        self.log_ogni = log_ogni
+        self.path_stato = os.path.join(SCREPERINO_STATO, f"ritmo_{nome}.json") if persistente else None
+        self.rate = self._carica(rate_iniziale)
+        self.contatori = {"richieste": 0, "ok": 0, "rallentamenti": 0, "errori": 0}
+        self._lock = threading.Lock()
+        self._prossimo = 0.0
+        self._pausa_fino = 0.0
+        self._ultimo_taglio = 0.0
+        self.budget_host = budget_host
+        self._path_battito = os.path.join(DIR_ATTIVI, f"{nome}_{os.getpid()}.json") if persistente else None
+        self._quota = budget_host
+        self._ultimo_battito = None
+
+    def _carica(self, rate_iniziale):
+        rate = rate_iniziale
+        if self.path_stato:
+            try:
+                with open(self.path_stato, "r", encoding="utf-8") as f:
+                    rate = float(json.load(f)["rate"])
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+        return min(self.rate_max, max(self.rate_min, rate))
+
+    def salva(self):
+        """A fine run: salva il ritmo raggiunto e libera la quota del budget per host."""
+        if not self.path_stato:
+            return
+        try:
+            os.remove(self._path_battito)
+        except OSError:
+            pass
+        try:
+            os.makedirs(os.path.dirname(self.path_stato), exist_ok=True)
+            tmp = self.path_stato + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"rate": self.rate, "aggiornato": datetime.now().isoformat(timespec="seconds")}, f)
+            os.replace(tmp, self.path_stato)
+        except OSError as e:
+            self.log(f"Ritmo [{self.nome}]: impossibile salvare lo stato ({e}).")
+
+    def _aggiorna_quota(self, adesso):
+        """Rinnova il proprio battito e ricalcola la quota (budget / processi attivi). Col lock preso."""
+        if self._path_battito is None or not self.budget_host:
+            return None
+        if self._ultimo_battito is not None and adesso - self._ultimo_battito < BATTITO_OGNI_SEC:
+            return None
+        self._ultimo_battito = adesso
+        try:
+            os.makedirs(DIR_ATTIVI, exist_ok=True)
+            with open(self._path_battito, "w", encoding="utf-8") as f:
+                json.dump({"nome": self.nome, "pid": os.getpid(), "rate": round(self.rate, 3)}, f)
+            limite = time.time() - BATTITO_SCADENZA_SEC
+            attivi = 0
+            for path in glob.glob(os.path.join(DIR_ATTIVI, "*.json")):
+                try:
+                    if os.path.getmtime(path) >= limite:
+                        attivi += 1
+                except OSError:
+                    pass
+        except OSError:
+            return None  # senza la cartella di stato resta l'ultima quota nota
+        quota = self.budget_host / max(1, attivi)
+        if quota == self._quota:
+            return None
+        self._quota = quota
+        return f"Ritmo [{self.nome}]: {attivi} processi attivi verso l'host, quota {quota:.2f} req/s"
+
+    def attendi(self):
+        """Blocca finché non è il turno della prossima richiesta secondo il ritmo corrente (entro la quota)."""
+        with self._lock:
+            adesso = time.monotonic()
+            messaggio = self._aggiorna_quota(adesso)
+            turno = max(adesso, self._prossimo, self._pausa_fino)
+            self._prossimo = turno + 1.0 / min(self.rate, self._quota)
+            self.contatori["richieste"] += 1
+        if messaggio:
+            self.log(messaggio)
+        if turno > adesso:
+            time.sleep(turno - adesso)
+
+    def esito(self, status=None, errore=False, retry_after=None):
+        """Comunica l'esito dell'ultima richiesta: status HTTP (se noto) o errore=True per timeout/eccezioni."""
+        da_rallentare = errore or status in STATUS_DA_RALLENTARE or (status is not None and status >= 500)
+        RISPOSTE.inc(limiter=self.nome, status="errore" if errore else status or "ok")
+        attesa = secondi_retry_after(retry_after)
+        messaggio = None
+        with self._lock:
+            adesso = time.monotonic()
+            if attesa:
+                self._pausa_fino = max(self._pausa_fino, adesso + attesa)
+            if da_rallentare:
+                self.contatori["errori" if errore else "rallentamenti"] += 1
+                if adesso - self._ultimo_taglio >= self.finestra_taglio:
+                    self._ultimo_taglio = adesso
+                    precedente = self.rate
+                    self.rate = max(self.rate_min, self.rate * self.riduzione)
+                    causa = "errore/timeout" if errore else f"HTTP {status}"
+                    extra = f", pausa {attesa:.0f}s (Retry-After)" if attesa else ""
+                    messaggio = f"Ritmo [{self.nome}]: {precedente:.2f} -> {self.rate:.2f} req/s ({causa}{extra})"
+            else:
+                self.contatori["ok"] += 1
+                self.rate = min(self.rate_max, self.rate + self.incremento)
+                if self.log_ogni and self.contatori["ok"] % self.log_ogni == 0:
+                    messaggio = f"Ritmo [{self.nome}]: {self.rate:.2f} req/s dopo {self.contatori['richieste']} richieste"
+        if messaggio:
+            self.log(messaggio)
+
+    def riepilogo(self):
+        c = self.contatori
+        return (f"Ritmo [{self.nome}]: finale {self.rate:.2f} req/s (quota host {self._quota:.2f}) | "
+                f"richieste={c['richieste']} ok={c['ok']} rallentamenti={c['rallentamenti']} errori={c['errori']}")
+
+
+def get_con_ritmo(sessione, url, limiter=None, **kwargs):
+    """sessione.get() scandita dal limiter, con esito (status, Retry-After, eccezioni) riportato al limiter."""
+    if limiter is None:
+        return sessione.get(url, **kwargs)
+    limiter.attendi()
+    try:
+        response = sessione.get(url, **kwargs)
+    except Exception:
+        limiter.esito(errore=True)
+        raise
+    limiter.esito(response.status_code, retry_after=response.headers.get("Retry-After"))
+    return response
@@ -0,0 +1,221 @@
+# storico_run.py
+"""
+Storico dei run (SQLite in Screperino/Log/storico_run.sqlite3), scritto dall'orchestratore.
+
+Tabella `run`, una riga per job:
+  job        'A', 'B', 'EOD' o il nome dello stadio EOD ('pulisci_giornaliera', ...)
+  giorno     data processata (solo EOD e stadi EOD)
+  inizio/fine, secondi, rc
+  esito      'ok' | 'errore' | 'lock' (B saltato per lock) | 'riusato' (stadio memoizzato) | 'in_corso'
+  note       es. 'inattività' se terminato dal watchdog
+  righe_in, righe_out, richieste   (dal riepilogo scritto dallo script, se presente)
+
+Gli script figli non scrivono nel DB: a fine run salvano un piccolo riepilogo JSON
+(Stato/riepilogo_<job>[_<giorno>].json, vedi salva_riepilogo) che l'orchestratore raccoglie e registra.
+Così la registrazione funziona uguale con sottoprocessi e worker residenti.
+
+read_last_b / read_last_eod di main2_screperino leggono da qui (con i file di testo come riserva).
+
+Report:
+  python storico_run.py report [--giorni 14]      p50/p95/max per job negli ultimi N giorni
+  python storico_run.py ultimi [--n 20] [--job A] ultimi run
+"""
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+from config import STORICO_RUN_DB, SCREPERINO_STATO
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS run (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    job       TEXT NOT NULL,
+    giorno    TEXT,
+    inizio    TEXT NOT NULL,
+    fine      TEXT,
+    secondi   REAL,
+    rc        INTEGER,
+    esito     TEXT NOT NULL DEFAULT 'in_corso',
+    righe_in  INTEGER,
+    righe_out INTEGER,
+    richieste INTEGER,
+    note      TEXT
+);
+CREATE INDEX IF NOT EXISTS run_job_inizio ON run (job, inizio);
+"""
+
+ESITI_OK = ("ok", "riusato")
+
+
+# ----- lato script: riepilogo del run -----
+def _path_riepilogo(job, giorno=None):
+    # il giorno nel nome: il backfill esegue lo stesso stadio per più date in parallelo
+    suffisso = f"_{giorno.isoformat()}" if giorno else ""
+    return os.path.join(SCREPERINO_STATO, f"riepilogo_{job}{suffisso}.json")
+
+
+def salva_riepilogo(job, giorno=None, righe_in=None, righe_out=None, richieste=None):
+    """Chiamata dagli script a fine run: conteggi che l'orchestratore registrerà nello storico."""
+    dati = {"righe_in": righe_in, "righe_out": righe_out, "richieste": richieste, "scritto": time.time()}
+    path = _path_riepilogo(job, giorno)
+    try:
+        os.makedirs(SCREPERINO_STATO, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dati, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass  # lo storico è accessorio: mai far fallire lo script per questo
+
+
+def leggi_riepilogo(job, giorno=None, dal=None):
+    """Riepilogo scritto da `job` dopo l'istante `dal` (epoch), poi rimosso. None se assente o vecchio."""
+    path = _path_riepilogo(job, giorno)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            dati = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if dal is not None and dati.get("scritto", 0) < dal:
+        return None
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    return dati
+
+
+# ----- lato orchestratore: DB -----
+class StoricoRun:
+    def __init__(self, path=STORICO_RUN_DB):
+        self.path = str(path)
+        conn = self._conn()
+        try:
+            with conn:
+                conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _conn(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _esegui(self, sql, parametri=()):
+        conn = self._conn()
+        try:
+            with conn:
+                return conn.execute(sql, parametri).lastrowid
+        finally:
+            conn.close()
+
+    def _righe(self, sql, parametri=()):
+        conn = self._conn()
+        try:
+            return conn.execute(sql, parametri).fetchall()
+        finally:
+            conn.close()
+
+    def inizia(self, job, giorno=None):
+        """Registra l'avvio di un job e ritorna l'id della riga."""
+        return self._esegui(
+            "INSERT INTO run (job, giorno, inizio) VALUES (?, ?, ?)",
+            (job, giorno.isoformat() if giorno else None, datetime.now().isoformat(timespec="milliseconds")),
+        )
+
+    def termina(self, run_id, rc, esito, righe_in=None, righe_out=None, richieste=None, note=None):
+        fine = datetime.now()
+        riga = self._righe("SELECT inizio FROM run WHERE id = ?", (run_id,))
+        secondi = (fine - datetime.fromisoformat(riga[0]["inizio"])).total_seconds() if riga else None
+        self._esegui(
+            "UPDATE run SET fine = ?, secondi = ?, rc = ?, esito = ?, righe_in = ?, righe_out = ?, "
+            "richieste = ?, note = ? WHERE id = ?",
+            (fine.isoformat(timespec="milliseconds"), secondi, rc, esito, righe_in, righe_out, richieste, note, run_id),
+        )
+
+    def ultima_fine(self, job, esiti=("ok",)):
+        """Istante di fine dell'ultimo run riuscito di `job` (datetime) o None."""
+        segnaposto = ",".join("?" * len(esiti))
+        righe = self._righe(
+            f"SELECT MAX(fine) AS fine FROM run WHERE job = ? AND esito IN ({segnaposto})", (job, *esiti))
+        return datetime.fromisoformat(righe[0]["fine"]) if righe and righe[0]["fine"] else None
+
+    def ultimo_giorno(self, job, esiti=("ok",)):
+        """Giorno più recente processato con successo da `job` (date) o None."""
+        segnaposto = ",".join("?" * len(esiti))
+        righe = self._righe(
+            f"SELECT MAX(giorno) AS giorno FROM run WHERE job = ? AND esito IN ({segnaposto})", (job, *esiti))
+        return datetime.fromisoformat(righe[0]["giorno"]).date() if righe and righe[0]["giorno"] else None
+
+    def durate(self, giorni):
+        """{job: [(secondi, esito, righe_out, richieste)]} dei run conclusi negli ultimi `giorni`."""
+        dal = (datetime.now() - timedelta(days=giorni)).isoformat(timespec="milliseconds")
+        per_job = {}
+        for r in self._righe(
+                "SELECT job, secondi, esito, righe_out, richieste FROM run "
+                "WHERE inizio >= ? AND secondi IS NOT NULL ORDER BY inizio", (dal,)):
+            per_job.setdefault(r["job"], []).append((r["secondi"], r["esito"], r["righe_out"], r["richieste"]))
+        return per_job
+
+    def ultimi(self, n=20, job=None):
+        if job:
+            return self._righe("SELECT * FROM run WHERE job = ? ORDER BY id DESC LIMIT ?", (job, n))
+        return self._righe("SELECT * FROM run ORDER BY id DESC LIMIT ?", (n,))
+
+
+def percentile(valori, p):
+    """Percentile nearest-rank (p tra 0 e 100) di una lista non vuota."""
+    ordinati = sorted(valori)
+    indice = max(0, min(len(ordinati) - 1, math.ceil(p / 100 * len(ordinati)) - 1))
+    return ordinati[indice]
+
+
+def _report(storico, giorni):
+    per_job = storico.durate(giorni)
+    if not per_job:
+        print(f"Nessun run concluso negli ultimi {giorni} giorni.")
+        return
+    print(f"Ultimi {giorni} giorni (durate dei run eseguiti, esclusi i riusati)")
+    print(f"{'job':<22}{'run':>6}{'ok':>6}{'p50 s':>10}{'p95 s':>10}{'max s':>10}{'righe out p50':>15}{'richieste p50':>15}")
+    for job in sorted(per_job):
+        run = per_job[job]
+        eseguiti = [r for r in run if r[1] != "riusato"] or run
+        secondi = [r[0] for r in eseguiti]
+        righe = [r[2] for r in eseguiti if r[2] is not None]
+        richieste = [r[3] for r in eseguiti if r[3] is not None]
+        ok = sum(1 for r in run if r[1] in ESITI_OK)
+        print(f"{job:<22}{len(run):>6}{ok:>6}{percentile(secondi, 50):>10.1f}{percentile(secondi, 95):>10.1f}"
+              f"{max(secondi):>10.1f}{(percentile(righe, 50) if righe else '-'):>15}"
+              f"{(percentile(richieste, 50) if richieste else '-'):>15}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Storico dei run dell'orchestratore.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_report = sub.add_parser("report", help="p50/p95 delle durate per job")
+    p_report.add_argument("--giorni", type=int, default=14)
+    p_ultimi = sub.add_parser("ultimi", help="ultimi run registrati")
+    p_ultimi.add_argument("--n", type=int, default=20)
+    p_ultimi.add_argument("--job", default=None)
+    args = parser.parse_args(argv)
+
+    storico = StoricoRun()
+    if args.comando == "report":
+        _report(storico, args.giorni)
+    else:
+        for r in storico.ultimi(args.n, args.job):
+            durata = f"{r['secondi']:.1f}s" if r["secondi"] is not None else "-"
+            print(f"{r['id']:>6} {r['inizio']} {r['job']:<20} {r['giorno'] or '':<10} {r['esito']:<9} "
+                  f"rc={r['rc']} {durata} in={r['righe_in']} out={r['righe_out']} req={r['richieste']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# stream_runner.py
+"""
+Esecuzione di un processo figlio con output in streaming, condivisa da main2_screperino e gestore2.
+
+- Ogni riga di stdout/stderr viene loggata appena arriva, con un prefisso ("[B] ...").
+- Memoria limitata: del figlio si conservano solo le ultime `coda_righe` righe (per i messaggi
+  di errore), non tutto l'output come con subprocess.run(capture_output=True).
+- Watchdog di inattività: se il figlio non scrive nulla per `inattivita_sec` secondi viene
+  terminato insieme ai suoi discendenti (Chrome, chromedriver, script lanciati da gestore2).
+- I figli Python girano unbuffered (PYTHONUNBUFFERED=1), altrimenti le righe arriverebbero a blocchi.
+"""
+
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+
+CODA_RIGHE = 200
+MAX_CARATTERI_RIGA = 4000
+RC_INATTIVITA = -9
+
+
+class EsitoStreaming:
+    def __init__(self, rc, coda, righe, inattivo, secondi):
+        self.returncode = rc
+        self.coda = coda          # ultime righe (stdout+stderr) nell'ordine di arrivo
+        self.righe = righe        # righe totali lette
+        self.inattivo = inattivo  # True se terminato dal watchdog
+        self.secondi = secondi
+
+    @property
+    def testo_coda(self):
+        return "\n".join(self.coda)
+
+
+def _termina_albero(p, attesa=10):
+    """Termina il figlio e i suoi discendenti (Windows: taskkill /T, POSIX: process group)."""
+    try:
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(p.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(p.pid, signal.SIGTERM)
+            try:
+                p.wait(attesa)
+            except subprocess.TimeoutExpired:
+                os.killpg(p.pid, signal.SIGKILL)
+    except (OSError, ProcessLookupError):
+        pass
+    try:
+        p.kill()
+    except OSError:
+        pass
+
+
+def esegui_streaming(cmd, cwd, logger=None, prefisso="", inattivita_sec=None, unisci_stderr=False,
+                     livello_stdout=logging.INFO, livello_stderr=logging.ERROR, coda_righe=CODA_RIGHE, env=None):
+    """
+    Esegue `cmd` loggando ogni riga con `prefisso`. Ritorna un EsitoStreaming (non solleva su rc != 0).
+    unisci_stderr=True: stderr confluisce in stdout (una sola sequenza, livello_stdout).
+    """
+    logger = logger or logging.getLogger()
+    etichetta = f"[{prefisso}] " if prefisso else ""
+    env = {**(env or os.environ), "PYTHONUNBUFFERED": "1"}
+    avvio = time.monotonic()
+    coda = deque(maxlen=coda_righe)
+    stato = {"ultima": time.monotonic(), "righe": 0}
+    lock = threading.Lock()
+
+    # POSIX: sessione propria per poter terminare l'intero gruppo; su Windows basta taskkill /T
+    # (e il figlio resta nel gruppo della console, quindi riceve Ctrl+C come prima)
+    opzioni = {} if os.name == "nt" else {"start_new_session": True}
+    p = subprocess.Popen(
+        cmd, cwd=cwd, env=env, text=True, encoding="utf-8", errors="replace", bufsize=1,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT if unisci_stderr else subprocess.PIPE, **opzioni,
+    )
+
+    def leggi(flusso, livello):
+        for linea in flusso:
+            linea = linea.rstrip("\r\n")
+            if len(linea) > MAX_CARATTERI_RIGA:
+                linea = linea[:MAX_CARATTERI_RIGA] + " [...]"
+            with lock:
+                stato["ultima"] = time.monotonic()
+                stato["righe"] += 1
+                coda.append(linea)
+            if linea:
+                logger.log(livello, f"{etichetta}{linea}")
+        flusso.close()
+
+    lettori = [threading.Thread(target=leggi, args=(p.stdout, livello_stdout), daemon=True)]
+    if not unisci_stderr:
+        lettori.append(threading.Thread(target=leggi, args=(p.stderr, livello_stderr), daemon=True))
+    for t in lettori:
+        t.start()
+
+    inattivo = False
+    while True:
+        try:
+            p.wait(timeout=1)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        if inattivita_sec:
+            with lock:
+                silenzio = time.monotonic() - stato["ultima"]
+            if silenzio > inattivita_sec:
+                logger.error(f"{etichetta}Nessun output da {int(silenzio)}s (limite {inattivita_sec}s): termino il processo.")
+                _termina_albero(p)
+                inattivo = True
+                break
+
+    rc = p.wait()
+    for t in lettori:
+        t.join(10)
+    if inattivo:
+        rc = RC_INATTIVITA
+    return EsitoStreaming(rc, list(coda), stato["righe"], inattivo, time.monotonic() - avvio)
@@ -0,0 +1,103 @@
+# tests/test_metriche.py
+"""
+Scrape locale dell'endpoint /metrics di metriche.py: file .prom scritti da più thread,
+server avviato su una porta effimera, esposizione unita controllata riga per riga.
+
+Uso:  python -m pytest -q tests   (oppure python -m unittest discover tests)
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import metriche
+from metriche import PREFISSO, TIPO_CONTENUTO, Registro, avvia_server
+
+
+class TestEndpointMetriche(unittest.TestCase):
+    def setUp(self):
+        self._cartella = tempfile.TemporaryDirectory()
+        self.cartella = self._cartella.name
+        self._attive = metriche.METRICHE_ATTIVE
+        metriche.METRICHE_ATTIVE = True
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        metriche.METRICHE_ATTIVE = self._attive
+        self._cartella.cleanup()
+
+    def _scrape(self, percorso="/metrics"):
+        host, porta = self.server.server_address[:2]
+        with urllib.request.urlopen(f"http://{host}:{porta}{percorso}", timeout=5) as risposta:
+            return risposta.headers.get("Content-Type"), risposta.read().decode("utf-8")
+
+    def test_scrape_unisce_i_processi(self):
+        for processo, richieste in (("estrazione_giornaliera", 3), ("screp", 5)):
+            registro = Registro()
+            contatore = registro.contatore("http_risposte_totale", "Esiti delle richieste", ["status"])
+            contatore.inc(richieste, status=200)
+            istogramma = registro.istogramma("fetch_secondi", "Latenza per MMSI", ["funzione"], bucket=(1, 5))
+            istogramma.osserva(0.5, funzione="f")
+            istogramma.osserva(2, funzione="f")
+            self.assertIsNotNone(registro.scrivi(processo, cartella=self.cartella))
+
+        self.server = avvia_server(0, cartella=self.cartella)
+        tipo, corpo = self._scrape()
+        righe = corpo.splitlines()
+
+        self.assertEqual(tipo, TIPO_CONTENUTO)
+        # una sola HELP/TYPE per famiglia anche se la metrica compare in due file
+        self.assertEqual(righe.count(f"# TYPE {PREFISSO}http_risposte_totale counter"), 1)
+        self.assertEqual(righe.count(f"# TYPE {PREFISSO}fetch_secondi histogram"), 1)
+        self.assertIn(f'{PREFISSO}http_risposte_totale{{processo="estrazione_giornaliera",status="200"}} 3', righe)
+        self.assertIn(f'{PREFISSO}http_risposte_totale{{processo="screp",status="200"}} 5', righe)
+        self.assertIn(f'{PREFISSO}fetch_secondi_bucket{{processo="screp",funzione="f",le="1"}} 1', righe)
+        self.assertIn(f'{PREFISSO}fetch_secondi_bucket{{processo="screp",funzione="f",le="+Inf"}} 2', righe)
+        self.assertIn(f'{PREFISSO}fetch_secondi_count{{processo="screp",funzione="f"}} 2', righe)
+        # ogni riga non di commento è "nome{etichette} valore"
+        for riga in righe:
+            if riga and not riga.startswith("#"):
+                self.assertRegex(riga, r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[^}]*\})? \S+$')
+
+    def test_percorso_sconosciuto(self):
+        self.server = avvia_server(0, cartella=self.cartella)
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            self._scrape("/altro")
+        self.assertEqual(ctx.exception.code, 404)
+
+    def test_scrittura_concorrente_dallo_stesso_processo(self):
+        registro = Registro()
+        contatore = registro.contatore("job_richieste_totale", "Richieste HTTP fatte dai job", ["lavoro"])
+        errori = []
+
+        def scrivi(job):
+            for _ in range(50):
+                contatore.inc(lavoro=job)
+                if registro.scrivi("orchestratore", cartella=self.cartella) is None:
+                    errori.append(job)
+
+        threads = [threading.Thread(target=scrivi, args=(job,)) for job in ("A", "B", "EOD", "backfill")]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errori, [])
+        self.assertEqual([n for n in os.listdir(self.cartella) if n.endswith(".tmp")], [])
+        self.server = avvia_server(0, cartella=self.cartella)
+        _, corpo = self._scrape()
+        for job in ("A", "B", "EOD", "backfill"):
+            self.assertIn(f'{PREFISSO}job_richieste_totale{{processo="orchestratore",lavoro="{job}"}} 50', corpo)
+
+
+if __name__ == "__main__":
+    unittest.main()